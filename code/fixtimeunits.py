@@ -2,46 +2,102 @@
 Herramienta de linea de comandos para convertir archivos netcdf con unidades
 de tiempo "days since 0001-01-01 00:00:00" a "seconds since 1970-01-01 00:00:00"
 
+Los archivos que genera gfsDownload ya se escriben con "seconds since 1970-01-01 00:00:00",
+esta herramienta corrige los archivos descargados antes de ese cambio. Recibe archivos o
+directorios (se recorren completos buscando archivos .nc), los corrige en su lugar en paralelo
+y no modifica los que ya estan corregidos.
+
 Uso:
 
  > python fixtimeunits.py out/20220528/crudosGFS_0P25_2022-05-28_00z.nc
 
+ # Todo el archivo historico con 8 procesos
+ > python fixtimeunits.py out --workers 8
+
 '''
 
+import os
 import sys
+import argparse
 import netCDF4 as nc
-import datetime as dt
+from concurrent.futures import ProcessPoolExecutor
+import gfsDownload as gD
 
 def fixtimeunits(ncFile):
   '''
   Los datos descargados de GFS, vienen con la variable de tiempo con unidades "days since 0001-01-01 00:00:00"
-  que es una unidad no valida en el calendario gregoriano. Por lo tanto esta funcion corrige este detalle
-  y cambia las unidades a "seconds since 1970-01-01 00:00:00", y tambien los valores.
+  que es una unidad no valida en el calendario gregoriano, y con un dia de desfase. Esta funcion corrige en su
+  lugar la variable time del archivo: cambia las unidades a "seconds since 1970-01-01 00:00:00" y convierte
+  los valores con aritmetica vectorizada (gfsData.getTimeSeconds).
+  Regresa True si se corrigio el archivo, False si ya estaba corregido.
   '''
-
   dst = nc.Dataset(ncFile,'a')
-  if dst.variables['time'].units == 'seconds since 1970-01-01 00:00:00':
+  try:
+    time = dst.variables['time']
+    if time.units.strip() == gD.gfsData.timeUnits:
+      return False
+    time[:] = gD.gfsData.getTimeSeconds(time[:], time.units)
+    # Update units
+    time.units = gD.gfsData.timeUnits
+    time.time_origin = '1970-01-01 00:00:00'
+    time.calendar = 'gregorian'
+    return True
+  finally:
     dst.close()
-    return
-  else:
-    timedts = nc.num2date(dst.variables['time'][:], 'days since 0001-01-01 00:00:00', calendar='gregorian')
-    # fix 1 day offset
-    timedts = [ tdt - dt.timedelta(days=1) for tdt in timedts ]
-    newnumdates = nc.date2num(timedts, 'seconds since 1970-01-01 00:00:00', calendar='gregorian')
-    # Update units and values
-    dst.variables['time'][:] = newnumdates
-    dst.variables['time'].units = 'seconds since 1970-01-01 00:00:00'
-    dst.variables['time'].calendar = 'gregorian'
-    dst.close()
-    print ('Updated time values and units, to "seconds since 1970-01-01 00:00:00" ')
-    print ('Times: ' + str(timedts))
 
+def fixFile(ncFile):
+  '''
+  fixtimeunits en un proceso del pool, regresa (ncFile, corregido, error).
+  '''
+  try:
+    return ncFile, fixtimeunits(ncFile), None
+  except Exception as e:
+    return ncFile, False, str(e)
+
+def findFiles(paths):
+  '''
+  Regresa una <python list> con los archivos .nc de paths, los directorios se recorren completos.
+  '''
+  files = []
+  for path in paths:
+    if os.path.isdir(path):
+      for root, dirs, names in os.walk(path):
+        dirs.sort()
+        files.extend([ os.path.join(root, n) for n in sorted(names) if n.endswith('.nc') ])
+    else:
+      files.append(path)
+  return files
 
 
-if __name__ == "__main__":
-  if len(sys.argv) > 1:
-    ncFile = sys.argv[1]
+def main():
+  parser = argparse.ArgumentParser(description='Corrige las unidades de tiempo de archivos netcdf a "seconds since 1970-01-01 00:00:00".')
+  parser.add_argument('paths', nargs='+', help='Archivos .nc o directorios a corregir')
+  parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Archivos que se corrigen al mismo tiempo')
+  args = parser.parse_args()
+
+  files = findFiles(args.paths)
+  nworkers = max(1, min(args.workers or 1, len(files)))
+  fixed = skipped = failed = 0
+  # netCDF-C no es thread-safe, cada archivo se corrige en un proceso
+  if nworkers == 1:
+    results = map(fixFile, files)
   else:
-    print('Incluya el nombre del archivo a arreglar')
+    pool = ProcessPoolExecutor(max_workers=nworkers)
+    results = pool.map(fixFile, files)
+  for ncFile, done, error in results:
+    if error is not None:
+      failed = failed + 1
+      print('Error en ' + ncFile + ': ' + error)
+    elif done:
+      fixed = fixed + 1
+      print('Corregido: ' + ncFile)
+    else:
+      skipped = skipped + 1
+  if nworkers > 1:
+    pool.shutdown()
+  print(str(fixed) + ' archivos corregidos, ' + str(skipped) + ' ya estaban corregidos, ' + str(failed) + ' con error')
+  return 1 if failed > 0 else 0
+
 
-  fixtimeunits(ncFile)
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,597 @@
+"""
+ Benchmark de la descarga de GFS y FNL sin acceso a NOMADS.
+
+ Crea datasets sinteticos (archivos netcdf) con las dimensiones y nombres de variables de los datasets fnl, gfs_0p25
+ y gfs_0p50 de NOMADS, y los sirve con un servidor OPeNDAP (DAP2) local con latencia y tasa de fallas configurables.
+ Los destinos *_grib usan el motor GRIB2 (engine = grib): el mismo servidor sirve archivos GRIB2 sinteticos con su
+ inventario .idx y solicitudes HTTP Range (requiere eccodes).
+ La url del archivo de configuracion (gfsName.getrootURL) apunta a este servidor, y se mide de principio a fin
+ downloadFNL y downloadGFS: tiempo total, numero de solicitudes, bytes y memoria maxima (RSS).
+ Los resultados se agregan como una linea JSON por corrida (con el commit de git) para comparar entre commits.
+
+ Clases:
+  syntheticDatasets : Crea los archivos netcdf sinteticos de los datasets.
+  dapServer         : Servidor OPeNDAP (DAP2) minimo para los archivos netcdf de un directorio, con latencia y fallas.
+                      Los demas archivos se sirven tal cual, con soporte de HTTP Range.
+
+ Uso:
+
+  > python gfsBenchmark.py
+  > python gfsBenchmark.py --latency 0.05 --failrate 0.02 --targets fnl gfs_0p25 --repeat 3
+  > python gfsBenchmark.py --targets gfs_0p25 gfs_0p25_grib --set grib.fhours=0,48,3
+
+  # Se pueden cambiar llaves del archivo de configuracion para la corrida:
+  > python gfsBenchmark.py --set workers=1 --set tblock=1
+
+"""
+
+import os, sys
+import re
+import json
+import time
+import random
+import shutil
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+import logging as log
+import datetime as dt
+import numpy as np
+import netCDF4 as nc
+from configparser import ConfigParser
+from urllib.parse import unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+try:
+    import eccodes
+except ImportError:
+    eccodes = None
+
+
+# Dimensiones de los datasets de NOMADS: tipo de dataset -> (directorio, prefijo del dataset, resolucion, pasos de tiempo,
+# horas entre pasos de tiempo). Los niveles de presion (lev) son los de gfs_0p25.
+DATASETS = {
+    'fnl'      : ('fnl/fnl', 'fnlflx', 1.0, 1, 6),
+    'gfs_0p25' : ('gfs_0p25/gfs', 'gfs_0p25', 0.25, 129, 3),
+    'gfs_0p50' : ('gfs_0p50/gfs', 'gfs_0p50', 0.5, 129, 3),
+}
+LEVELS = [1000, 975, 950, 925, 900, 850, 800, 750, 700, 650, 600, 550, 500, 450, 400, 350, 300, 250, 200, 150,
+          100, 70, 50, 40, 30, 20, 15, 10, 7, 5, 3, 2, 1, 0.7, 0.4, 0.2, 0.1, 0.07, 0.04, 0.02, 0.01]
+FILLVALUE = 9.999e+20
+# Registros de otras variables que se intercalan en los archivos GRIB2 sinteticos, para que el inventario no sea solo
+# de las variables configuradas
+GRIBFILLER = ['PRMSL:mean sea level', 'HGT:500 mb', 'TMP:850 mb']
+
+
+class syntheticDatasets():
+        """
+         Clase syntheticDatasets
+         Crea los archivos netcdf sinteticos en root, con la misma estructura de directorios que las url de gfsName.getURLName
+         (root/dods/<dataset><fecha>/<nombre>_<HH>z). Las variables tienen las dimensiones completas del dataset, pero solo
+         se escriben los datos de la region (con un margen), el resto de los chunks no se escriben y quedan con _FillValue,
+         asi los archivos son pequenos.
+        """
+
+        def __init__(self,root,lVars,region,margin=2.0):
+            self.root = root
+            self.lVars = lVars
+            self.region = region
+            self.margin = margin
+
+        def getFileName(self,gfstype,date,run_time):
+            gfsdir, name, res, ntimes, hours = DATASETS[gfstype]
+            return os.path.join(self.root, 'dods', gfsdir + date.strftime('%Y%m%d'), name + ('_%02dz' % run_time))
+
+        @staticmethod
+        def getTimeValue(date):
+            """
+             Valor de tiempo de GrADS (days since 1-1-1 00:00:0.0) de la fecha date, con el dia de desfase de los datasets de NOMADS.
+            """
+            return nc.date2num(date + dt.timedelta(days=1), 'days since 0001-01-01 00:00:00', calendar='standard')
+
+        def create(self,gfstype,date,run_time):
+            """
+             Crea el dataset gfstype de la fecha date y run_time, si no existe. Regresa el nombre del archivo.
+            """
+            fileName = self.getFileName(gfstype, date, run_time)
+            if os.path.exists(fileName):
+                return fileName
+            gfsdir, name, res, ntimes, hours = DATASETS[gfstype]
+            lon = np.arange(0, 360, res)
+            lat = np.arange(-90, 90 + res/2, res)
+            lev = np.array(LEVELS, dtype='f8')
+            cycle = date + dt.timedelta(hours=run_time)
+            times = [ self.getTimeValue(cycle + dt.timedelta(hours=hours*k)) for k in range(ntimes) ]
+
+            lonmin, lonmax, latmin, latmax = self.region
+            i = np.where((lon >= lonmin - self.margin) & (lon <= lonmax + self.margin))[0]
+            j = np.where((lat >= latmin - self.margin) & (lat <= latmax + self.margin))[0]
+            i0, i1, j0, j1 = i.min(), i.max() + 1, j.min(), j.max() + 1
+
+            if not os.path.exists(os.path.dirname(fileName)):
+                os.makedirs(os.path.dirname(fileName))
+            dst = nc.Dataset(fileName + '.tmp', 'w', format='NETCDF4')
+            dst.title = 'Dataset sintetico ' + gfstype + ' ' + cycle.strftime('%Y-%m-%d %Hz')
+            dst.createDimension('time', ntimes)
+            dst.createDimension('lev', lev.size)
+            dst.createDimension('lat', lat.size)
+            dst.createDimension('lon', lon.size)
+            for vn, data, units in (('time', times, 'days since 1-1-1 00:00:0.0'), ('lev', lev, 'millibar'),
+                                    ('lat', lat, 'degrees_north'), ('lon', lon, 'degrees_east')):
+                v = dst.createVariable(vn, 'f8', (vn,))
+                v.units = units
+                v[:] = data
+            tt = np.arange(ntimes, dtype='f4')[:, None, None]
+            jj = lat[j0:j1].astype('f4')[None, :, None]
+            ii = lon[i0:i1].astype('f4')[None, None, :]
+            for k, vn in enumerate(self.lVars):
+                # Las variables *prs son 4D (time, lev, lat, lon)
+                levels = vn.endswith('prs')
+                dims = ('time', 'lev', 'lat', 'lon') if levels else ('time', 'lat', 'lon')
+                chunks = (1, 1, 64, 64) if levels else (1, 64, 64)
+                v = dst.createVariable(vn, 'f4', dims, fill_value=FILLVALUE, chunksizes=chunks, zlib=True, complevel=1)
+                v.long_name = vn
+                data = k * 100.0 + tt + jj / 10.0 + ii / 1000.0
+                if levels:
+                    v[:, :, j0:j1, i0:i1] = data[:, None, :, :] + lev.astype('f4')[None, :, None, None] / 1e4
+                else:
+                    v[:, j0:j1, i0:i1] = data
+            dst.close()
+            os.replace(fileName + '.tmp', fileName)
+            return fileName
+
+        def createGrib(self,gfstype,fileName,date,run_time,hour,tindex,recordKeys):
+            """
+             Crea el archivo GRIB2 sintetico fileName (y su inventario fileName.idx) de la hora de pronostico hour, si no existe.
+             Los valores de cada variable son los mismos que los del dataset netcdf sintetico en el paso de tiempo tindex,
+             fuera de la region los puntos quedan como faltantes (bitmap). recordKeys es el registro (PARAMETRO:nivel) de
+             cada variable. Las latitudes van de norte a sur, como en los archivos de NCEP.
+            """
+            if os.path.exists(fileName):
+                return fileName
+            gfsdir, name, res, ntimes, hours = DATASETS[gfstype]
+            lon = np.arange(0, 360, res)
+            lat = np.arange(90, -90 - res/2, -res)
+            lonmin, lonmax, latmin, latmax = self.region
+            i = np.where((lon >= lonmin - self.margin) & (lon <= lonmax + self.margin))[0]
+            j = np.where((lat >= latmin - self.margin) & (lat <= latmax + self.margin))[0]
+            i0, i1, j0, j1 = i.min(), i.max() + 1, j.min(), j.max() + 1
+            missing = 9999.0
+
+            records = []
+            for k, vn in enumerate(self.lVars):
+                records.append((recordKeys[vn], k * 100.0 + tindex + lat[j0:j1, None] / 10.0 + lon[None, i0:i1] / 1000.0))
+                if k < len(GRIBFILLER):
+                    records.append((GRIBFILLER[k], np.full((j1-j0, i1-i0), 1000.0 + k)))
+            if not os.path.exists(os.path.dirname(fileName)):
+                os.makedirs(os.path.dirname(fileName))
+            stamp = (date + dt.timedelta(hours=run_time)).strftime('%Y%m%d%H')
+            ftype = 'anl' if hour == 0 else str(hour) + ' hour fcst'
+            index = []
+            with open(fileName + '.tmp', 'wb') as f:
+                for n, (key, data) in enumerate(records):
+                    gid = eccodes.codes_grib_new_from_samples('GRIB2')
+                    try:
+                        for k, v in (('gridType', 'regular_ll'), ('Ni', lon.size), ('Nj', lat.size),
+                                     ('latitudeOfFirstGridPointInDegrees', 90.0), ('longitudeOfFirstGridPointInDegrees', 0.0),
+                                     ('latitudeOfLastGridPointInDegrees', -90.0), ('longitudeOfLastGridPointInDegrees', float(lon[-1])),
+                                     ('iDirectionIncrementInDegrees', res), ('jDirectionIncrementInDegrees', res),
+                                     ('jScansPositively', 0), ('bitmapPresent', 1), ('missingValue', missing), ('bitsPerValue', 24)):
+                            eccodes.codes_set(gid, k, v)
+                        values = np.full((lat.size, lon.size), missing)
+                        values[j0:j1, i0:i1] = data
+                        eccodes.codes_set_values(gid, values.ravel())
+                        index.append('%d:%d:d=%s:%s:%s:' % (n + 1, f.tell(), stamp, key, ftype))
+                        f.write(eccodes.codes_get_message(gid))
+                    finally:
+                        eccodes.codes_release(gid)
+            with open(fileName + '.idx', 'w') as f:
+                f.write('\n'.join(index) + '\n')
+            os.replace(fileName + '.tmp', fileName)
+            return fileName
+
+
+
+class dapServer():
+        """
+         Clase dapServer
+         Servidor OPeNDAP (DAP2) minimo que sirve los archivos netcdf del directorio root: <url>/<archivo>.dds, .das y
+         .dods?<restricciones>, suficiente para la libreria netCDF-C. Las variables con dimensiones se sirven como Grid
+         (igual que el servidor GrADS de NOMADS) y las coordenadas como arreglos.
+         Cada solicitud espera latency segundos, y las solicitudes de datos (.dods) fallan con probabilidad failrate.
+         Lleva la cuenta de solicitudes, fallas y bytes enviados.
+        """
+        TYPES = {'f4' : ('Float32', '>f4'), 'f8' : ('Float64', '>f8'), 'i4' : ('Int32', '>i4'), 'i2' : ('Int16', '>i2')}
+
+        def __init__(self,root,latency=0.0,failrate=0.0,seed=None,port=0):
+            self.root = root
+            self.latency = latency
+            self.failrate = failrate
+            self.random = random.Random(seed)
+            self.lock = threading.Lock()
+            self.counters = {'requests' : 0, 'data_requests' : 0, 'failures' : 0, 'bytes' : 0}
+            server = self
+
+            class handler(BaseHTTPRequestHandler):
+                protocol_version = 'HTTP/1.1'
+
+                def do_GET(self):
+                    server.handle(self)
+
+                def log_message(self, format, *args):
+                    log.debug('dapServer: ' + (format % args))
+
+            self.httpd = ThreadingHTTPServer(('127.0.0.1', port), handler)
+            self.httpd.daemon_threads = True
+            self.thread = None
+
+        def getURL(self):
+            return 'http://127.0.0.1:' + str(self.httpd.server_address[1])
+
+        def start(self):
+            self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+            self.thread.start()
+            return self.getURL()
+
+        def stop(self):
+            self.httpd.shutdown()
+            self.httpd.server_close()
+
+        def getCounters(self):
+            with self.lock:
+                return dict(self.counters)
+
+        def count(self,key,value=1):
+            with self.lock:
+                self.counters[key] = self.counters[key] + value
+
+        def handle(self,request):
+            path, _, query = request.path.partition('?')
+            path = unquote(path)
+            self.count('requests')
+            if self.latency > 0:
+                time.sleep(self.latency)
+            staticFile = os.path.normpath(os.path.join(self.root, path.lstrip('/')))
+            if staticFile.startswith(os.path.normpath(self.root)) and os.path.isfile(staticFile):
+                return self.handleStatic(request, staticFile)
+            base, ext = os.path.splitext(path)
+            fileName = os.path.normpath(os.path.join(self.root, base.lstrip('/')))
+            if ext not in ('.dds', '.das', '.dods') or not fileName.startswith(os.path.normpath(self.root)) \
+               or not os.path.isfile(fileName):
+                return self.send(request, 404, b'Error { code = 404; message = "No such dataset";};', 'text/plain')
+            if ext == '.dods':
+                self.count('data_requests')
+                with self.lock:
+                    fail = self.failrate > 0 and self.random.random() < self.failrate
+                if fail:
+                    self.count('failures')
+                    return self.send(request, 500, b'Error { code = 500; message = "Falla simulada";};', 'text/plain')
+            try:
+                # La libreria netCDF-C no es thread-safe, las lecturas de los archivos se hacen una a la vez
+                with self.lock:
+                    dst = nc.Dataset(fileName, 'r')
+                    try:
+                        if ext == '.dds':
+                            body = self.getDDS(dst, self.parseConstraint(dst, unquote(query))).encode()
+                        elif ext == '.das':
+                            body = self.getDAS(dst).encode()
+                        else:
+                            body = self.getData(dst, self.parseConstraint(dst, unquote(query)))
+                    finally:
+                        dst.close()
+            except Exception as e:
+                log.warning('dapServer: Error en la solicitud ' + request.path + ': ' + str(e))
+                return self.send(request, 400, ('Error { code = 400; message = "' + str(e) + '";};').encode(), 'text/plain')
+            self.send(request, 200, body, 'application/octet-stream' if ext == '.dods' else 'text/plain')
+
+        def handleStatic(self,request,fileName):
+            """
+             Sirve el archivo fileName tal cual (archivos GRIB2 y sus inventarios). Con el encabezado Range (un solo rango
+             bytes=inicio-fin) responde solo esos bytes (206), y esas solicitudes fallan con probabilidad failrate.
+            """
+            byteRange = request.headers.get('Range')
+            if byteRange is None:
+                with open(fileName, 'rb') as f:
+                    return self.send(request, 200, f.read(), 'application/octet-stream')
+            self.count('data_requests')
+            with self.lock:
+                fail = self.failrate > 0 and self.random.random() < self.failrate
+            if fail:
+                self.count('failures')
+                return self.send(request, 500, b'Falla simulada', 'text/plain')
+            m = re.match(r'bytes=(\d+)-(\d*)$', byteRange.strip())
+            size = os.path.getsize(fileName)
+            if m is None or int(m.group(1)) >= size:
+                return self.send(request, 416, b'', 'text/plain', {'Content-Range' : 'bytes */' + str(size)})
+            start = int(m.group(1))
+            end = min(int(m.group(2)), size - 1) if m.group(2) != '' else size - 1
+            with open(fileName, 'rb') as f:
+                f.seek(start)
+                body = f.read(end - start + 1)
+            self.send(request, 206, body, 'application/octet-stream', {'Content-Range' : 'bytes %d-%d/%d' % (start, end, size)})
+
+        def send(self,request,status,body,contentType,headers={}):
+            request.send_response(status)
+            request.send_header('Content-Type', contentType)
+            request.send_header('Content-Description', 'dods-data' if status == 200 else 'dods-error')
+            request.send_header('XDODS-Server', 'gfsBenchmark/1.0')
+            request.send_header('Content-Length', str(len(body)))
+            for k, v in headers.items():
+                request.send_header(k, v)
+            request.end_headers()
+            request.wfile.write(body)
+            self.count('bytes', len(body))
+
+        @staticmethod
+        def isGrid(var):
+            return len(var.dimensions) > 1 or (len(var.dimensions) == 1 and var.dimensions[0] != var.name)
+
+        def parseConstraint(self,dst,query):
+            """
+             Interpreta la lista de proyecciones de la restriccion (query), por ejemplo: ugrd10m.ugrd10m[0:1:0][5:1:10][0:1:3],lat
+             Regresa una lista de (variable, miembro, slices) donde miembro es None para la variable completa (Grid o arreglo),
+             o el nombre del arreglo o de un mapa del Grid.
+            """
+            projections = []
+            query = query.split('&')[0].strip()
+            items = [ q for q in query.split(',') if q != '' ] if query != '' else [ None ]
+            for item in items:
+                if item is None:
+                    for vn in dst.variables:
+                        projections.append((vn, None, None))
+                    continue
+                parts = re.findall(r'([^.\[\]]+)((?:\[[^\]]*\])*)', item)
+                vn = parts[0][0]
+                member = parts[1][0] if len(parts) > 1 else None
+                hyper = parts[-1][1]
+                if vn not in dst.variables or (member is not None and member != vn and member not in dst.variables[vn].dimensions):
+                    raise Exception('Variable ' + item + ' no existe')
+                dims = dst.variables[vn].dimensions if member in (None, vn) else (member,)
+                slices = []
+                for k, h in enumerate(re.findall(r'\[([^\]]*)\]', hyper)):
+                    n = [ int(x) for x in h.split(':') ]
+                    if len(n) == 1:
+                        slices.append(slice(n[0], n[0] + 1, 1))
+                    elif len(n) == 2:
+                        slices.append(slice(n[0], n[1] + 1, 1))
+                    else:
+                        slices.append(slice(n[0], n[2] + 1, n[1]))
+                while len(slices) < len(dims):
+                    slices.append(slice(0, dst.dimensions[dims[len(slices)]].size, 1))
+                projections.append((vn, member, slices))
+            return projections
+
+        def getDecl(self,dst,vn,slices,indent):
+            var = dst.variables[vn]
+            dims = var.dimensions
+            if slices is None:
+                slices = [ slice(0, dst.dimensions[d].size, 1) for d in dims ]
+            shape = ''.join([ '[%s = %d]' % (d, len(range(*s.indices(dst.dimensions[d].size)))) for d, s in zip(dims, slices) ])
+            return indent + self.TYPES[var.dtype.str[1:]][0] + ' ' + vn + shape + ';\n'
+
+        def getDDS(self,dst,projections):
+            """
+             Descripcion (DDS) de las variables projections del dataset.
+            """
+            name = os.path.basename(dst.filepath())
+            dds = 'Dataset {\n'
+            for vn, member, slices in projections:
+                var = dst.variables[vn]
+                if not self.isGrid(var):
+                    dds = dds + self.getDecl(dst, vn, slices, '    ')
+                elif member is None:
+                    dds = dds + '    Grid {\n     ARRAY:\n' + self.getDecl(dst, vn, slices, '        ') + '     MAPS:\n'
+                    for d, s in zip(var.dimensions, slices if slices is not None else [None]*len(var.dimensions)):
+                        dds = dds + self.getDecl(dst, d, None if s is None else [s], '        ')
+                    dds = dds + '    } ' + vn + ';\n'
+                else:
+                    dds = dds + '    Structure {\n' + self.getDecl(dst, member, slices, '        ') + '    } ' + vn + ';\n'
+            return dds + '} ' + name + ';\n'
+
+        def getDAS(self,dst):
+            """
+             Atributos (DAS) de las variables del dataset.
+            """
+            das = 'Attributes {\n'
+            for vn, var in dst.variables.items():
+                das = das + '    ' + vn + ' {\n'
+                for a in var.ncattrs():
+                    value = var.getncattr(a)
+                    if isinstance(value, str):
+                        das = das + '        String ' + a + ' "' + value + '";\n'
+                    else:
+                        value = np.atleast_1d(value)
+                        das = das + '        ' + self.TYPES[value.dtype.str[1:]][0] + ' ' + a + ' ' \
+                              + ', '.join([ repr(float(x)) for x in value ]) + ';\n'
+                das = das + '    }\n'
+            das = das + '    NC_GLOBAL {\n'
+            for a in dst.ncattrs():
+                das = das + '        String ' + a + ' "' + str(dst.getncattr(a)) + '";\n'
+            return das + '    }\n}\n'
+
+        def getArray(self,var,slices):
+            data = np.ma.filled(var[tuple(slices)], var._FillValue if hasattr(var, '_FillValue') else 0)
+            data = np.ascontiguousarray(data, dtype=self.TYPES[var.dtype.str[1:]][1])
+            n = np.array([data.size, data.size], dtype='>i4')
+            return n.tobytes() + data.tobytes()
+
+        def getData(self,dst,projections):
+            """
+             Respuesta .dods: DDS de las proyecciones y los datos en formato XDR.
+            """
+            body = [ self.getDDS(dst, projections).encode() + b'\nData:\n' ]
+            for vn, member, slices in projections:
+                var = dst.variables[vn]
+                if slices is None:
+                    slices = [ slice(0, dst.dimensions[d].size, 1) for d in var.dimensions ]
+                if not self.isGrid(var):
+                    body.append(self.getArray(var, slices))
+                elif member is None:
+                    body.append(self.getArray(var, slices))
+                    for d, s in zip(var.dimensions, slices):
+                        body.append(self.getArray(dst.variables[d], [s]))
+                elif member == vn:
+                    body.append(self.getArray(var, slices))
+                else:
+                    body.append(self.getArray(dst.variables[member], slices))
+            return b''.join(body)
+
+
+
+def getCommit():
+    """
+     Commit de git del codigo que se mide (con -dirty si hay cambios sin commit), 'unknown' si no es un repositorio git.
+    """
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return 'unknown'
+
+def writeConfig(configFile,workDir,url,overrides,engine='opendap'):
+    """
+     Escribe el archivo de configuracion de la corrida en workDir a partir de configFile: la url apunta al servidor
+     local, el cache de la submalla y los reportes quedan en workDir, y sin almacen local de FNL (cada corrida descarga
+     todos los ciclos). overrides es una lista de 'llave=valor' del grupo gfs_data, o 'grupo.llave=valor'.
+    """
+    config = ConfigParser()
+    config.read(configFile)
+    if not config.has_section('grib'):
+        config.add_section('grib')
+    config.set('gfs_data', 'url', url)
+    config.set('gfs_data', 'engine', engine)
+    config.set('grib', 'url', url + '/grib')
+    config.set('gfs_data', 'outdir', '')
+    config.set('gfs_data', 'cachedir', os.path.join(workDir, '.gfscache'))
+    config.set('gfs_data', 'fnlstore', '')
+    config.set('gfs_data', 'reportdir', os.path.join(workDir, 'reports'))
+    for o in overrides:
+        key, _, value = o.partition('=')
+        section, _, key = key.strip().rpartition('.')
+        config.set(section if section != '' else 'gfs_data', key, value.strip())
+    with open(os.path.join(workDir, 'gfsconfig.cfg'), 'w') as f:
+        config.write(f)
+    return config
+
+def runChild(target,date):
+    """
+     Corre la descarga target (fnl, gfs_0p25, gfs_0p50) en el directorio actual e imprime el resultado en JSON.
+     Se ejecuta en un proceso aparte para medir la memoria maxima de la descarga (proceso y workers).
+    """
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import gfsDownload as gD
+    log.basicConfig(filename='benchmark.log', level=log.INFO)
+    startTime = time.time()
+    myData = gD.gfsData()
+    if target == 'fnl':
+        output = myData.downloadFNL(date)
+    else:
+        output = myData.downloadGFS(target.replace('_grib', ''), date)
+    wallSeconds = time.time() - startTime
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    print(json.dumps({'output' : output if output else None, 'wall_seconds' : wallSeconds, 'peak_rss_mb' : rss / 1024.0}))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de downloadFNL y downloadGFS con un servidor OPeNDAP local.')
+    parser.add_argument('--targets', nargs='+', default=['fnl', 'gfs_0p25'],
+                        choices=sorted(DATASETS.keys()) + [ d + '_grib' for d in sorted(DATASETS.keys()) if d != 'fnl' ])
+    parser.add_argument('--date', default='20220527', help='Fecha de la descarga YYYYMMDD (default 20220527)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Latencia de cada solicitud al servidor (seg.)')
+    parser.add_argument('--failrate', type=float, default=0.0, help='Probabilidad de falla de las solicitudes de datos')
+    parser.add_argument('--seed', type=int, default=1, help='Semilla de las fallas simuladas')
+    parser.add_argument('--repeat', type=int, default=1, help='Corridas de cada descarga')
+    parser.add_argument('--config', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gfsconfig.cfg'))
+    parser.add_argument('--set', action='append', default=[], metavar='LLAVE=VALOR', help='Cambia una llave de gfs_data')
+    parser.add_argument('--workdir', default=None, help='Directorio de los datasets sinteticos y de la descarga')
+    parser.add_argument('--output', default='benchmark_results.jsonl', help='Archivo donde se agregan los resultados')
+    parser.add_argument('--warm', action='store_true', help='Conservar el cache de la submalla entre corridas')
+    parser.add_argument('--child', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    date = dt.datetime.strptime(args.date, '%Y%m%d')
+    if args.child is not None:
+        return runChild(args.child, date)
+
+    log.basicConfig(level=log.INFO, format='%(message)s')
+    workDir = os.path.abspath(args.workdir if args.workdir else tempfile.mkdtemp(prefix='gfsbenchmark_'))
+    dataDir = os.path.join(workDir, 'data')
+    if not os.path.exists(dataDir):
+        os.makedirs(dataDir)
+
+    server = dapServer(dataDir, args.latency, args.failrate, args.seed)
+    url = server.start()
+    # Cada destino corre en su directorio con su archivo de configuracion
+    runDirs = {}
+    for target in args.targets:
+        runDirs[target] = os.path.join(workDir, 'run', target)
+        if not os.path.exists(runDirs[target]):
+            os.makedirs(runDirs[target])
+        config = writeConfig(args.config, runDirs[target], url, args.set, 'grib' if target.endswith('_grib') else 'opendap')
+    lVars = [ v.strip() for v in config.get('variables', 'vars').replace('\n', '').split(',') ]
+    region = [ float(config.get('gfs_data', k)) for k in ('lonmin', 'lonmax', 'latmin', 'latmax') ]
+    hdays = int(config.get('gfs_data', 'hdays'))
+
+    # Datasets sinteticos: los ciclos FNL de la ventana hdays y el run 00z de cada dataset GFS
+    log.info('Creando datasets sinteticos en ' + dataDir)
+    datasets = syntheticDatasets(dataDir, lVars, region)
+    for target in args.targets:
+        if target == 'fnl':
+            for d in range(hdays + 1):
+                for run_time in (0, 6, 12, 18):
+                    datasets.create('fnl', date - dt.timedelta(days=hdays - d), run_time)
+        elif target.endswith('_grib'):
+            if eccodes is None:
+                log.error('El destino ' + target + ' requiere la libreria eccodes')
+                return
+            # Los nombres de los archivos y los registros de las variables son los del motor GRIB2 de gfsDownload
+            sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+            import gfsDownload as gD
+            gD.gfsConfig.setup(os.path.join(runDirs[target], 'gfsconfig.cfg'))
+            engine = gD.gribEngine()
+            gfstype = target.replace('_grib', '')
+            recordKeys = dict([ (v, engine.getRecordKey(v)) for v in lVars ])
+            for t, hour in enumerate(engine.getHours()):
+                fileName = os.path.join(dataDir, engine.getFileURL(date, 0, hour, gfstype)[len(url) + 1:])
+                datasets.createGrib(gfstype, fileName, date, 0, hour, t, recordKeys)
+        else:
+            datasets.create(target, date, 0)
+
+    commit = getCommit()
+    results = []
+    try:
+        for n in range(args.repeat):
+            for target in args.targets:
+                runDir = runDirs[target]
+                if not args.warm and os.path.exists(os.path.join(runDir, '.gfscache')):
+                    for f in os.listdir(os.path.join(runDir, '.gfscache')):
+                        os.remove(os.path.join(runDir, '.gfscache', f))
+                before = server.getCounters()
+                out = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--child', target, '--date', args.date],
+                                              cwd=runDir)
+                after = server.getCounters()
+                result = json.loads(out.decode().strip().splitlines()[-1])
+                # Con regiones (grupo regions) la salida es un <python dict> {region : archivo}
+                outputs = result['output'] or []
+                for output in (outputs.values() if isinstance(outputs, dict) else [outputs]):
+                    if os.path.isdir(os.path.join(runDir, output)):
+                        shutil.rmtree(os.path.join(runDir, output))
+                    elif os.path.exists(os.path.join(runDir, output)):
+                        os.remove(os.path.join(runDir, output))
+                result.update({'commit' : commit, 'timestamp' : dt.datetime.now().isoformat(), 'target' : target, 'repeat' : n,
+                               'latency' : args.latency, 'failrate' : args.failrate, 'overrides' : args.set,
+                               'success' : result['output'] is not None})
+                for k in after.keys():
+                    result[k] = after[k] - before[k]
+                results.append(result)
+                log.info('%-9s %s  %7.2f seg.  %5d solicitudes  %8.2f MB  RSS %7.1f MB  %s' % (target, commit, result['wall_seconds'],
+                         result['requests'], result['bytes'] / 1e6, result['peak_rss_mb'], 'ok' if result['success'] else 'FALLO'))
+    finally:
+        server.stop()
+        with open(args.output, 'a') as f:
+            for r in results:
+                f.write(json.dumps(r) + '\n')
+    log.info('Resultados agregados a ' + args.output)
+
+
+if __name__ == '__main__':
+    main()
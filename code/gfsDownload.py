@@ -4,17 +4,28 @@
   netcdfFile : Clase que se encarga de la creacion de archivos netcdf, recibiendo como parametros python diccionarios con las dimensiones
                variables y atributos para su creacion.
                Cuenta con metodos para crear archivo, crear dimensiones, crear variables y salvar datos.
+  zarrFile   : Salida alternativa (output = zarr) con la misma interfaz de netcdfFile, en un store Zarr local con chunks alineados
+               en la dimension time que se escriben al mismo tiempo en varios hilos (requiere zarr).
 
 
  Descarga datos GFS:
  El siguiente grupo de clases, son las encargadas de realizar la operacion de descarga de variables de GFS y FNL
 
+  gfsSettings: Configuracion de la descarga leida una sola vez del archivo "gfsconfig.cfg" (con cambios desde la linea de comandos
+               o variables de ambiente), validada e inmutable, compartida por todas las clases hijas de gfsConfig.
   gfsConfig  : Clase encargada de leer las entradas al archivo de configuracion para la descarga de GFS y FNL ("gfsconfig.cfg")
+  retryPolicy: Politica de reintentos (backoff exponencial con jitter, tiempo limite por solicitud y por corrida) de las solicitudes
+               al servidor remoto.
+  runMetrics : Metricas de cada solicitud (latencia, bytes, shape, reintentos) y reporte de la corrida en JSON y formato textfile
+               de Prometheus.
   gfsName    : Esta clase contiene el metodo para crear la URL del dataset FNL o GFS_HD que se intenta acceder en base a la fecha y run_time
   gfsSubgrid : Esta clase se encarga de obtener los indices junto longitudes,latitudes que corresponden a los parametros especificados para la malla
                que se va a descargar
+  gribEngine : Motor de descarga alternativo con los archivos GRIB2 de GFS: lee el inventario .idx y pide con HTTP Range solo los
+               registros de las variables configuradas (engine = grib, requiere eccodes).
   gfsData    : Esta clase contiene los metodos para descargar variables junto a sus variables de dimension, para los datasets FNL y GFS_HD.
                Contiene metodos para guardar esta informacion en archivos netcdf con convensiones correctas.
+               Los archivos se pueden agregar a un almacen de series de tiempo (appendstore) ordenado en time, sin repetidos.
 
 
  Favio Medrano hmedrano@cicese.mx
@@ -23,46 +34,203 @@
 
 from configparser import ConfigParser
 import os
+import json
+import fcntl
 import logging as log
 import datetime as dt
 import netCDF4 as nc
 import numpy as np
 import time
+import random
+import shutil
+import threading
+from types import MappingProxyType
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.request import urlopen, Request
+try:
+    import eccodes
+except ImportError:
+    # Solo el motor GRIB2 (engine = grib) requiere eccodes
+    eccodes = None
+try:
+    import zarr
+    import numcodecs
+except ImportError:
+    # Solo la salida Zarr (output = zarr) requiere zarr
+    zarr = None
+
+
+class gfsConfigError(Exception):
+        """
+         Error en el archivo de configuracion o en los cambios de llaves (gfsSettings), por ejemplo una llave numerica
+         que no es un numero, o listas vars, units y longnames de distinto tamano.
+        """
+        pass
+
+
+class gfsSettings():
+        """
+         Clase gfsSettings
+         Configuracion de la descarga: las llaves del archivo de configuracion (por grupo, como texto), con los cambios de
+         llaves de la variable de ambiente GFSCONFIG_SET y de la linea de comandos (ver load). Se lee una sola vez y la
+         comparten todas las clases hijas de gfsConfig (gfsConfig.getSettings). Es inmutable.
+         Al crearse se validan y se guardan con su tipo:
+          bbox      : (lonmin, lonmax, latmin, latmax) del grupo 'gfs_data' como <python float>, None si no estan las llaves
+          vars, units, longnames : <python tuple> del grupo 'variables', del mismo tamano
+          levels    : {var : <python tuple> de niveles} del grupo 'levels'
+         Las llaves como texto se consultan con has_section, has_option, get e items (como ConfigParser).
+        """
+
+        def __init__(self,sections,configfile=None):
+                self.configfile = configfile
+                self.sections = MappingProxyType(dict([ (name, MappingProxyType(dict(keys))) for name, keys in sections.items() ]))
+                dataKeys = self.sections.get('gfs_data', {})
+                bbox = [ dataKeys.get(k, '').strip() for k in ('lonmin', 'lonmax', 'latmin', 'latmax') ]
+                self.bbox = None
+                if any([ b != '' for b in bbox ]):
+                    try:
+                        self.bbox = tuple([ float(b) for b in bbox ])
+                    except ValueError:
+                        raise gfsConfigError('Las llaves lonmin, lonmax, latmin, latmax deben ser numeros: ' + str(bbox))
+                    if self.bbox[2] > self.bbox[3]:
+                        raise gfsConfigError('latmin debe ser menor que latmax: ' + str(self.bbox))
+                self.vars = self.splitList(self.sections.get('variables', {}).get('vars', ''))
+                self.units = self.splitList(self.sections.get('variables', {}).get('units', ''))
+                self.longnames = self.splitList(self.sections.get('variables', {}).get('longnames', ''))
+                if len(self.vars) > 0 and not (len(self.vars) == len(self.units) == len(self.longnames)):
+                    raise gfsConfigError('Las llaves vars, units y longnames deben tener el mismo numero de elementos: '
+                                         + str(len(self.vars)) + ', ' + str(len(self.units)) + ', ' + str(len(self.longnames)))
+                levels = {}
+                for var, raw in self.sections.get('levels', {}).items():
+                    try:
+                        levels[var] = tuple([ float(l) for l in raw.split(',') ])
+                    except ValueError:
+                        raise gfsConfigError('Los niveles de la variable ' + var + ' deben ser numeros: ' + raw)
+                self.levels = MappingProxyType(levels)
+                self.frozen = True
+
+        def __reduce__(self):
+                # Para enviarla a los procesos worker (pickle) se vuelve a crear de sus llaves como texto
+                return (gfsSettings, (dict([ (name, dict(keys)) for name, keys in self.sections.items() ]), self.configfile))
+
+        def __setattr__(self,name,value):
+                if getattr(self, 'frozen', False):
+                    raise AttributeError('gfsSettings es inmutable, las llaves se cambian con gfsConfig.setup')
+                object.__setattr__(self, name, value)
+
+        @staticmethod
+        def splitList(raw):
+                """
+                 Convierte el texto raw, lista separada por comas (puede venir entre comillas), a una <python tuple>.
+                """
+                raw = raw.replace('\n','').strip().strip('"')
+                if raw == '':
+                    return ()
+                return tuple([ e.strip() for e in raw.split(',') ])
+
+        @staticmethod
+        def parseOverride(text):
+                """
+                 Convierte el cambio de llave text, [grupo.]llave=valor (grupo 'gfs_data' si no se indica), a la tupla
+                 (grupo, llave, valor).
+                """
+                key, sep, value = text.partition('=')
+                section, _, key = key.strip().rpartition('.')
+                if sep == '' or key == '':
+                    raise gfsConfigError('Cambio de llave no valido, debe ser [grupo.]llave=valor: ' + text)
+                return (section if section != '' else 'gfs_data'), key.lower(), value.strip()
+
+        @staticmethod
+        def load(configfile,overrides=()):
+                """
+                 Lee el archivo de configuracion configfile y aplica, en este orden, los cambios de llaves de la variable de
+                 ambiente GFSCONFIG_SET (separados por ';') y los de overrides (<python list> de textos [grupo.]llave=valor,
+                 por ejemplo de la linea de comandos).
+                 Regresa el objeto gfsSettings, si la configuracion no es valida se genera un gfsConfigError.
+                """
+                configData = ConfigParser()
+                if os.path.exists(configfile):
+                    configData.read(configfile)
+                else:
+                    log.warning('Archivo de configuracion no existe! (' + configfile + ')')
+                sections = dict([ (name, dict(configData.items(name))) for name in configData.sections() ])
+                changes = [ o for o in os.environ.get('GFSCONFIG_SET', '').split(';') if o.strip() != '' ] + list(overrides or [])
+                for change in changes:
+                    section, key, value = gfsSettings.parseOverride(change)
+                    log.info('gfsSettings: ' + section + '.' + key + ' = ' + value)
+                    sections.setdefault(section, {})[key] = value
+                return gfsSettings(sections, configfile)
+
+        @staticmethod
+        def addArguments(parser):
+                """
+                 Agrega a parser (argparse) las opciones --config (archivo de configuracion) y --set ([grupo.]llave=valor),
+                 que se pasan a gfsConfig.setup.
+                """
+                parser.add_argument('--config', default=None, help='Archivo de configuracion (default: variable de ambiente GFSCONFIG o gfsconfig.cfg)')
+                parser.add_argument('--set', action='append', default=[], metavar='[GRUPO.]LLAVE=VALOR',
+                                    help='Cambia una llave del archivo de configuracion (grupo gfs_data si no se indica)')
+
+        def has_section(self,section):
+                return section in self.sections
+
+        def has_option(self,section,key):
+                return section in self.sections and key in self.sections[section]
+
+        def get(self,section,key):
+                return self.sections[section][key]
+
+        def items(self,section):
+                return list(self.sections[section].items())
 
 
 class gfsConfig:
         """
          Clase padre, que se encarga de cargar el archivo de configuracion gfsconfig.cfg
          Contiene metodos para acceder a las entradas del archivo de configuracion.
+         El archivo se lee una sola vez, la primera vez que se consulta una llave (no al importar el modulo), y todas
+         las instancias comparten la misma configuracion (gfsSettings). El archivo es la variable de ambiente GFSCONFIG
+         o gfsconfig.cfg, los scripts pueden indicar otro archivo y cambios de llaves con setup.
         """
         configfile = 'gfsconfig.cfg'
-        configData = None
+        # Configuracion compartida por todas las instancias (ver getSettings)
+        settings = None
+        # Politica de reintentos de las solicitudes al servidor remoto (ver getRetryPolicy)
+        retry = None
 
-        def __init__(self):
-                # Leer archivo de configuracion
-                self.readConfig()
+        @staticmethod
+        def setup(configfile=None,overrides=()):
+                """
+                 Lee (o vuelve a leer) la configuracion compartida del archivo configfile (default: variable de ambiente
+                 GFSCONFIG o gfsconfig.cfg) con los cambios de llaves overrides ([grupo.]llave=valor).
+                 Regresa el objeto gfsSettings, si la configuracion no es valida se genera un gfsConfigError.
+                """
+                if configfile is None:
+                    configfile = os.environ.get('GFSCONFIG', gfsConfig.configfile)
+                gfsConfig.settings = gfsSettings.load(configfile, overrides)
+                return gfsConfig.settings
 
-        def readConfig(self):
+        @staticmethod
+        def getSettings():
                 """
-                 Funcion que lee el archivo de configuracion, llamada desde el constructor de la clase.
+                 Regresa la configuracion compartida (gfsSettings), se lee en la primera consulta.
                 """
-                self.configData = ConfigParser()
-                if os.path.exists(self.configfile):
-                        self.configData.read(self.configfile)
-                        return 1
-                else:
-                        log.warning('Archivo de configuracion no existe! (' + self.configfile + ')')
-                        return -1
+                if gfsConfig.settings is None:
+                    gfsConfig.setup()
+                return gfsConfig.settings
+
+        @property
+        def configData(self):
+                """
+                 La configuracion compartida (getSettings), se consulta como ConfigParser: has_section, has_option, get, items.
+                """
+                return self.getSettings()
 
         def getKeyValue(self,key,value):
                 try:
-                    if self.configData != None:
-                        rvalue = self.configData.get(key,value)
-                        log.debug('Llave : ' + value + ' Atributo leido: ' + str(rvalue))
-                        return rvalue
-                    else:
-                        log.warning('Configuracion: ' + value + ', no existe en el archivo de configuracion!')
-                        return ''
+                    rvalue = self.configData.get(key,value)
+                    log.debug('Llave : ' + value + ' Atributo leido: ' + str(rvalue))
+                    return rvalue
                 except Exception as e:
                     log.warning('getKeyValue: Se genero un error al intentar leer la llave: ' + str(key))
                     log.warning('getKeyValue: Error: ' + str(e))
@@ -84,12 +252,144 @@ class gfsConfig:
         def getConfigValueVL(self,value):
                 """
                 Devuelve los datos de la llave "value", que vienen en formato de lista separada por comas
-                regresa, un <python list> con los datos.
+                regresa, un <python list> con los datos. Las listas vars, units y longnames ya estan validadas en gfsSettings.
+                """
+                if value in ('vars', 'units', 'longnames'):
+                    return list(getattr(self.configData, value))
+                return list(gfsSettings.splitList(self.getKeyValue('variables',value)))
+
+        def getConfigValueOpt(self,value,default=''):
+                """
+                Devuelve los datos de la llave opcional "value" del grupo 'gfs_data', si la llave no existe regresa default
+                (sin reportar la llave faltante en el log).
+                """
+                if not self.configData.has_option('gfs_data',value):
+                    return default
+                return self.getConfigValue(value)
+
+        def getConfigValueInt(self,value,default=0):
+                """
+                Devuelve los datos de la llave "value" del grupo 'gfs_data' como <python int>,
+                si la llave no existe o no es un numero regresa default.
+                """
+                try:
+                    return int(self.getConfigValueOpt(value))
+                except ValueError:
+                    return default
+
+        def getConfigValueBool(self,value,default=False):
+                """
+                Devuelve los datos de la llave "value" del grupo 'gfs_data' como <python bool> (yes/no, true/false, 1/0),
+                si la llave no existe regresa default.
+                """
+                return self.parseBool(self.getConfigValueOpt(value), default)
+
+        @staticmethod
+        def parseBool(raw,default=False):
+                """
+                Convierte el texto raw (yes/no, true/false, on/off, 1/0) a <python bool>, si no es ninguno regresa default.
+                """
+                raw = raw.strip().lower()
+                if raw in ('yes','true','on','1'):
+                    return True
+                if raw in ('no','false','off','0'):
+                    return False
+                return default
+
+        def getRegions(self):
+                """
+                Devuelve las regiones del grupo 'regions' (nombre = lonmin, lonmax, latmin, latmax) como <python list> de tuplas
+                (nombre, [lonmin, lonmax, latmin, latmax]) en el orden del archivo de configuracion. Si no hay regiones regresa
+                la region de las llaves lonmin, lonmax, latmin, latmax del grupo 'gfs_data', con nombre None.
+                """
+                regions = []
+                if self.configData.has_section('regions'):
+                    for name, raw in self.configData.items('regions'):
+                        try:
+                            bounds = [ float(b) for b in raw.split(',') ]
+                        except ValueError:
+                            bounds = []
+                        if len(bounds) != 4:
+                            log.error('getRegions: La region ' + name + ' debe ser: lonmin, lonmax, latmin, latmax (' + raw + ')')
+                            continue
+                        regions.append((name, bounds))
+                if len(regions) == 0:
+                    if self.configData.bbox is None:
+                        raise gfsConfigError('Faltan las llaves lonmin, lonmax, latmin, latmax del grupo gfs_data')
+                    regions.append((None, list(self.configData.bbox)))
+                return regions
+
+        def getLevelValues(self,var):
+                """
+                Devuelve los niveles de la variable 4D var (grupo 'levels', <var> = nivel1, nivel2, ...) como <python list>
+                de <python float>, o None si la variable no tiene niveles configurados (variable 3D).
+                """
+                if var not in self.configData.levels:
+                    return None
+                return list(self.configData.levels[var])
+
+        def getRegionBounds(self):
+                """
+                Devuelve los limites [lonmin, lonmax, latmin, latmax] que cubren todas las regiones (getRegions).
+                """
+                bounds = [ b for name, b in self.getRegions() ]
+                return [ min([ b[0] for b in bounds ]), max([ b[1] for b in bounds ]),
+                         min([ b[2] for b in bounds ]), max([ b[3] for b in bounds ]) ]
+
+        @staticmethod
+        def parseHours(spec):
+                """
+                Convierte la seleccion de horas de pronostico spec, rangos inicio-fin:paso separados por comas
+                (p. ej. '0-120:1,120-384:12'; 'inicio-fin' con paso 1 o una sola hora), a una <python list> ordenada de horas.
+                """
+                hours = set()
+                for item in spec.replace(' ','').split(','):
+                    if item == '':
+                        continue
+                    hrange, _, step = item.partition(':')
+                    h0, _, h1 = hrange.partition('-')
+                    h0 = int(h0)
+                    h1 = int(h1) if h1 != '' else h0
+                    step = int(step) if step != '' else 1
+                    if step <= 0 or h1 < h0:
+                        raise ValueError('Seleccion de horas no valida: ' + item)
+                    hours.update(range(h0, h1 + 1, step))
+                return sorted(hours)
+
+        def getRetryPolicy(self):
+                """
+                Regresa la politica de reintentos (retryPolicy) de la instancia, se crea en la primera solicitud.
+                """
+                if self.retry is None:
+                    self.retry = retryPolicy()
+                return self.retry
+
+        def getStorageValue(self,var,option):
+                """
+                Devuelve la opcion de almacenamiento "option" de la variable var, del grupo 'storage'.
+                Primero se busca la llave '<var>.<option>' (valor por variable) y despues 'option' (valor para todas
+                las variables). Regresa '' si la opcion no existe.
                 """
-                raw = self.getKeyValue('variables',value)
-                return [ e.strip() for e in raw.replace('\n','').split(',') ]
+                if not self.configData.has_section('storage'):
+                    return ''
+                for key in (var + '.' + option, option):
+                    if self.configData.has_option('storage', key):
+                        return self.configData.get('storage', key).strip()
+                return ''
 
         def datasetExists(self,fname):
+                """
+                Verifica si existe el dataset fname. Para datasets OPeNDAP remotos (http/https) solo se pide la descripcion
+                del dataset (fname.dds), sin abrir la conexion completa con netCDF4, con un tiempo limite 'probetimeout' (seg.)
+                """
+                if fname.startswith(('http://','https://')):
+                    try:
+                        with urlopen(fname + '.dds', timeout=self.getConfigValueInt('probetimeout', 30)) as response:
+                            # El servidor responde con una pagina de error cuando el dataset no existe
+                            return response.read(256).lstrip().startswith(b'Dataset')
+                    except Exception as e:
+                        log.debug('datasetExists: ' + fname + ' : ' + str(e))
+                        return False
                 try:
                     dst = nc.Dataset(fname,'r')
                     dst.close()
@@ -97,6 +397,32 @@ class gfsConfig:
                 except:
                     return False
 
+        def probeDatasets(self,fnames):
+                """
+                Verifica al mismo tiempo si existen los datasets de la lista fnames.
+                Regresa una <python list> de <python bool> en el mismo orden que fnames.
+                """
+                # Solo las verificaciones por http se hacen en paralelo, netCDF4 no es thread-safe
+                if len(fnames) > 1 and all([ f.startswith(('http://','https://')) for f in fnames ]):
+                    with ThreadPoolExecutor(max_workers=len(fnames)) as pool:
+                        return list(pool.map(self.datasetExists, fnames))
+                return [ self.datasetExists(f) for f in fnames ]
+
+        def findDataset(self,fnames):
+                """
+                Busca el primer dataset disponible de la lista fnames, que viene en orden de preferencia (por ejemplo del ciclo
+                mas reciente al mas antiguo). Los datasets se verifican en grupos de 'probeworkers' al mismo tiempo, y se deja
+                de buscar en el primer grupo donde hay un dataset disponible.
+                Regresa el indice del dataset en fnames, o -1 si no existe ninguno.
+                """
+                nprobe = max(1, self.getConfigValueInt('probeworkers', 8))
+                for i0 in range(0, len(fnames), nprobe):
+                    found = self.probeDatasets(fnames[i0:i0+nprobe])
+                    for k in range(len(found)):
+                        if found[k]:
+                            return i0 + k
+                return -1
+
 
 class netcdfFile():
         """
@@ -106,6 +432,8 @@ class netcdfFile():
         """
         fileHandler = None
         fileName = None
+        # Segundos acumulados escribiendo datos al archivo (saveData, saveDataS)
+        writeSeconds = 0.0
 
         def __del__(self):
             # Nos aseguramos que el archivo se cierre correctamente.
@@ -143,6 +471,7 @@ class netcdfFile():
              Formato: {'dim' : value , 'dim2' : value2 .... }
             """
             self.fileName = os.path.join(path,filename)
+            self.writeSeconds = 0.0
             try:
                 self.fileHandler = nc.Dataset(filename,'w',filetype)
             except Exception as e:
@@ -150,6 +479,29 @@ class netcdfFile():
                 log.warning(str(e))
                 return -1
 
+        def openFile(self,filename,mode='a'):
+            """
+             Abre un archivo netcdf existente para agregar datos (mode='a') o solo lectura (mode='r').
+            """
+            self.fileName = filename
+            self.writeSeconds = 0.0
+            try:
+                self.fileHandler = nc.Dataset(filename,mode)
+            except Exception as e:
+                log.warning('Se detecto un error al abrir el archivo: ' + filename )
+                log.warning(str(e))
+                return -1
+            return 0
+
+        def syncFile(self):
+            """
+             Escribe a disco los datos pendientes del archivo netcdf.
+            """
+            if self.fileHandler == None:
+                return -1
+            self.fileHandler.sync()
+            return 0
+
         def closeFile(self):
             """
              Funcion que cierra el archivo netcdf, si es que ya se creo.
@@ -184,6 +536,8 @@ class netcdfFile():
              Recibe como <python dict> los datos de las variables, nombres y atributos
              Formato: { 'varName1' : { 'dimensions' : ['dim1','dim2'...] , 'attributes' : {'atribute1':value,'atribute2':'value2'}, 'dataType' : value }  ,
                         'varName2' : { 'dimensions' : ['dim1','dim2'...] , 'attributes' : {'atribute3':value,'atribute4':'value2'}, 'dataType' : value }  ..... }
+             Opcionalmente cada variable puede tener la llave 'storage' con las opciones de almacenamiento de netCDF4:
+              'storage' : {'zlib' : True, 'complevel' : 4, 'shuffle' : True, 'chunksizes' : [24, 32, 32]}
             """
             def cleanVar(v):
                 if type(v) == type('str'):
@@ -204,7 +558,8 @@ class netcdfFile():
                             fillv = cleanVar(varsDict[v]['attributes']['_FillValue'])
                         except:
                             fillv = None
-                        varH = self.fileHandler.createVariable(v.strip(),varsDict[v]['dataType'],dimtuple,fill_value=fillv)
+                        storage = varsDict[v].get('storage', {})
+                        varH = self.fileHandler.createVariable(v.strip(),varsDict[v]['dataType'],dimtuple,fill_value=fillv,**storage)
                         # Agregar los atributos
                         for att in varsDict[v]['attributes'].keys():
                             if att == 'units':
@@ -217,6 +572,8 @@ class netcdfFile():
                                 varH.missing_value =  (cleanVar(varsDict[v]['attributes']['missing_value']))
                             elif att == 'add_offset':
                                 varH.add_offset = (cleanVar(varsDict[v]['attributes']['add_offset']))
+                            elif att == 'scale_factor':
+                                varH.scale_factor = (cleanVar(varsDict[v]['attributes']['scale_factor']))
                             elif att == 'calendar':
                                 varH.calendar = cleanVar(varsDict[v]['attributes']['calendar'])
                             elif att == '_FillValue':
@@ -244,11 +601,15 @@ class netcdfFile():
             if varDataDict != None:
                 for v in varDataDict.keys():
                     log.debug('saveData: Intento de salvar datos de variable : ' + v)
+                    startTime = time.time()
                     try:
                         varH = self.fileHandler.variables[v]
-                        varH[:] = varDataDict[v][:]
+                        varH[:] = netcdfFile.maskPackData(varH, varDataDict[v][:])
+                        self.writeSeconds = self.writeSeconds + time.time() - startTime
+                        runMetrics.record('saveData', self.fileName, v, time.time() - startTime, varDataDict[v])
                         log.debug('saveData: Exitoso!')
                     except Exception as e:
+                        runMetrics.record('saveData', self.fileName, v, time.time() - startTime, ok=False)
                         log.warning('saveData: Fallo al intentar salvar datos en variable: ' + v)
                         log.warning('saveData: ' + str(e))
                         return -1
@@ -264,306 +625,2392 @@ class netcdfFile():
                 log.warning('saveData: Primero es necesario crear el archivo, con el metodo .create')
                 return -1
             # La variable varName existe ?
+            startTime = time.time()
             try:
                 log.debug('saveData: Intento de salvar datos de variable : ' + varName)
                 varH = self.fileHandler.variables[varName]
-                varH[indexs] = data
+                varH[indexs] = netcdfFile.maskPackData(varH, data)
+                self.writeSeconds = self.writeSeconds + time.time() - startTime
+                runMetrics.record('saveData', self.fileName, varName, time.time() - startTime, data)
                 log.debug('saveDataS: Existoso!')
             except Exception as e:
+                runMetrics.record('saveData', self.fileName, varName, time.time() - startTime, ok=False)
                 log.warning('saveDataS: Fallo al intentar salvar datos en variable: ' + varName)
                 log.warning('saveDataS: ' + str(e))
                 return -1
 
             return 0
 
+        def readData(self,varName,indexs=slice(None)):
+            """
+             Lee los datos de la variable "varName" en los indices de tiempo "indexs" (slice), como np.ma.array con los
+             valores _FillValue enmascarados y las variables empaquetadas ya convertidas.
+            """
+            return self.fileHandler.variables[varName][indexs]
+
+        def getVarInfo(self):
+            """
+             Dimensiones y tipo de cada variable del archivo: {var : (dimensiones, tipo)}. Las variables empaquetadas
+             (enteras con scale_factor) son de tipo f4, el de sus datos como los regresa readData.
+            """
+            info = {}
+            for name, varH in self.fileHandler.variables.items():
+                packed = 'scale_factor' in varH.ncattrs() and np.issubdtype(varH.dtype, np.integer)
+                info[name] = (tuple(varH.dimensions), np.dtype('f4') if packed else np.dtype(varH.dtype))
+            return info
+
+        @staticmethod
+        def maskPackData(varH,data):
+            """
+             Si la variable varH esta empaquetada (entera con scale_factor), regresa data con los NaN enmascarados y los
+             puntos enmascarados con el valor add_offset (getMaskedPackData), si no regresa data sin cambios.
+            """
+            if 'scale_factor' not in varH.ncattrs() or not np.issubdtype(varH.dtype, np.integer):
+                return data
+            return netcdfFile.getMaskedPackData(data, varH.add_offset if 'add_offset' in varH.ncattrs() else 0.0)
+
+        @staticmethod
+        def getMaskedPackData(data,offset):
+            """
+             Datos de una variable empaquetada: los NaN e infinitos tambien quedan enmascarados y los puntos enmascarados
+             valen offset, asi al convertirlos a enteros no hay valores fuera de rango y se guardan como el _FillValue.
+            """
+            data = np.ma.masked_invalid(data, copy=False)
+            return np.ma.array(data.filled(offset), mask=np.ma.getmaskarray(data))
 
+        @staticmethod
+        def getPackParams(data,nbits=16,fillValue=None):
+            """
+             Calcula scale_factor y add_offset para guardar los datos "data" como enteros de nbits bits (int16 por default).
+             Los valores fillValue (puntos faltantes sin mascara, ver gfsData.fillValue) y los NaN no cuentan para el rango.
+             El rango de los datos se reparte en los enteros [-(2^(nbits-1)-3), 2^(nbits-1)-3], reservando -(2^(nbits-1)-1)
+             para el _FillValue con un entero de margen para el redondeo de scale_factor y add_offset en float32.
+             Regresa (scale_factor, add_offset) como np.float32
+            """
+            data = np.ma.masked_invalid(data, copy=False)
+            if fillValue is not None:
+                data = np.ma.masked_values(data, fillValue, copy=False)
+            vmin = np.ma.min(data)
+            vmax = np.ma.max(data)
+            if vmin is np.ma.masked:
+                return np.float32(1.0), np.float32(0.0)
+            vmin = float(vmin)
+            vmax = float(vmax)
+            scale = (vmax - vmin) / (2**nbits - 6) if vmax > vmin else 1.0
+            return np.float32(scale), np.float32((vmax + vmin) / 2.0)
+
+        @staticmethod
+        def getPathSize(path):
+            """
+             Tamano en bytes del archivo path, o de todos los archivos del directorio path (store Zarr).
+            """
+            if not os.path.isdir(path):
+                return os.path.getsize(path)
+            return sum([ os.path.getsize(os.path.join(root, f)) for root, dirs, files in os.walk(path) for f in files ])
 
+        @staticmethod
+        def replacePath(src,dst):
+            """
+             Publica el archivo (o directorio, store Zarr) src con el nombre dst. Los archivos se publican con os.replace
+             (atomico). Un directorio dst anterior se mueve a un lado antes de publicar el nuevo y despues se borra, asi
+             dst nunca tiene un contenido incompleto.
+            """
+            if not os.path.isdir(src):
+                os.replace(src, dst)
+                return
+            old = None
+            if os.path.exists(dst):
+                old = dst + '.old'
+                netcdfFile.removePath(old)
+                os.replace(dst, old)
+            os.replace(src, dst)
+            if old is not None:
+                netcdfFile.removePath(old)
+
+        @staticmethod
+        def removePath(path):
+            """
+             Borra el archivo (o directorio, store Zarr) path si existe.
+            """
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
 
 
-class gfsName(gfsConfig):
+class zarrFile(netcdfFile):
         """
-         Clase gfsName hija de gfsConfig
-         Se encarga de generar el url con el nombre del dataset gfs o fnl en base a la
-         fecha y el numero de corrida de GFS.
+         Clase zarrFile hija de netcdfFile
+         Salida en un store Zarr local (un directorio, formato zarr v2 que se lee con xarray.open_zarr) con la misma interfaz
+         de netcdfFile: las mismas dimensiones, variables y atributos que el archivo netcdf. Cada variable guarda sus dimensiones
+         en el atributo _ARRAY_DIMENSIONS, y las variables con _FillValue lo tienen como fill_value del arreglo.
+         Los chunks de las variables son los del grupo 'storage' (getVarStorage), alineados en la dimension time: cada chunk
+         tiene chunks[0] pasos de tiempo y es un archivo independiente del store. Los bloques que llegan con saveDataS se
+         escriben en un pool de writers hilos mientras continua la descarga, las escrituras que tocan el mismo chunk de tiempo
+         de una variable se serializan. syncFile y closeFile esperan las escrituras pendientes, si alguna fallo regresan -1.
+         La dimension unlimited crece con las escrituras (resize de los arreglos, al doble para no detener las escrituras
+         en cada paso de tiempo), al cerrar todos los arreglos de la dimension quedan del tamano de los datos escritos,
+         como en netcdf. El tamano se guarda en el atributo unlimited_dims del grupo en cada syncFile, asi un store
+         parcial (resume) se reabre con su tamano real.
         """
 
-        def getrootURL(self):
-                return self.getConfigValue('url')
+        def __init__(self,writers=4):
+            self.writers = max(1, int(writers))
+            self.pool = None
+            self.pending = []
+            self.lock = threading.Lock()
+            self.chunkLocks = {}
+            self.error = None
+            self.readOnly = False
+            self.dims = {}
+            self.unlimited = {}
+            self.arrays = {}
+
+        def createFile(self,filename,path='',filetype=None):
+            """
+             Crea el store Zarr filename (directorio), si ya existe se reemplaza.
+            """
+            self.fileName = os.path.join(path,filename)
+            self.writeSeconds = 0.0
+            if zarr is None:
+                log.error('createFile: La salida Zarr (output = zarr) requiere la libreria zarr')
+                return -1
+            try:
+                self.fileHandler = zarr.open_group(self.fileName, mode='w', zarr_format=2)
+            except Exception as e:
+                log.warning('Se detecto un error al crear el store Zarr: ' + self.fileName)
+                log.warning(str(e))
+                return -1
+
+        def openFile(self,filename,mode='a'):
+            """
+             Abre un store Zarr existente para agregar datos (mode='a') o solo lectura (mode='r').
+            """
+            self.fileName = filename
+            self.writeSeconds = 0.0
+            if zarr is None:
+                log.error('openFile: La salida Zarr (output = zarr) requiere la libreria zarr')
+                return -1
+            try:
+                self.fileHandler = zarr.open_group(filename, mode='r+' if mode == 'a' else 'r')
+                self.readOnly = mode == 'r'
+                self.unlimited = dict(self.fileHandler.attrs.get('unlimited_dims', {}))
+                for name, array in self.fileHandler.arrays():
+                    dims = array.attrs['_ARRAY_DIMENSIONS']
+                    for d, n in zip(dims, array.shape):
+                        self.dims[d] = None if d in self.unlimited else n
+                    self.arrays[name] = {'array' : array, 'dims' : dims, 'fill' : array.fill_value,
+                                         'scale' : array.attrs.get('scale_factor'), 'offset' : array.attrs.get('add_offset')}
+            except Exception as e:
+                log.warning('Se detecto un error al abrir el store Zarr: ' + filename)
+                log.warning(str(e))
+                self.fileHandler = None
+                return -1
+            return 0
 
+        def createDims(self,dimDict):
+            """
+             Registra las dimensiones del store ({'dimension' : 10 , 'dimension2' : None }, None = unlimited).
+             Zarr no tiene dimensiones, cada arreglo las guarda en su atributo _ARRAY_DIMENSIONS.
+            """
+            if self.fileHandler == None:
+                log.warning('Primero es necesario crear el archivo, con el metodo .create')
+                return -1
+            if dimDict != None:
+                for d in dimDict.keys():
+                    self.dims[d] = dimDict[d]
+                    if dimDict[d] is None and d not in self.unlimited:
+                        self.unlimited[d] = 0
+                self.fileHandler.attrs['unlimited_dims'] = self.unlimited
+            return 0
 
-        def getURLName(self, time, gfs_run_time, gfstype):
-                """
-                 Time es un dato fecha <python datetime>, gfs_run_time especifica que dataset runtime (0 = 00z, 6 =06z, etc)
-                 gfstype, es el dataset que se busca, puede ser 'gfs_hd' o 'fnl'
-                """
-                gfsname = ''
-                if gfstype == 'gfs_hd':  # 1
-                    gfsname = 'gfs_hd/gfs_hd'
-                    gfsname1='gfs_hd'
-                elif gfstype == 'gfs_0p50':
-                    gfsname = 'gfs_0p50/gfs'
-                    gfsname1 = 'gfs_0p50'
-                elif gfstype == 'gfs_0p25':
-                    gfsname = 'gfs_0p25/gfs'
-                    gfsname1 = 'gfs_0p25'
-                else:
-                    gfsname = 'fnl/fnl'  # 0
-                    gfsname1='fnlflx'
-                strdate = "%d%02d%02d" % (time.year,time.month,time.day)
-                gfsdir = self.getrootURL() + '/dods/' + gfsname + strdate + '/'
-                fname = gfsdir + gfsname1 + '_' + ("%02d"%gfs_run_time) + 'z'
-                return fname
+        def createVars(self,varsDict):
+            """
+             Crea los arreglos de las variables, mismo formato de netcdfFile.createVars. Las opciones de almacenamiento
+             'storage' (zlib, complevel, shuffle, chunksizes) se traducen a los codecs Zlib y Shuffle de numcodecs. Sin
+             chunksizes, los chunks son de un paso de tiempo (1024 en los vectores de tiempo) con las demas dimensiones completas.
+            """
+            if self.fileHandler == None:
+                log.warning('createVars: Primero es necesario crear el archivo, con el metodo .create')
+                return -1
+            if varsDict != None:
+                for v in varsDict.keys():
+                    log.debug('createVars: procesando variable: ' + v)
+                    try:
+                        dims = list(varsDict[v]['dimensions'])
+                        dtype = np.dtype(varsDict[v]['dataType'])
+                        storage = varsDict[v].get('storage', {})
+                        attributes = dict([ (att, value.strip() if isinstance(value, str) else value.item() if isinstance(value, np.generic) else value)
+                                            for att, value in varsDict[v]['attributes'].items() ])
+                        fill = attributes.pop('_FillValue', None)
+                        shape = [ 0 if self.dims[d] is None else self.dims[d] for d in dims ]
+                        chunks = storage.get('chunksizes')
+                        if chunks is None:
+                            chunks = [ (1024 if len(dims) == 1 else 1) if self.dims[d] is None else max(1, self.dims[d]) for d in dims ]
+                        compressors = None
+                        filters = None
+                        if storage.get('zlib', False):
+                            compressors = numcodecs.Zlib(level=storage.get('complevel', 4))
+                            if storage.get('shuffle', True):
+                                filters = [numcodecs.Shuffle(elementsize=dtype.itemsize)]
+                        array = self.fileHandler.create_array(v.strip(), shape=shape, chunks=[ max(1, int(c)) for c in chunks ], dtype=dtype,
+                                                              compressors=compressors, filters=filters,
+                                                              fill_value=None if fill is None else dtype.type(fill))
+                        attributes['_ARRAY_DIMENSIONS'] = dims
+                        array.attrs.update(attributes)
+                        self.arrays[v.strip()] = {'array' : array, 'dims' : dims, 'fill' : None if fill is None else dtype.type(fill),
+                                                  'scale' : attributes.get('scale_factor'), 'offset' : attributes.get('add_offset')}
+                        log.debug('createVars: Variable ' + v + ' , creada con todos sus atributos')
+                    except Exception as e:
+                        log.warning('createVars: Fallo al crear la variable : ' + v)
+                        log.warning('createVars: Store Zarr: ' + self.fileName)
+                        log.warning(str(e))
+                        return -1
+            return 0
 
+        def getStoreData(self,var,data):
+            """
+             Convierte los datos data de la variable var al tipo del arreglo: los datos enmascarados se guardan como el
+             fill_value, y las variables empaquetadas (scale_factor, add_offset) se convierten a enteros como en netcdf.
+            """
+            info = self.arrays[var]
+            array = info['array']
+            data = np.ma.asarray(data)
+            if info['scale'] is not None and np.issubdtype(array.dtype, np.integer):
+                data = netcdfFile.getMaskedPackData(data, info['offset'])
+                # En el tipo de los datos (f4), igual que netCDF4 al empaquetar
+                ftype = data.dtype.type if np.issubdtype(data.dtype, np.floating) else np.float64
+                data = np.ma.round((data - ftype(info['offset'])) / ftype(info['scale']))
+            fill = info['fill'] if info['fill'] is not None else (np.nan if np.issubdtype(array.dtype, np.floating) else 0)
+            return np.ma.filled(data.astype(array.dtype), fill)
+
+        def getUnlimitedArrays(self,dim):
+            return [ a['array'] for a in self.arrays.values() if len(a['dims']) > 0 and a['dims'][0] == dim ]
+
+        def growUnlimited(self,var,size):
+            """
+             Registra el tamano size de la dimension unlimited de la variable var. Si el arreglo es menor, espera las
+             escrituras pendientes y crece al doble (al menos size) todos los arreglos de esa dimension (la dimension es
+             compartida, como en netcdf).
+            """
+            info = self.arrays[var]
+            if len(info['dims']) == 0 or info['dims'][0] not in self.unlimited:
+                return
+            dim = info['dims'][0]
+            self.unlimited[dim] = max(self.unlimited[dim], size)
+            if info['array'].shape[0] >= size:
+                return
+            self.wait()
+            size = max(size, 2 * info['array'].shape[0])
+            for array in self.getUnlimitedArrays(dim):
+                if array.shape[0] < size:
+                    array.resize([size] + list(array.shape[1:]))
+
+        def wait(self,limit=0):
+            """
+             Espera a que queden como maximo limit escrituras pendientes.
+            """
+            while len(self.pending) > limit:
+                self.pending.pop(0).result()
 
+        def writeBlock(self,varName,data,indexs):
+            """
+             Escribe el bloque data en la variable varName, en los indices de tiempo indexs (un hilo del pool). Se toman
+             en orden los candados de los chunks de tiempo que toca el bloque.
+            """
+            array = self.arrays[varName]['array']
+            t0, t1, _ = indexs.indices(array.shape[0]) if isinstance(indexs, slice) else (int(indexs), int(indexs) + 1, 1)
+            ct = array.chunks[0]
+            with self.lock:
+                locks = [ self.chunkLocks.setdefault((varName, c), threading.Lock()) for c in range(t0 // ct, (max(t1, t0 + 1) - 1) // ct + 1) ]
+            startTime = time.time()
+            for l in locks:
+                l.acquire()
+            try:
+                array[indexs] = data
+                seconds = time.time() - startTime
+                with self.lock:
+                    self.writeSeconds = self.writeSeconds + seconds
+                runMetrics.record('saveData', self.fileName, varName, seconds, data)
+            except Exception as e:
+                runMetrics.record('saveData', self.fileName, varName, time.time() - startTime, ok=False)
+                log.warning('saveDataS: Fallo al intentar salvar datos en variable: ' + varName)
+                log.warning('saveDataS: ' + str(e))
+                self.error = e
+            finally:
+                for l in locks:
+                    l.release()
 
-class gfsSubgrid(gfsConfig):
-        """
-         Clase gfsSubgrid hija de gfsConfig
-         Esta clase se encarga de obtener los indices que corresponden a los parametros
-         latmin, lonmin, latmax, lonmax.
-         Tambien obtiene las latitudes y longitudes de uno de los datasets que se provean.
-        """
-        longitudes = None
-        irange = None
+        def saveData(self,varDataDict):
+            """
+             Guarda los arreglos completos de las variables ({'varname1' : np.arrray[:,:,:] , ... }), sin hilos.
+            """
+            if self.fileHandler == None:
+                log.warning('saveData: Primero es necesario crear el archivo, con el metodo .create')
+                return -1
+            if varDataDict != None:
+                for v in varDataDict.keys():
+                    log.debug('saveData: Intento de salvar datos de variable : ' + v)
+                    startTime = time.time()
+                    try:
+                        data = self.getStoreData(v, varDataDict[v])
+                        self.growUnlimited(v, data.shape[0] if data.ndim > 0 else 0)
+                        self.arrays[v]['array'][tuple([ slice(0, n) for n in data.shape ])] = data
+                        self.writeSeconds = self.writeSeconds + time.time() - startTime
+                        runMetrics.record('saveData', self.fileName, v, time.time() - startTime, varDataDict[v])
+                        log.debug('saveData: Exitoso!')
+                    except Exception as e:
+                        runMetrics.record('saveData', self.fileName, v, time.time() - startTime, ok=False)
+                        log.warning('saveData: Fallo al intentar salvar datos en variable: ' + v)
+                        log.warning('saveData: ' + str(e))
+                        return -1
+            return 0
 
-        latitudes = None
-        jrange = None
+        def saveDataS(self,varName,data,indexs):
+            """
+             Encola la escritura de los datos "data" en la variable "varName" en los indices de tiempo "indexs", se escribe
+             en un hilo del pool (writeBlock). Regresa -1 si fallo una escritura anterior.
+            """
+            if self.fileHandler == None:
+                log.warning('saveData: Primero es necesario crear el archivo, con el metodo .create')
+                return -1
+            if self.error is not None:
+                return -1
+            try:
+                data = self.getStoreData(varName, data)
+                self.growUnlimited(varName, indexs.stop if isinstance(indexs, slice) else int(indexs) + 1)
+            except Exception as e:
+                log.warning('saveDataS: Fallo al intentar salvar datos en variable: ' + varName)
+                log.warning('saveDataS: ' + str(e))
+                return -1
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(max_workers=self.writers)
+            # Como maximo 2*writers bloques en memoria esperando a escribirse
+            self.wait(2 * self.writers - 1)
+            self.pending.append(self.pool.submit(self.writeBlock, varName, data, indexs))
+            return 0
 
+        def getVarInfo(self):
+            """
+             Dimensiones y tipo de cada variable del store, como en netcdfFile.getVarInfo.
+            """
+            info = {}
+            for name, a in self.arrays.items():
+                packed = a['scale'] is not None and np.issubdtype(a['array'].dtype, np.integer)
+                info[name] = (tuple(a['dims']), np.dtype('f4') if packed else np.dtype(a['array'].dtype))
+            return info
 
-        def getGFSgrid_default(self,fname):
+        def readData(self,varName,indexs=slice(None)):
             """
-             Regresa los indices para los valores lonmin lonmax latmin latmax
-             leidos del archivo de configuracion (DEFAULT)
+             Lee los datos de la variable "varName" en los indices de tiempo "indexs" (slice), como en netcdfFile.readData.
+             Espera las escrituras pendientes, y la dimension unlimited se lee solo hasta el tamano de los datos escritos.
+            """
+            self.wait()
+            info = self.arrays[varName]
+            array = info['array']
+            if len(info['dims']) > 0 and info['dims'][0] in self.unlimited:
+                indexs = slice(*indexs.indices(self.unlimited[info['dims'][0]]))
+            data = np.ma.asarray(array[indexs])
+            if info['fill'] is not None:
+                data = np.ma.masked_equal(data, info['fill'])
+            if info['scale'] is not None and np.issubdtype(array.dtype, np.integer):
+                data = data * np.float32(info['scale']) + np.float32(info['offset'])
+            return data
+
+        def syncFile(self):
             """
-            lonmin = float(self.getConfigValue('lonmin'))
-            lonmax = float(self.getConfigValue('lonmax'))
-            latmin = float(self.getConfigValue('latmin'))
-            latmax = float(self.getConfigValue('latmax'))
-            self.getGFSgrid(fname, lonmin, lonmax, latmin, latmax)
+             Espera las escrituras pendientes. Regresa -1 si alguna fallo.
+            """
+            if self.fileHandler == None:
+                return -1
+            self.wait()
+            if self.error is None:
+                self.fileHandler.attrs['unlimited_dims'] = self.unlimited
+            return 0 if self.error is None else -1
 
-        def getGFSgrid(self,fname,lonmin,lonmax,latmin,latmax):
-            dl=1;
-            lonmin=lonmin-dl
-            lonmax=lonmax+dl
-            latmin=latmin-dl
-            latmax=latmax+dl
-            attemps=10
-            retrySeconds=10
-            dataset = None
-            for attemp in range(0,attemps):
+        def closeFile(self):
+            """
+             Espera las escrituras pendientes, deja todos los arreglos de la dimension unlimited del tamano de los datos
+             escritos y escribe los metadatos consolidados del store. Regresa -1 si alguna escritura fallo.
+            """
+            if self.fileHandler == None:
+                return -1
+            self.wait()
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
+            if self.error is None and not self.readOnly:
                 try:
-                    dataset = nc.Dataset(fname,'r')
-                    break
+                    for dim in self.unlimited.keys():
+                        for array in self.getUnlimitedArrays(dim):
+                            if array.shape[0] != self.unlimited[dim]:
+                                array.resize([self.unlimited[dim]] + list(array.shape[1:]))
+                    self.fileHandler.attrs['unlimited_dims'] = self.unlimited
+                    zarr.consolidate_metadata(self.fileName)
                 except Exception as e:
-                    log.warning('getGFSgrid: No se encontro el dataset: ' + fname)
-                    log.warning('getGFSgrid: ' + str(e))
-                    log.warning('getGFSgrid: Reintentando la descarga. attemp: ' + str(attemp) + ' en ' + str(retrySeconds) + 'seg.')
-                    if attemp > 3:
-                        # En los ultimos tres intentos dormir el proceso diez segundos
-                        time.sleep(retrySeconds)
-                        retrySeconds = retrySeconds + 5
-                        continue
-
-            if dataset is None:
-                return 0
+                    log.warning('closeFile: Fallo al cerrar el store Zarr ' + str(self.fileName) + ': ' + str(e))
+                    self.error = e
+            self.fileHandler = None
+            self.fileName = None
+            return 0 if self.error is None else -1
 
-            lon = dataset.variables['lon'][:]
-            lat = dataset.variables['lat'][:]
-            dataset.close()
 
-            # Obtener la sub malla
-            # 1. Longitud, (lidiar con greenwitch)
+
+class downloadCheckpoint():
+        """
+         Clase downloadCheckpoint
+         Registro de los bloques (variable, rango de tiempo) completos de una descarga que se escribe en el archivo
+         parcial <archivo>.part. El registro se guarda en <archivo>.part.json junto con el plan de la descarga
+         (la lista de todos los bloques), y si la descarga falla se puede reanudar descargando solo los bloques faltantes.
+        """
+
+        def __init__(self,fileName,plan):
+            self.fileName = fileName
+            self.partFile = fileName + '.part'
+            self.recordFile = self.partFile + '.json'
+            self.plan = sorted(plan)
+            self.done = set()
+
+        @staticmethod
+        def blockKey(var,t0,t1):
+            """
+             Llave del bloque de la variable var en el rango de tiempo [t0,t1] del archivo de salida.
+            """
+            return '%s:%d:%d' % (var, t0, t1)
+
+        def load(self):
+            """
+             Lee el registro de una descarga anterior. Regresa True si existe el archivo parcial y su registro
+             corresponde al mismo plan de descarga.
+            """
+            if not (os.path.exists(self.partFile) and os.path.exists(self.recordFile)):
+                return False
+            try:
+                with open(self.recordFile, 'r') as f:
+                    record = json.load(f)
+            except Exception as e:
+                log.warning('downloadCheckpoint: No se pudo leer el registro ' + self.recordFile + ': ' + str(e))
+                return False
+            if record.get('plan') != self.plan:
+                log.warning('downloadCheckpoint: El registro ' + self.recordFile + ' es de un plan de descarga distinto, se descarta.')
+                return False
+            self.done = set(record.get('done', []))
+            return True
+
+        def save(self):
+            """
+             Guarda el registro, se escribe a un archivo temporal que se renombra para no dejar registros incompletos.
+            """
+            with open(self.recordFile + '.tmp', 'w') as f:
+                json.dump({'plan' : self.plan, 'done' : sorted(self.done)}, f)
+            os.replace(self.recordFile + '.tmp', self.recordFile)
+
+        def add(self,keys):
+            """
+             Marca como completos los bloques keys. Se debe llamar despues de escribir los datos al archivo parcial.
+            """
+            self.done.update(keys)
+            self.save()
+
+        def pending(self,keys):
+            """
+             Regresa True si alguno de los bloques keys no esta completo.
+            """
+            return not set(keys).issubset(self.done)
+
+        def finalize(self):
+            """
+             Publica el archivo parcial con su nombre final y borra el registro.
+            """
+            netcdfFile.replacePath(self.partFile, self.fileName)
+            if os.path.exists(self.recordFile):
+                os.remove(self.recordFile)
+
+        def discard(self):
+            """
+             Borra el archivo parcial y el registro de una descarga anterior.
+            """
+            for f in (self.partFile, self.recordFile):
+                netcdfFile.removePath(f)
+            self.done = set()
+
+
+
+class gfsFatalError(Exception):
+        """
+         Error de una solicitud que no se resuelve reintentando (por ejemplo la variable no existe en el dataset,
+         o se agoto el tiempo limite de la corrida). retryPolicy y downloadBlocks no reintentan estos errores.
+        """
+        pass
+
+
+
+class retryPolicy(gfsConfig):
+        """
+         Clase retryPolicy hija de gfsConfig
+         Politica de reintentos compartida por las solicitudes al servidor remoto (getGFSgrid, getDataVector y getData).
+         La espera entre intentos crece como retrybase*2^n segundos hasta retrymax, con jitter para que los workers no
+         reintenten todos al mismo tiempo. Cada solicitud HTTP tiene un tiempo maximo (requesttimeout) y todos los
+         reintentos de la corrida un tiempo limite (rundeadline).
+        """
+        def __init__(self):
+            # Segundos de espera entre reintentos acumulados por esta instancia, y hora limite (epoch) de la corrida
+            self.waitSeconds = 0.0
+            self.runDeadline = None
+            # Reintentos de la ultima solicitud (call)
+            self.lastRetries = 0
+            self.attempts = max(1, self.getConfigValueInt('retries', 10))
+            self.backoffBase = float(self.getConfigValueOpt('retrybase', '2'))
+            self.backoffMax = float(self.getConfigValueOpt('retrymax', '60'))
+            # El tiempo maximo de cada solicitud lo aplica la libreria netCDF-C (curl) a las conexiones OPeNDAP
+            requestTimeout = self.getConfigValueInt('requesttimeout', 0)
+            if requestTimeout > 0 and hasattr(nc, 'rc_set'):
+                nc.rc_set('HTTP.TIMEOUT', str(requestTimeout))
+
+        def startRun(self):
+            """
+             Inicia el tiempo limite de una corrida (llave 'rundeadline', 0 = sin limite).
+            """
+            rundeadline = self.getConfigValueInt('rundeadline', 0)
+            self.runDeadline = time.time() + rundeadline if rundeadline > 0 else None
+
+        def endRun(self):
+            """
+             Termina la corrida, las solicitudes siguientes de la instancia ya no tienen tiempo limite.
+            """
+            self.runDeadline = None
+
+        def deadlineExpired(self):
+            """
+             Regresa True si ya paso la hora limite de la corrida.
+            """
+            return self.runDeadline is not None and time.time() >= self.runDeadline
+
+        def getDelay(self,attempt):
+            """
+             Segundos de espera antes del reintento attempt (0, 1, ...), backoff exponencial con jitter.
+            """
+            delay = min(self.backoffMax, self.backoffBase * (2 ** attempt))
+            return random.uniform(delay / 2.0, delay)
+
+        def call(self,fn,description,onError=None):
+            """
+             Ejecuta fn() aplicando la politica de reintentos y regresa su resultado. description identifica la solicitud
+             en el log, onError(e) se llama despues de cada fallo (por ejemplo para cerrar la conexion al dataset remoto).
+             Los errores gfsFatalError no se reintentan. Si se agotan los intentos, o el siguiente intento seria despues de
+             la hora limite de la corrida, se propaga el ultimo error.
+            """
+            for attempt in range(0, self.attempts):
+                self.lastRetries = attempt
+                if self.deadlineExpired():
+                    raise gfsFatalError('Se agoto el tiempo limite de la corrida: ' + description)
+                try:
+                    return fn()
+                except gfsFatalError as e:
+                    log.error(description + ': ' + str(e))
+                    raise
+                except Exception as e:
+                    if onError is not None:
+                        onError(e)
+                    delay = self.getDelay(attempt)
+                    log.warning(description + ': Error: ' + str(e))
+                    if attempt + 1 >= self.attempts:
+                        log.error(description + ': No se pudo realizar la descarga despues de ' + str(self.attempts) + ' intentos')
+                        raise
+                    if self.runDeadline is not None and time.time() + delay >= self.runDeadline:
+                        log.error(description + ': No hay tiempo para otro intento antes del tiempo limite de la corrida')
+                        raise
+                    log.warning(description + ': Reintentando la descarga. attemp: ' + str(attempt) + ' en ' + ('%.1f' % delay) + ' seg.')
+                    time.sleep(delay)
+                    self.waitSeconds = self.waitSeconds + delay
+
+
+
+class runMetrics():
+        """
+         Clase runMetrics
+         Metricas de una corrida de descarga (downloadFNL, downloadGFS). Cada solicitud al servidor remoto (getData,
+         getDataVector) y cada escritura al archivo de salida (saveData) se registra en los registros (records) de la corrida
+         activa del proceso con su latencia, bytes, shape y reintentos. Fuera de una corrida no se registra nada.
+         Los workers de downloadBlocks regresan sus registros al proceso principal.
+         Al terminar la corrida se escribe un reporte JSON y un archivo textfile de Prometheus (writeReport).
+        """
+        # Corrida activa del proceso actual, la ultima que se inicio y no se ha cerrado (close)
+        active = None
+
+        def __init__(self,dataset,retry=None):
+            self.dataset = dataset
+            self.retry = retry
+            self.startTime = time.time()
+            self.records = []
+            runMetrics.active = self
+            self.waitStart = retry.waitSeconds if retry is not None else 0.0
+
+        @staticmethod
+        def record(op,dataset,var,seconds,data=None,retries=0,ok=True):
+            """
+             Registra la solicitud op (getData, getDataVector, saveData) de la variable var del dataset (o archivo) dataset.
+            """
+            if runMetrics.active is None:
+                return
+            runMetrics.active.records.append({'op' : op, 'dataset' : dataset, 'var' : var, 'seconds' : seconds,
+                                              'bytes' : len(data) if isinstance(data, bytes) else int(getattr(data, 'nbytes', 0)),
+                                              'shape' : list(np.shape(data)) if data is not None and not isinstance(data, bytes) else [],
+                                              'retries' : retries, 'ok' : ok})
+
+        @staticmethod
+        def extend(records):
+            """
+             Agrega a la corrida activa los registros de un worker de downloadBlocks.
+            """
+            if runMetrics.active is not None:
+                runMetrics.active.records.extend(records)
+
+        def close(self):
+            """
+             Termina la corrida, las solicitudes siguientes del proceso ya no se registran en ella.
+            """
+            if runMetrics.active is self:
+                runMetrics.active = None
+
+        def summary(self,output=None):
+            """
+             Resumen de la corrida: totales por operacion, solicitudes por segundo y MB/s de la descarga.
+            """
+            seconds = time.time() - self.startTime
+            ops = {}
+            for r in self.records:
+                op = ops.setdefault(r['op'], {'requests' : 0, 'failures' : 0, 'bytes' : 0, 'seconds' : 0.0, 'retries' : 0})
+                op['requests'] = op['requests'] + 1
+                op['failures'] = op['failures'] + (0 if r['ok'] else 1)
+                op['bytes'] = op['bytes'] + r['bytes']
+                op['seconds'] = op['seconds'] + r['seconds']
+                op['retries'] = op['retries'] + r['retries']
+            remote = [ ops[o] for o in ops.keys() if o != 'saveData' ]
+            requests = sum([ o['requests'] for o in remote ])
+            nbytes = sum([ o['bytes'] for o in remote ])
+            return {'dataset' : self.dataset, 'output' : output, 'success' : output is not None,
+                    'start' : dt.datetime.fromtimestamp(self.startTime).isoformat(), 'seconds' : seconds,
+                    'requests' : requests, 'bytes' : nbytes,
+                    'requests_per_second' : requests / max(seconds, 1e-6), 'mb_per_second' : nbytes / 1e6 / max(seconds, 1e-6),
+                    'retry_wait_seconds' : (self.retry.waitSeconds - self.waitStart) if self.retry is not None else 0.0, 'operations' : ops}
+
+        def writeReport(self,reportdir,output=None):
+            """
+             Escribe el reporte de la corrida en reportdir: <dataset>_<fecha>.json con el resumen y todos los registros,
+             y gfsdownload_<dataset>.prom (formato textfile de Prometheus) con el resumen de la ultima corrida.
+             Regresa el resumen.
+            """
+            summary = self.summary(output)
+            if not os.path.exists(reportdir):
+                os.makedirs(reportdir)
+            stamp = dt.datetime.fromtimestamp(self.startTime).strftime('%Y%m%d_%H%M%S')
+            reportFile = os.path.join(reportdir, self.dataset + '_' + stamp + '.json')
+            with open(reportFile + '.tmp', 'w') as f:
+                json.dump(dict(summary, records=self.records), f, indent=1)
+            os.replace(reportFile + '.tmp', reportFile)
+
+            label = 'dataset="' + self.dataset + '"'
+            lines = []
+            def metric(name, help, samples):
+                lines.append('# HELP gfsdownload_' + name + ' ' + help)
+                lines.append('# TYPE gfsdownload_' + name + ' gauge')
+                for labels, value in samples:
+                    lines.append('gfsdownload_' + name + '{' + labels + '} ' + repr(float(value)))
+            metric('last_run_timestamp_seconds', 'Inicio de la ultima corrida.', [(label, self.startTime)])
+            metric('last_run_success', 'La ultima corrida termino correctamente (1) o fallo (0).', [(label, summary['success'])])
+            metric('run_seconds', 'Duracion de la corrida.', [(label, summary['seconds'])])
+            metric('retry_wait_seconds', 'Segundos de espera entre reintentos.', [(label, summary['retry_wait_seconds'])])
+            metric('requests_per_second', 'Solicitudes al servidor remoto por segundo.', [(label, summary['requests_per_second'])])
+            metric('megabytes_per_second', 'MB descargados por segundo.', [(label, summary['mb_per_second'])])
+            ops = summary['operations']
+            for key in ('requests', 'failures', 'bytes', 'seconds', 'retries'):
+                metric('operation_' + key, 'Total de ' + key + ' por operacion en la corrida.',
+                       [ (label + ',op="' + o + '"', ops[o][key]) for o in sorted(ops.keys()) ])
+            promFile = os.path.join(reportdir, 'gfsdownload_' + self.dataset + '.prom')
+            # El colector textfile lee los archivos .prom, se escribe a un temporal y se renombra
+            with open(promFile + '.tmp', 'w') as f:
+                f.write('\n'.join(lines) + '\n')
+            os.replace(promFile + '.tmp', promFile)
+            return summary
+
+
+
+class gfsName(gfsConfig):
+        """
+         Clase gfsName hija de gfsConfig
+         Se encarga de generar el url con el nombre del dataset gfs o fnl en base a la
+         fecha y el numero de corrida de GFS.
+        """
+
+        def getrootURL(self):
+                return self.getConfigValue('url')
+
+
+        def getURLName(self, time, gfs_run_time, gfstype):
+                """
+                 Time es un dato fecha <python datetime>, gfs_run_time especifica que dataset runtime (0 = 00z, 6 =06z, etc)
+                 gfstype, es el dataset que se busca, puede ser 'gfs_hd' o 'fnl'
+                """
+                gfsname = ''
+                if gfstype == 'gfs_hd':  # 1
+                    gfsname = 'gfs_hd/gfs_hd'
+                    gfsname1='gfs_hd'
+                elif gfstype == 'gfs_0p50':
+                    gfsname = 'gfs_0p50/gfs'
+                    gfsname1 = 'gfs_0p50'
+                elif gfstype == 'gfs_0p25':
+                    gfsname = 'gfs_0p25/gfs'
+                    gfsname1 = 'gfs_0p25'
+                else:
+                    gfsname = 'fnl/fnl'  # 0
+                    gfsname1='fnlflx'
+                strdate = "%d%02d%02d" % (time.year,time.month,time.day)
+                gfsdir = self.getrootURL() + '/dods/' + gfsname + strdate + '/'
+                fname = gfsdir + gfsname1 + '_' + ("%02d"%gfs_run_time) + 'z'
+                return fname
+
+
+
+class gfsSubgrid(gfsConfig):
+        """
+         Clase gfsSubgrid hija de gfsConfig
+         Esta clase se encarga de obtener los indices que corresponden a los parametros
+         latmin, lonmin, latmax, lonmax.
+         Tambien obtiene las latitudes y longitudes de uno de los datasets que se provean.
+        """
+        longitudes = None
+        irange = None
+
+        latitudes = None
+        jrange = None
+
+        # Tamano (lat, lon) de la malla completa del dataset, y si la submalla se leyo del cache local
+        gridShape = None
+        fromCache = False
+
+        # Indices de la submalla en los datos descargados con la submalla que la contiene (ver getRegionSubgrid)
+        islice = slice(None)
+        jslice = slice(None)
+
+        # Niveles de las variables 4D (ver getGFSlevels): {var : indices en la coordenada lev} y {var : niveles}
+        levelIndexes = {}
+        levels = {}
+
+
+        def getGFSgrid_default(self,fname,gfstype=None,useCache=True,readCoords=None,source=None):
+            """
+             Regresa los indices para los valores lonmin lonmax latmin latmax
+             leidos del archivo de configuracion (DEFAULT), la region que cubre todas las regiones configuradas.
+            """
+            lonmin, lonmax, latmin, latmax = self.getRegionBounds()
+            return self.getGFSgrid(fname, lonmin, lonmax, latmin, latmax, gfstype, useCache, readCoords, source)
+
+        def getRegionSubgrid(self,lonmin,lonmax,latmin,latmax):
+            """
+             Submalla de la region lonmin lonmax latmin latmax recortada de esta submalla, que debe cubrir la region,
+             con el mismo margen que getGFSgrid. Regresa un gfsSubgrid con sus longitudes y latitudes, y en islice, jslice
+             los indices de la region en los datos descargados con esta submalla. Regresa None si la region esta fuera.
+            """
+            dl=1;
+            i = np.where((self.longitudes>=lonmin-dl) & (self.longitudes<=lonmax+dl))[0]
+            j = np.where((self.latitudes>=latmin-dl) & (self.latitudes<=latmax+dl))[0]
+            if i.size == 0 or j.size == 0:
+                log.warning('getRegionSubgrid: La region ' + str([lonmin, lonmax, latmin, latmax]) + ' esta fuera de la submalla descargada')
+                return None
+            region = gfsSubgrid()
+            region.islice = slice(i[0], i[-1]+1)
+            region.jslice = slice(j[0], j[-1]+1)
+            region.longitudes = self.longitudes[region.islice]
+            region.latitudes = self.latitudes[region.jslice]
+            region.gridShape = self.gridShape
+            region.levelIndexes = self.levelIndexes
+            region.levels = self.levels
+            return region
+
+        def getGFSlevels(self,lev,lVars):
+            """
+             Obtiene los indices en la coordenada lev del dataset de los niveles de cada variable 4D de lVars (grupo 'levels'
+             del archivo de configuracion), en el orden del dataset, para descargar solo esos niveles.
+             Regresa 0 si alguno de los niveles no existe en el dataset.
+            """
+            self.levelIndexes = {}
+            self.levels = {}
+            for v in lVars:
+                values = self.getLevelValues(v)
+                if values is None:
+                    continue
+                index = []
+                for l in values:
+                    k = np.where(np.isclose(lev, l))[0]
+                    if k.size == 0:
+                        log.error('getGFSlevels: El nivel ' + str(l) + ' de la variable ' + v + ' no existe en el dataset, niveles: ' + str(list(lev)))
+                        return 0
+                    index.append(k[0])
+                self.levelIndexes[v] = np.unique(index)
+                self.levels[v] = np.asarray(lev)[self.levelIndexes[v]]
+            return 1
+
+        def getVarShape(self,var,ntimes):
+            """
+             Tamano de la variable var descargada con la submalla: [time, lat, lon], o [time, lev, lat, lon] si es 4D.
+            """
+            return [ntimes] + ([self.levels[var].size] if var in self.levels else []) + [self.latitudes.size, self.longitudes.size]
+
+        def getRegionKey(self,gfstype,lonmin,lonmax,latmin,latmax):
+            """
+             Llave que identifica al tipo de dataset gfstype (fnl, gfs_0p25, etc) y la region, usada en los nombres de
+             los archivos locales (cache de la submalla, almacen de ciclos FNL).
+            """
+            return '%s_%g_%g_%g_%g' % (gfstype, lonmin, lonmax, latmin, latmax)
+
+        def getRegionKey_default(self,gfstype):
+            """
+             Llave de la region lonmin lonmax latmin latmax leida del archivo de configuracion (DEFAULT)
+            """
+            lonmin, lonmax, latmin, latmax = self.getRegionBounds()
+            return self.getRegionKey(gfstype, lonmin, lonmax, latmin, latmax)
+
+        def getCacheFile(self,gfstype,lonmin,lonmax,latmin,latmax):
+            """
+             Nombre del archivo del cache local de la submalla, para el tipo de dataset gfstype (fnl, gfs_0p25, etc) y la region.
+             Regresa None si no se especifica gfstype o no esta configurada la llave 'cachedir'.
+            """
+            cachedir = self.getConfigValueOpt('cachedir').strip()
+            if gfstype is None or cachedir == '':
+                return None
+            return os.path.join(cachedir, 'subgrid_' + self.getRegionKey(gfstype, lonmin, lonmax, latmin, latmax) + '.npz')
+
+        def readCache(self,cacheFile,source=None):
+            """
+             Lee las longitudes, latitudes e indices de la submalla del cache local. Regresa True si existe el cache.
+             Si se indica source (el origen de la malla, ver writeCache) y el cache es de otro origen, no se usa.
+            """
+            if not os.path.exists(cacheFile):
+                return False
+            try:
+                with np.load(cacheFile) as cache:
+                    cacheSource = str(cache['source']) if 'source' in cache.files else ''
+                    if source is not None and cacheSource != source:
+                        log.warning('readCache: El cache de la submalla ' + cacheFile + ' es de otra malla (' + cacheSource
+                                    + '), se vuelve a calcular.')
+                        return False
+                    self.longitudes = cache['longitudes']
+                    self.latitudes = cache['latitudes']
+                    self.irange = cache['irange']
+                    self.jrange = cache['jrange']
+                    self.gridShape = tuple(cache['gridShape'])
+            except Exception as e:
+                log.warning('readCache: No se pudo leer el cache de la submalla ' + cacheFile + ': ' + str(e))
+                return False
+            log.info('readCache: Submalla leida del cache local ' + cacheFile)
+            return True
+
+        def writeCache(self,cacheFile,source=None):
+            """
+             Guarda las longitudes, latitudes e indices de la submalla en el cache local, con el tamano de la malla y su
+             origen source (p. ej. el patron del URL de los archivos GRIB2, que identifica el producto y la resolucion).
+            """
+            try:
+                if not os.path.exists(os.path.dirname(cacheFile)):
+                    os.makedirs(os.path.dirname(cacheFile))
+                # Se escribe a un archivo temporal y se renombra, para no dejar caches incompletos
+                with open(cacheFile + '.tmp', 'wb') as f:
+                    np.savez(f, longitudes=self.longitudes, latitudes=self.latitudes, irange=self.irange,
+                             jrange=self.jrange, gridShape=np.array(self.gridShape), source=np.array(source or ''))
+                os.replace(cacheFile + '.tmp', cacheFile)
+            except Exception as e:
+                log.warning('writeCache: No se pudo guardar el cache de la submalla ' + cacheFile + ': ' + str(e))
+
+        def checkGridShape(self,dst):
+            """
+             Verifica que el tamano (lat, lon) de la malla del dataset abierto dst coincida con el de la submalla.
+            """
+            return (dst.dimensions['lat'].size, dst.dimensions['lon'].size) == tuple(self.gridShape)
+
+        def getGFSgrid(self,fname,lonmin,lonmax,latmin,latmax,gfstype=None,useCache=True,readCoords=None,source=None):
+            # Las coordenadas (lon, lat) se leen del dataset OPeNDAP fname, a menos que se indique la funcion readCoords()
+            # (motor GRIB2), que se encarga de sus propios reintentos. source es el origen de la malla que se guarda en el
+            # cache local, un cache de otro origen no se usa (ver readCache).
+            # La malla de cada tipo de dataset no cambia, si existe el cache local de la submalla
+            # no es necesario descargar las coordenadas del dataset remoto
+            cacheFile = self.getCacheFile(gfstype, lonmin, lonmax, latmin, latmax)
+            self.fromCache = False
+            if cacheFile is not None and useCache and self.readCache(cacheFile, source):
+                self.fromCache = True
+                return 1
+
+            dl=1;
+            lonmin=lonmin-dl
+            lonmax=lonmax+dl
+            latmin=latmin-dl
+            latmax=latmax+dl
+            def readDataset():
+                dataset = nc.Dataset(fname,'r')
+                try:
+                    return dataset.variables['lon'][:], dataset.variables['lat'][:]
+                finally:
+                    dataset.close()
+
+            try:
+                if readCoords is not None:
+                    lon, lat = readCoords()
+                else:
+                    lon, lat = self.getRetryPolicy().call(readDataset, 'getGFSgrid: ' + fname)
+            except Exception as e:
+                log.warning('getGFSgrid: No se encontro el dataset: ' + fname)
+                return 0
+            self.gridShape = (lat.size, lon.size)
+
+            # Obtener la sub malla
+            # 1. Longitud, (lidiar con greenwitch)
 
             i1 = np.where((lon-360>=lonmin) & (lon-360<=lonmax))[0]
             i2 = np.where((lon>=lonmin) & (lon<=lonmax))[0]
             i3 = np.where((lon+360>=lonmin) & (lon+360<=lonmax))[0]
 
-            self.longitudes=np.concatenate(((lon[i1]-360 if i1.size>0 else []) ,
-                                            (lon[i2] if i2.size>0 else []) ,
-                                            (lon[i3]+360) if i3.size>0 else [] ),axis=0)
+            self.longitudes=np.concatenate(((lon[i1]-360 if i1.size>0 else []) ,
+                                            (lon[i2] if i2.size>0 else []) ,
+                                            (lon[i3]+360) if i3.size>0 else [] ),axis=0)
+
+            # Cada grupo i1, i2, i3 es un rango contiguo de indices. Si la region cruza el meridiano 0/360 (o 180/-180)
+            # hay mas de un rango, y irange es un arreglo de rangos [[i0,i1],[i0,i1]] en el mismo orden que las longitudes.
+            segments = [ [np.min(i),np.max(i)+1] for i in (i1,i2,i3) if i.size > 0 ]
+            if len(segments) == 1:
+                self.irange = np.array(segments[0])
+            else:
+                log.info('getGFSgrid: La submalla cruza el meridiano de la malla, se descarga en los segmentos: ' + str(segments))
+                self.irange = np.array(segments)
+
+            # 2. Latitud
+            j = np.where((lat>=latmin)& (lat<=latmax))
+            self.latitudes = lat[j]
+
+            jmin=np.min(j)
+            jmax=np.max(j)
+            self.jrange = np.array([jmin,jmax+1])
+
+            if cacheFile is not None:
+                self.writeCache(cacheFile, source)
+            return 1
+
+
+class gribEngine(gfsConfig):
+        """
+         Clase gribEngine hija de gfsConfig
+         Motor de descarga alternativo a OPeNDAP, con los archivos GRIB2 de GFS (pgrb2) y su inventario .idx.
+         Por cada hora de pronostico se lee el inventario, se piden con HTTP Range solo los registros de las variables
+         configuradas (los registros contiguos en una sola solicitud), y se decodifican con eccodes y se recortan a la submalla.
+         Su configuracion esta en el grupo 'grib' del archivo de configuracion.
+        """
+        # Nivel del registro del inventario segun el sufijo del nombre de la variable de GrADS (ugrd10m -> UGRD:10 m above ground)
+        LEVELS = [('10m', '10 m above ground'), ('2m', '2 m above ground'), ('sfc', 'surface'), ('clm', 'entire atmosphere'),
+                  ('msl', 'mean sea level')]
+
+        def getGribValue(self,option,default=''):
+            """
+             Devuelve la opcion "option" del grupo 'grib', si no existe regresa default.
+            """
+            if not self.configData.has_option('grib', option):
+                return default
+            return self.getKeyValue('grib', option).strip()
+
+        def getHours(self):
+            """
+             Horas de pronostico que se descargan, opcion fhours = inicio, fin, paso (default 0, 384, 3).
+            """
+            h0, h1, step = [ int(h) for h in self.getGribValue('fhours', '0, 384, 3').split(',') ]
+            return list(range(h0, h1 + 1, step))
+
+        def getFileURL(self,date,run_time,hour,gfstype):
+            """
+             URL del archivo GRIB2 del dataset gfstype, de la fecha date, run_time y hora de pronostico hour.
+             El nombre del archivo es la opcion <gfstype> del grupo 'grib', con {date} (YYYYMMDD), {run} (HH) y {fhour} (FFF).
+            """
+            pattern = self.getGribValue(gfstype)
+            if pattern == '':
+                raise gfsFatalError('No esta configurado el archivo GRIB2 del dataset ' + gfstype + ' (grupo grib)')
+            return self.getGribValue('url') + '/' + pattern.format(date=date.strftime('%Y%m%d'), run='%02d' % run_time, fhour='%03d' % hour)
+
+        def indexExists(self,url):
+            """
+             Verifica si existe el inventario del archivo GRIB2 url, con un tiempo limite 'probetimeout' (seg.)
+            """
+            try:
+                with urlopen(url + '.idx', timeout=self.getConfigValueInt('probetimeout', 30)) as response:
+                    return len(response.read(64)) > 0
+            except Exception as e:
+                log.debug('indexExists: ' + url + ' : ' + str(e))
+                return False
+
+        def getRecordKey(self,var):
+            """
+             Registro del inventario (PARAMETRO:nivel) de la variable var. Se puede indicar en el grupo 'grib' como
+             <var> = PARAMETRO:nivel, si no se deduce del nombre de la variable de GrADS.
+            """
+            key = self.getGribValue(var)
+            if key != '':
+                return key
+            for suffix, level in self.LEVELS:
+                if var.endswith(suffix):
+                    return var[:-len(suffix)].upper() + ':' + level
+            raise gfsFatalError('No se conoce el registro GRIB2 de la variable ' + var + ', agregarlo al grupo grib')
+
+        @staticmethod
+        def parseIndex(text):
+            """
+             Lee el inventario .idx (lineas n:offset:d=fecha:PARAMETRO:nivel:pronostico:), regresa una <python list> con
+             (offset, 'PARAMETRO:nivel') de cada registro, en el orden del archivo.
+            """
+            records = []
+            for line in text.splitlines():
+                fields = line.split(':')
+                if len(fields) >= 5:
+                    records.append((int(fields[1]), fields[3] + ':' + fields[4]))
+            return records
+
+        def getRanges(self,records,lVars):
+            """
+             Rangos de bytes de los registros de las variables lVars en el inventario records (parseIndex). Los registros
+             separados por menos de 'gap' bytes (opcion del grupo grib) se piden en una sola solicitud.
+             Regresa una <python list> de [inicio, fin, [(var, inicio, fin), ...]], fin es None para el ultimo registro del
+             archivo. Las variables que no estan en el inventario (p. ej. promedios en la hora 0) no aparecen.
+            """
+            keys = {}
+            for v in lVars:
+                keys.setdefault(self.getRecordKey(v), []).append(v)
+            found = []
+            for n in range(len(records)):
+                offset, key = records[n]
+                if key in keys:
+                    end = records[n+1][0] - 1 if n + 1 < len(records) else None
+                    # Solo el primer registro de cada variable
+                    for v in keys.pop(key):
+                        found.append((v, offset, end))
+            gap = int(self.getGribValue('gap', '0'))
+            ranges = []
+            for v, start, end in found:
+                if len(ranges) > 0 and ranges[-1][1] is not None and start - ranges[-1][1] - 1 <= gap:
+                    ranges[-1][1] = max(ranges[-1][1], end) if end is not None else None
+                    ranges[-1][2].append((v, start, end))
+                else:
+                    ranges.append([start, end, [(v, start, end)]])
+            return ranges
+
+        @staticmethod
+        def decodeRecord(buf):
+            """
+             Decodifica un registro GRIB2 (malla regular lat-lon). Regresa (valores 2D [lat, lon] con las latitudes de
+             sur a norte como en OPeNDAP, longitudes, latitudes). Los puntos faltantes del bitmap quedan enmascarados.
+            """
+            gid = eccodes.codes_new_from_message(buf)
+            try:
+                ni = eccodes.codes_get(gid, 'Ni')
+                nj = eccodes.codes_get(gid, 'Nj')
+                values = eccodes.codes_get_values(gid).reshape(nj, ni)
+                if eccodes.codes_get(gid, 'bitmapPresent'):
+                    values = np.ma.masked_equal(values, eccodes.codes_get(gid, 'missingValue'))
+                lon = eccodes.codes_get(gid, 'longitudeOfFirstGridPointInDegrees') + np.arange(ni) * eccodes.codes_get(gid, 'iDirectionIncrementInDegrees')
+                lat = np.linspace(eccodes.codes_get(gid, 'latitudeOfFirstGridPointInDegrees'), eccodes.codes_get(gid, 'latitudeOfLastGridPointInDegrees'), nj)
+            finally:
+                eccodes.codes_release(gid)
+            if lat[0] > lat[-1]:
+                values = values[::-1,:]
+                lat = lat[::-1]
+            return values, lon, lat
+
+        @staticmethod
+        def cropRecord(values,irange,jrange):
+            """
+             Recorta los valores 2D [lat, lon] de un registro a la submalla irange, jrange (gfsSubgrid).
+             Si la submalla no cabe en la malla del registro (p. ej. un cache de la submalla de otra resolucion), es un
+             error gfsFatalError.
+            """
+            imax = max([ i[1] for i in irange ]) if np.ndim(irange) == 2 else irange[1]
+            if jrange[1] > values.shape[0] or imax > values.shape[1]:
+                raise gfsFatalError('La submalla no corresponde a la malla ' + str(values.shape) + ' del registro GRIB2, '
+                                    + 'borrar el cache de la submalla (llave cachedir)')
+            values = values[jrange[0]:jrange[1],:]
+            if np.ndim(irange) == 2:
+                # Submalla que cruza el meridiano, un segmento de longitudes por rango
+                return np.ma.concatenate([ values[:,i[0]:i[1]] for i in irange ], axis=1)
+            return values[:,irange[0]:irange[1]]
+
+        @staticmethod
+        def getTimeValue(date):
+            """
+             Valor de tiempo de la fecha date en las unidades de la salida (gfsData.timeUnits, segundos desde 1970-01-01).
+            """
+            return (date - dt.datetime(1970, 1, 1)).total_seconds()
+
+
+
+class gfsData(gfsConfig):
+            """
+             Esta clase contiene los metodos para consultar y descargar variables de los datasets FNL y GFS_HD junto a sus
+             variables de dimension.
+             Contiene metodos para guardar esta informacion en archivos netcdf con la convencion CF.
+             Los metodos principales para descargar FNL y GFS, usan la clase gfsConfig para leer del archivo de configuracion
+             la region, y variables que interesa descargar.
+             Metodos : downloadFNL y downloadGFS_HD
+            """
+
+            gfs_run_time_GFS = None
+            gfs_date_GFS = None
+
+            current_remote_dataset_name = None
+            current_remote_dataset = None
+
+            # Instancia gfsData de cada proceso worker del motor de descarga (downloadBlocks)
+            processWorker = None
+            # Numero de workers de la instancia, si no es None se usa en lugar de la llave 'workers' (ver getWorkers)
+            workers = None
+            # Pool de procesos compartido por varias descargas (newProcessPool), None = cada descarga crea el suyo
+            pool = None
+            # Directorio de salida de la instancia, si no es None se usa en lugar de la llave 'outdir' (ver getOutputDir)
+            outdir = None
+            # Motor GRIB2 (ver getGribEngine)
+            grib = None
+            # _FillValue de las variables de salida
+            fillValue = 9.999e+20
+            # Unidades del tiempo de la salida, y el dia 1970-01-01 en el tiempo de los datasets de NOMADS (GrADS,
+            # days since 1-1-1, que viene con un dia de desfase)
+            timeUnits = 'seconds since 1970-01-01 00:00:00'
+            gradsEpoch = 719165.0
+
+            def __init__(self):
+                # Submallas de FNL y GFS de la instancia, no se comparten con otras instancias
+                self.gridFNL = gfsSubgrid()
+                self.gridGFS_HD = gfsSubgrid()
+
+            def __del__(self):
+                # Cerrar la conexion a un dataset remoto si es que esta activo
+                self.closeRemoteDataset()
+
+            def closeRemoteDataset(self):
+                """
+                 Cierra la conexion al dataset remoto activo, si es que existe.
+                """
+                if self.current_remote_dataset:
+                    self.current_remote_dataset.close()
+                self.current_remote_dataset = None
+                self.current_remote_dataset_name = None
+
+            def findForecast(self,gfstype='gfs_hd'):
+                """
+                 Verifica si esta disponible un forecast, buscando desde el run time 18z de (hoy - 12 horas) hacia atras
+                 hasta 8 dias. Los ciclos candidatos se verifican al mismo tiempo (findDataset).
+                 Regresa el nombre del dataset mas reciente, o '' si no se encontro ninguno.
+                """
+                dataURL = gfsName()
+                today = dt.datetime.today()
+
+                # Run time que se busca idealmente
+                gfs_date0 = today - dt.timedelta(days=0.5)
+                gfs_date= gfs_date0 ;
+                candidates = []
+                while gfs_date >= (gfs_date0 - dt.timedelta(days=8)):
+                    for gfs_run_time in (18, 12, 6, 0):
+                        candidates.append(dataURL.getURLName(gfs_date, gfs_run_time, gfstype))
+                    gfs_date = gfs_date - dt.timedelta(days=1)
+
+                found = self.findDataset(candidates)
+                if found < 0:
+                    log.warning('No se encontro ningun dataset de GFS!')
+                    return ''
+                log.info('Se encontro el dataset! (' + candidates[found] + ')')
+                return candidates[found]
+
+            def getTimeBlocks(self,ntimes,tblock=None):
+                """
+                 Divide la dimension temporal [0:ntimes] en bloques de tblock pasos, para pedir cada variable
+                 en pocas solicitudes en lugar de una solicitud por paso de tiempo.
+                 Si no se especifica tblock se lee la llave 'tblock' del archivo de configuracion,
+                 0 (o un valor mayor a ntimes) regresa un solo bloque con toda la dimension temporal.
+                 Regresa una <python list> con los rangos [t0,t1]
+                """
+                if tblock is None:
+                    tblock = self.getConfigValueInt('tblock', 1)
+                if tblock <= 0 or tblock > ntimes:
+                    tblock = ntimes
+                return [ [t0, min(t0 + tblock, ntimes)] for t0 in range(0, ntimes, tblock) ]
+
+            def getTimeRequests(self,indexes,tblock=None):
+                """
+                 Convierte los indices de tiempo indexes (en orden) en el minimo de solicitudes con paso constante (hyperslab
+                 con stride de OPeNDAP), cada una dividida en bloques de tblock pasos (getTimeBlocks).
+                 Cada solicitud llena posiciones consecutivas de la salida, asi que los indices se parten en tramos consecutivos
+                 de indexes. Tomar cada vez el tramo mas largo con paso constante da el minimo de solicitudes: lo que queda es
+                 una parte final de lo que quedaria con un tramo mas corto, y nunca necesita mas tramos. No se buscan pasos
+                 intercalados: [0,2,3,4,6] son 3 solicitudes ([0,2], [3,4], [6]) aunque [0,2,4,6] y [3] serian 2, porque sus
+                 posiciones en la salida no son consecutivas.
+                 Regresa una <python list> de tuplas ([t0,t1,paso], posicion del bloque en la salida).
+                """
+                # Rangos [posicion, primer indice, ultimo indice, paso] con paso constante
+                runs = []
+                for n in range(len(indexes)):
+                    t = int(indexes[n])
+                    if len(runs) > 0 and runs[-1][3] is None:
+                        runs[-1][2:4] = [t, t - runs[-1][1]]
+                    elif len(runs) > 0 and t - runs[-1][2] == runs[-1][3]:
+                        runs[-1][2] = t
+                    else:
+                        runs.append([n, t, t, None])
+                requests = []
+                for pos, first, last, step in runs:
+                    step = step if step is not None else 1
+                    for b0, b1 in self.getTimeBlocks((last - first) // step + 1, tblock):
+                        requests.append(([first + b0*step, first + (b1-1)*step + 1, step], pos + b0))
+                return requests
+
+            def getHourIndexes(self,timeVar,fhours,reftime=None):
+                """
+                 Indices de los registros de timeVar (segundos) que corresponden a las horas de pronostico de la seleccion
+                 fhours (parseHours). Las horas se cuentan desde reftime, el tiempo del ciclo de la corrida (segundos); si no
+                 se especifica, el primer registro es la hora 0 del pronostico. Si fhours es vacio se regresan todos.
+                """
+                if fhours.strip() == '':
+                    return np.arange(timeVar.size)
+                if reftime is None:
+                    reftime = timeVar[0]
+                hours = np.rint((np.asarray(timeVar) - reftime) / 3600).astype(int)
+                return np.where(np.isin(hours, self.parseHours(fhours)))[0]
+
+            def getWorkers(self):
+                """
+                 Numero de workers para el motor de descarga concurrente, llave 'workers' del archivo de configuracion.
+                 Si no existe la llave se descarga con un solo worker (modo secuencial).
+                 El atributo workers de la instancia tiene prioridad sobre la llave, asi varias descargas que corren al
+                 mismo tiempo se reparten un total de conexiones (ver raw_download_backfill.py).
+                """
+                if self.workers is not None:
+                    return max(1, int(self.workers))
+                return max(1, self.getConfigValueInt('workers', 1))
+
+            def downloadBlocks(self,tasks,irange,jrange,storeData,retries=0,fetch=None,levels=None):
+                """
+                 Motor de descarga concurrente.
+                 tasks es una <python list> de tuplas (fname, var, trange, tpos), donde trange es el rango [t0,t1] (o [t0,t1,paso])
+                 que se pide al dataset fname y tpos el indice de tiempo donde inicia el bloque en la salida. Si trange es None la variable
+                 se descarga completa como vector 1D (getDataVector). var tambien puede ser una lista de variables del mismo
+                 dataset, en ese caso la tarea regresa un <python dict> {var : data}.
+                 Las tareas se reparten entre 'workers' procesos, cada worker es una instancia gfsData con su propia conexion
+                 al dataset remoto (la libreria netCDF-C no es thread-safe, por eso se usan procesos y no hilos).
+                 Los bloques descargados se entregan en el proceso principal a storeData(task, data),
+                 manteniendo como maximo 2*workers bloques en memoria.
+                 Cada solicitud se reintenta con la politica retryPolicy, y una tarea que falla se vuelve a encolar sola
+                 hasta retries veces antes de abortar la descarga (excepto los errores gfsFatalError).
+                 Regresa un <python dict> con el numero de solicitudes, bytes, segundos de la descarga y segundos de espera
+                 en reintentos (retrywait), si falla alguna tarea se propaga la excepcion.
+                 fetch es el metodo estatico que descarga cada tarea, por default fetchBlock (OPeNDAP).
+                 levels son los indices de los niveles de las variables 4D ({var : indices}, gfsSubgrid.levelIndexes).
+                """
+                if fetch is None:
+                    fetch = gfsData.fetchBlock
+                nworkers = min(self.getWorkers(), max(1, len(tasks)))
+                stats = {'requests' : 0, 'bytes' : 0, 'seconds' : 0.0, 'retrywait' : 0.0}
+                policy = self.getRetryPolicy()
+                startTime = time.time()
+                waitStart = policy.waitSeconds
+                failures = {}
+
+                def store(task, data):
+                    storeData(task, data)
+                    stats['requests'] = stats['requests'] + 1
+                    for d in (data.values() if isinstance(data, dict) else [data]):
+                        if d is not None:
+                            stats['bytes'] = stats['bytes'] + d.nbytes
+
+                def retry(ntask, task, e):
+                    # Regresa True si la tarea ntask todavia tiene reintentos disponibles
+                    failures[ntask] = failures.get(ntask, 0) + 1
+                    if failures[ntask] > retries or isinstance(e, gfsFatalError) or policy.deadlineExpired():
+                        return False
+                    log.warning('downloadBlocks: Fallo la tarea ' + str(task[0]) + ' ' + str(task[1]) + ', reintento '
+                                + str(failures[ntask]) + ' de ' + str(retries) + '. Error: ' + str(e))
+                    return True
+
+                if nworkers == 1:
+                    for ntask, task in enumerate(tasks):
+                        while True:
+                            try:
+                                data = fetch(task, irange, jrange, self, levels)
+                                break
+                            except Exception as e:
+                                if not retry(ntask, task, e):
+                                    raise
+                        store(task, data)
+                else:
+                    log.info('downloadBlocks: Descargando ' + str(len(tasks)) + ' bloques con ' + str(nworkers) + ' workers')
+                    # El pool de la instancia (atributo pool) lo comparten varias descargas y no se cierra aqui
+                    pool = self.pool if self.pool is not None else gfsData.newProcessPool(nworkers)
+                    pending = {}
+                    taskIter = enumerate(tasks)
+                    try:
+                        while True:
+                            # Mantener la cola de bloques en vuelo acotada
+                            for ntask, task in taskIter:
+                                pending[pool.submit(gfsData.fetchBlockProcess, task, irange, jrange, fetch, levels, policy.runDeadline)] = (ntask, task)
+                                if len(pending) >= 2 * nworkers:
+                                    break
+                            if not pending:
+                                break
+                            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                            for fut in done:
+                                ntask, task = pending.pop(fut)
+                                try:
+                                    data, waitSeconds, records = fut.result()
+                                except Exception as e:
+                                    policy.waitSeconds = policy.waitSeconds + getattr(e, 'retryWait', 0.0)
+                                    runMetrics.extend(getattr(e, 'records', []))
+                                    if not retry(ntask, task, e):
+                                        raise
+                                    pending[pool.submit(gfsData.fetchBlockProcess, task, irange, jrange, fetch, levels, policy.runDeadline)] = (ntask, task)
+                                    continue
+                                # Espera en reintentos y metricas de las solicitudes del worker
+                                policy.waitSeconds = policy.waitSeconds + waitSeconds
+                                runMetrics.extend(records)
+                                store(task, data)
+                    finally:
+                        if pool is self.pool:
+                            # Las tareas que quedan de esta descarga se cancelan o se esperan, el pool sigue abierto
+                            for fut in pending:
+                                fut.cancel()
+                            wait(pending)
+                        else:
+                            pool.shutdown(wait=True, cancel_futures=True)
+
+                stats['seconds'] = time.time() - startTime
+                stats['retrywait'] = policy.waitSeconds - waitStart
+                log.info('downloadBlocks: ' + str(stats['requests']) + ' solicitudes, ' + ('%.2f' % (stats['bytes']/1e6)) + ' MB en '
+                         + ('%.1f' % stats['seconds']) + ' seg. (' + ('%.2f' % (stats['bytes']/1e6/max(stats['seconds'],1e-6))) + ' MB/s), '
+                         + ('%.1f' % stats['retrywait']) + ' seg. de espera en reintentos')
+                return stats
+
+            @staticmethod
+            def fetchBlock(task, irange, jrange, worker=None, levels=None):
+                """
+                 Descarga una tarea (fname, var, trange, tpos) de downloadBlocks. Si no se indica worker se usa la
+                 instancia gfsData del proceso actual, que mantiene abierta su conexion al dataset remoto entre tareas.
+                 Si var es una lista, se descargan todas las variables del dataset ('time' como vector 1D) y se regresan
+                 en un <python dict>. De las variables 4D solo se piden los niveles levels[var].
+                """
+                fname, var, trange, tpos = task
+                worker = gfsData.getProcessWorker(worker)
+                levels = levels if levels is not None else {}
+                try:
+                    if isinstance(var, (list, tuple)):
+                        data = {}
+                        for v in var:
+                            if v == 'time' or trange is None:
+                                data[v] = worker.getDataVector(fname, v)
+                            else:
+                                data[v] = worker.getData(fname, v, trange, irange, jrange, levels.get(v))
+                        return data
+                    if trange is None:
+                        return worker.getDataVector(fname, var)
+                    return worker.getData(fname, var, trange, irange, jrange, levels.get(var))
+                except Exception:
+                    # Si la tarea se reintenta, que sea con una conexion nueva al dataset remoto
+                    worker.closeRemoteDataset()
+                    raise
+
+            @staticmethod
+            def getProcessWorker(worker=None):
+                """
+                 Regresa worker, o si no se indica la instancia gfsData del proceso actual.
+                """
+                if worker is None:
+                    if gfsData.processWorker is None:
+                        gfsData.processWorker = gfsData()
+                    worker = gfsData.processWorker
+                return worker
+
+            @staticmethod
+            def newProcessPool(nworkers):
+                """
+                 Crea el pool de nworkers procesos del motor de descarga (downloadBlocks). Se puede asignar al atributo pool
+                 de varias instancias gfsData para que sus descargas lo compartan, quien lo crea lo cierra (shutdown).
+                """
+                return ProcessPoolExecutor(max_workers=nworkers, initializer=gfsData.initProcessWorker,
+                                           initargs=(gfsConfig.getSettings(),))
+
+            @staticmethod
+            def initProcessWorker(settings):
+                """
+                 Inicia un proceso worker de downloadBlocks: instala la configuracion settings (gfsSettings) del proceso
+                 principal, con sus cambios de llaves (--config, --set), y crea su instancia gfsData (getProcessWorker).
+                 Asi no depende de que el proceso se cree con fork.
+                """
+                gfsConfig.settings = settings
+                gfsData.getProcessWorker()
+
+            @staticmethod
+            def fetchBlockProcess(task, irange, jrange, fetch=None, levels=None, deadline=None):
+                """
+                 fetchBlock en un proceso worker de downloadBlocks, con la hora limite deadline de la corrida que pidio la
+                 tarea. Regresa (data, segundos de espera en reintentos, registros de runMetrics) para sumarlos en el proceso
+                 principal, si falla van en los atributos retryWait y records del error.
+                """
+                policy = gfsData.getProcessWorker().getRetryPolicy()
+                policy.runDeadline = deadline
+                waitStart = policy.waitSeconds
+                metrics = runMetrics('worker')
+                try:
+                    data = (fetch if fetch is not None else gfsData.fetchBlock)(task, irange, jrange, None, levels)
+                except Exception as e:
+                    e.retryWait = policy.waitSeconds - waitStart
+                    e.records = metrics.records
+                    raise
+                finally:
+                    metrics.close()
+                return data, policy.waitSeconds - waitStart, metrics.records
+
+            def getGribEngine(self):
+                """
+                 Regresa el motor GRIB2 (gribEngine) de la instancia, se crea en la primera solicitud.
+                """
+                if self.grib is None:
+                    self.grib = gribEngine()
+                return self.grib
+
+            def getGribIndex(self,url):
+                """
+                 Descarga y lee el inventario .idx del archivo GRIB2 url (gribEngine.parseIndex).
+                """
+                def request():
+                    with urlopen(url + '.idx', timeout=self.getConfigValueInt('requesttimeout', 300) or None) as response:
+                        return response.read()
+                return gribEngine.parseIndex(self.callRemote('getGribIndex', url, 'idx', request).decode())
+
+            def getGribRange(self,url,start,end):
+                """
+                 Descarga los bytes [start, end] del archivo GRIB2 url con una solicitud HTTP Range (end None = hasta el final).
+                """
+                byteRange = 'bytes=%d-%s' % (start, '' if end is None else str(end))
+                def request():
+                    with urlopen(Request(url, headers={'Range' : byteRange}), timeout=self.getConfigValueInt('requesttimeout', 300) or None) as response:
+                        buf = response.read()
+                        if response.status != 206:
+                            # El servidor ignoro el rango y regreso el archivo completo
+                            buf = buf[start:None if end is None else end + 1]
+                    return buf
+                return self.callRemote('getGribRange', url, byteRange, request)
+
+            def getGribGrid(self,grid,url,gfstype,lVars):
+                """
+                 Obtiene la submalla grid (gfsSubgrid) con las coordenadas del primer registro de las variables lVars del
+                 archivo GRIB2 url. El cache local de la submalla se guarda como grib_<gfstype>, con el patron del URL de los
+                 archivos (gribEngine.getFileURL) como origen, si cambia el patron (otro producto o resolucion) no se usa el cache.
+                """
+                def readCoords():
+                    ranges = self.getGribEngine().getRanges(self.getGribIndex(url), lVars)
+                    if len(ranges) == 0:
+                        raise gfsFatalError('Ninguna variable se encuentra en el inventario de ' + url)
+                    var, start, end = ranges[0][2][0]
+                    values, lon, lat = gribEngine.decodeRecord(self.getGribRange(url, start, end))
+                    return lon, lat
+                engine = self.getGribEngine()
+                source = engine.getGribValue('url') + '/' + engine.getGribValue(gfstype)
+                return grid.getGFSgrid_default(url, 'grib_' + gfstype, readCoords=readCoords, source=source)
+
+            @staticmethod
+            def fetchGribBlock(task, irange, jrange, worker=None, levels=None):
+                """
+                 Descarga una tarea (url, lVars, [t,t+1], tpos) de downloadBlocks con el motor GRIB2: los registros de las
+                 variables lVars del archivo GRIB2 de una hora de pronostico, recortados a la submalla. Regresa un <python dict>
+                 {var : data[1,lat,lon]}, los puntos faltantes y las variables que no estan en el archivo quedan con el
+                 _FillValue de la salida.
+                """
+                url, lVars, trange, tpos = task
+                worker = gfsData.getProcessWorker(worker)
+                engine = worker.getGribEngine()
+                data = {}
+                for start, end, records in engine.getRanges(worker.getGribIndex(url), lVars):
+                    buf = worker.getGribRange(url, start, end)
+                    for var, s, e in records:
+                        values = gribEngine.decodeRecord(buf[s-start:None if e is None else e-start+1])[0]
+                        data[var] = np.ma.filled(gribEngine.cropRecord(values, irange, jrange).astype('f4'), gfsData.fillValue)[np.newaxis,:,:]
+                ni = sum([ i[1]-i[0] for i in irange ]) if np.ndim(irange) == 2 else irange[1]-irange[0]
+                for var in lVars:
+                    if var not in data:
+                        log.debug('fetchGribBlock: La variable ' + var + ' no esta en el archivo ' + url)
+                        data[var] = np.full((1, jrange[1]-jrange[0], ni), gfsData.fillValue, dtype='f4')
+                return data
+
+            def getRemoteDataset(self,fname):
+                """
+                 Regresa la conexion al dataset remoto fname, si es el mismo dataset de la ultima solicitud
+                 se reutiliza la conexion activa.
+                """
+                if self.current_remote_dataset_name != fname:
+                    dst = nc.Dataset(fname,'r')
+                    log.debug('getRemoteDataset: Abriendo dataset: ' + str(fname))
+                    self.closeRemoteDataset()
+                    self.current_remote_dataset_name = fname
+                    self.current_remote_dataset = dst
+                return self.current_remote_dataset
+
+            def getGrid(self,grid,fname,gfstype):
+                """
+                 Obtiene la submalla grid (gfsSubgrid) del dataset fname. Si la submalla se leyo del cache local,
+                 se verifica el tamano de la malla remota con los metadatos del dataset (la misma conexion que se usa
+                 despues para descargar los datos), y si no coincide se vuelve a calcular desde el dataset remoto.
+                """
+                grid.getGFSgrid_default(fname, gfstype)
+                if grid.fromCache:
+                    try:
+                        dst = self.getRemoteDataset(fname)
+                    except Exception as e:
+                        # El error de conexion se reporta al descargar los datos
+                        return
+                    if not grid.checkGridShape(dst):
+                        log.warning('getGrid: La malla del dataset ' + fname + ' cambio, se invalida el cache de la submalla.')
+                        grid.getGFSgrid_default(fname, gfstype, useCache=False)
+
+            def getLevels(self,grid,fname,lVars):
+                """
+                 Obtiene los indices de los niveles de las variables 4D de lVars en la submalla grid (gfsSubgrid.getGFSlevels),
+                 con la coordenada lev del dataset fname, que solo se descarga si hay variables 4D.
+                 Regresa False si no se pudo leer la coordenada lev o no existe alguno de los niveles.
+                """
+                if not any([ self.getLevelValues(v) is not None for v in lVars ]):
+                    grid.levelIndexes = {}
+                    grid.levels = {}
+                    return True
+                try:
+                    lev = self.getDataVector(fname, 'lev')
+                except Exception as e:
+                    log.error('getLevels: No se pudo leer la coordenada lev del dataset ' + fname + ': ' + str(e))
+                    return False
+                return grid.getGFSlevels(np.ma.filled(lev), lVars) == 1
+
+            @staticmethod
+            def getLevelDim(var):
+                """
+                 Nombre de la dimension (y variable de coordenada) de los niveles de la variable 4D var en la salida.
+                """
+                return 'lev_' + var
+
+            def callRemote(self,op,fname,var,request):
+                """
+                 Ejecuta la solicitud request() de la variable var al dataset remoto fname con la politica de reintentos
+                 (retryPolicy), y registra su latencia, bytes, shape y reintentos en runMetrics con el nombre op.
+                """
+                policy = self.getRetryPolicy()
+                startTime = time.time()
+                data = None
+                try:
+                    data = policy.call(request, op + ': ' + fname + ', var: ' + var, onError=lambda e: self.closeRemoteDataset())
+                    return data
+                finally:
+                    runMetrics.record(op, fname, var, time.time() - startTime, data, policy.lastRetries, data is not None)
+
+            def getDataVector(self,fname,var):
+                """
+                 Funcion que hace la conexion al dataset remoto fname, para descargar una variable 1D
+                 Los fallos se reintentan con la politica de reintentos (retryPolicy), si la variable no existe
+                 en el dataset se lanza gfsFatalError.
+                """
+                def request():
+                    dst = self.getRemoteDataset(fname)
+                    if not (var in dst.variables):
+                        raise gfsFatalError('Variable ' + var + ' no se encuentra en el dataset: ' + fname)
+                    return dst.variables[var][:]
 
-            if i1.size > 0:
-                i1min=np.min(i1)
-                i1max=np.max(i1)
-            else:
-                i1min=np.array([])
-                i1max=np.array([])
+                return self.callRemote('getDataVector', fname, var, request)
 
-            if i2.size > 0:
-                i2min=np.min(i2)
-                i2max=np.max(i2)
-            else:
-                i2min=np.array([])
-                i2max=np.array([])
 
-            if i3.size > 0:
-                i3min=np.min(i3)
-                i3max=np.max(i3)
-            else:
-                i3min=np.array([])
-                i3max=np.array([])
+            def getData(self,fname,var,trange,irange,jrange,levels=None):
+                """
+                 Funcion que hace la conexion al dataset remoto fname, para descargar una variable 3D con los rangos
+                 trange (tiempo, [t0,t1] o [t0,t1,paso]) , irange (longitud) , jrange (latitud)
+                 Las variables 4D (time, lev, lat, lon) requieren levels, los indices de los niveles que se descargan.
+                 Los fallos se reintentan con la politica de reintentos (retryPolicy), si la variable no existe
+                 en el dataset se lanza gfsFatalError.
+                """
+                def request():
+                    dst = self.getRemoteDataset(fname)
+
+                    if not (var in dst.variables):
+                        raise gfsFatalError('Variable ' + var + ' no se encuentra en el dataset: ' + fname)
+                    if dst.variables[var].ndim != (3 if levels is None else 4):
+                        raise gfsFatalError('Variable ' + var + ' tiene ' + str(dst.variables[var].ndim) + ' dimensiones en el dataset: '
+                                            + fname + ', las variables 4D requieren sus niveles en el grupo levels')
+                    # Nota: el orden de las dimensiones son time,   (lev),    latitudes, longitudes
+                    #                                       trange  levels    jrange     irange
+                    log.debug('getData: Solicitando: ' + str(var) + ' ' + str(trange) + ' ' + str(levels) + ' ' + str(jrange) + ' ' + str(irange) )
+                    # Cada solicitud es un bloque contiguo: un segmento de longitudes (la submalla puede cruzar el meridiano)
+                    # y en las variables 4D un rango contiguo de los niveles, que se escribe en su region del arreglo de salida.
+                    isegments = irange if np.ndim(irange) == 2 else [irange]
+                    lsegments = [None] if levels is None else gfsData.getLevelSegments(levels)
+                    blocks = []
+                    i0 = 0
+                    for i in isegments:
+                        for l in lsegments:
+                            lsrc = () if l is None else (slice(l[1], l[2]),)
+                            ldst = () if l is None else (slice(l[0], l[0]+l[2]-l[1]),)
+                            blocks.append(((slice(None),) + ldst + (slice(None), slice(i0, i0+i[1]-i[0])),
+                                           (slice(*trange),) + lsrc + (slice(jrange[0], jrange[1]), slice(i[0], i[1]))))
+                        i0 = i0 + i[1]-i[0]
+                    if len(blocks) == 1:
+                        rawdata = dst.variables[var][blocks[0][1]]
+                    else:
+                        shape = (len(range(*trange)),) + (() if levels is None else (len(levels),)) + (jrange[1]-jrange[0], i0)
+                        rawdata = np.ma.masked_all(shape, dtype=dst.variables[var].dtype)
+                        for out, src in blocks:
+                            rawdata[out] = dst.variables[var][src]
+                    log.debug('getData: Variable con shape: ' + str(rawdata.shape))
+                    return rawdata
 
-            if i1min.size > 0:
-                self.irange = np.array([i1min,i1max+1])
-            elif i2min.size > 0:
-                self.irange = np.array([i2min,i2max+1])
-            elif i3min.size > 0:
-                self.irange = np.array([i3min,i3max+1])
+                return self.callRemote('getData', fname, var, request)
 
-            # 2. Latitud
-            j = np.where((lat>=latmin)& (lat<=latmax))
-            self.latitudes = lat[j]
 
-            jmin=np.min(j)
-            jmax=np.max(j)
-            self.jrange = np.array([jmin,jmax+1])
 
+            @staticmethod
+            def getTimeSeconds(values,units='days since 0001-01-01 00:00:00'):
+                """
+                 Convierte los valores de tiempo values de los datasets de NOMADS (GrADS, days since 1-1-1 con un dia de
+                 desfase) a las unidades de la salida, segundos desde 1970-01-01 (timeUnits), con aritmetica vectorizada.
+                 Si units ya son timeUnits los valores no cambian. Regresa un np.array f8.
+                """
+                units = units.strip()
+                if units == gfsData.timeUnits:
+                    return np.asarray(values, dtype='f8')
+                if not units.startswith(('days since 1-1-1', 'days since 0001-01-01')):
+                    raise ValueError('Unidades de tiempo no soportadas: ' + units)
+                return np.rint((np.asarray(values, dtype='f8') - gfsData.gradsEpoch) * 86400)
+
+            @staticmethod
+            def getLevelSegments(levels):
+                """
+                 Divide los indices de niveles levels (en orden) en rangos contiguos, para pedir cada rango en una solicitud.
+                 Regresa una <python list> de [posicion en levels, l0, l1].
+                """
+                segments = []
+                for n in range(len(levels)):
+                    if len(segments) > 0 and levels[n] == segments[-1][2]:
+                        segments[-1][2] = segments[-1][2] + 1
+                    else:
+                        segments.append([n, int(levels[n]), int(levels[n]) + 1])
+                return segments
 
-class gfsData(gfsConfig):
-            """
-             Esta clase contiene los metodos para consultar y descargar variables de los datasets FNL y GFS_HD junto a sus
-             variables de dimension.
-             Contiene metodos para guardar esta informacion en archivos netcdf con la convencion CF.
-             Los metodos principales para descargar FNL y GFS, usan la clase gfsConfig para leer del archivo de configuracion
-             la region, y variables que interesa descargar.
-             Metodos : downloadFNL y downloadGFS_HD
-            """
+            def getVarStorage(self,var,shape):
+                """
+                 Opciones de almacenamiento de netCDF4 (zlib, complevel, shuffle, chunksizes) de la variable var, leidas del
+                 grupo 'storage' del archivo de configuracion. shape es el tamano de las dimensiones de la variable, los
+                 chunks se recortan a este tamano (None para la dimension unlimited). En las variables 4D los chunks
+                 (time, lat, lon) se usan con un nivel por chunk.
+                """
+                storage = {}
+                if self.parseBool(self.getStorageValue(var, 'zlib')):
+                    storage['zlib'] = True
+                    if self.getStorageValue(var, 'complevel') != '':
+                        storage['complevel'] = int(self.getStorageValue(var, 'complevel'))
+                    storage['shuffle'] = self.parseBool(self.getStorageValue(var, 'shuffle'), True)
+                chunks = self.getStorageValue(var, 'chunks')
+                if chunks != '':
+                    chunks = chunks.split(',')
+                    if len(chunks) == len(shape) - 1:
+                        chunks.insert(1, '1')
+                    storage['chunksizes'] = [ int(c) if n is None else min(int(c), n) for c, n in zip(chunks, shape) ]
+                return storage
+
+            def reportOutputFile(self,netcdfFilename,writeSeconds):
+                """
+                 Reporta en el log el tamano y el tiempo de escritura del archivo de salida, junto a las opciones de almacenamiento.
+                """
+                if not os.path.exists(netcdfFilename):
+                    return
+                storage = dict(self.configData.items('storage')) if self.configData.has_section('storage') else {}
+                log.info('Archivo ' + netcdfFilename + ': ' + ('%.2f' % (netcdfFile.getPathSize(netcdfFilename)/1e6)) + ' MB, escritura '
+                         + ('%.2f' % writeSeconds) + ' seg. Almacenamiento: ' + str(storage))
 
-            gridFNL = gfsSubgrid()
-            gridGFS_HD = gfsSubgrid()
-            gfs_run_time_GFS = None
-            gfs_date_GFS = None
+            def getOutputAttributes(self,lVars,vUnit,vLN,grid=None):
+                """
+                 Atributos de las variables de salida: time, lat, lon y las variables lVars con sus unidades vUnit y
+                 nombres largos vLN, y los niveles de las variables 4D de la submalla grid.
+                 Regresa un <python dict> {var : {atributo : valor}}.
+                """
+                attributes = {'time' : {'units' : self.timeUnits, 'time_origin' : '1970-01-01 00:00:00', 'calendar' : 'gregorian'},
+                              'lat'  : {'units':'degree_north'},
+                              'lon'  : {'units':'degree_east'} }
+                for vi in range(len(lVars)):
+                    try:
+                        _units = vUnit[vi]
+                    except Exception as e:
+                        _units = 'unknown'
+                    try:
+                        _longname = vLN[vi]
+                    except Exception as e:
+                        _longname = 'unknown'
+                    attributes[lVars[vi]] = {'units' : _units, 'long_name' : _longname , '_FillValue' : self.fillValue }
+                for v in (grid.levels.keys() if grid is not None else []):
+                    attributes[self.getLevelDim(v)] = {'units' : 'millibar', 'long_name' : 'pressure level'}
+                return attributes
 
-            current_remote_dataset_name = None
-            current_remote_dataset = None
+            def getMemoryResult(self,netcdfFilename,grid,timeVar,varlist,lVars,vUnit,vLN):
+                """
+                 Resultado de una descarga con saveData=False: los mismos datos que se guardarian en el archivo netcdfFilename,
+                 sin escribirlo. Las variables son los arreglos float32 donde se descargaron los datos (sin copias).
+                 Formato:
+                  { 'name'       : netcdfFilename,
+                    'dimensions' : { 'time' : ntimes , 'lat' : nlat , 'lon' : nlon , 'lev_var4d' : nlev , ... },
+                    'variables'  : { 'time' : np.array , 'lat' : np.array , 'lon' : np.array , 'var1' : np.array[time,lat,lon] ,
+                                     'lev_var4d' : np.array , 'var4d' : np.array[time,lev,lat,lon] , ... },
+                    'attributes' : { 'time' : { 'units' : ... } , 'var1' : { 'units' : ... , 'long_name' : ... , '_FillValue' : ... } , ... }
+                  }
+                """
+                dimensions = {'time' : len(timeVar), 'lat' : grid.latitudes.size, 'lon' : grid.longitudes.size}
+                variables = {'time' : timeVar, 'lat' : grid.latitudes, 'lon' : grid.longitudes}
+                for v in grid.levels.keys():
+                    dimensions[self.getLevelDim(v)] = grid.levels[v].size
+                    variables[self.getLevelDim(v)] = grid.levels[v]
+                for v in lVars:
+                    variables[v] = varlist[v]
+                return {'name' : netcdfFilename,
+                        'dimensions' : dimensions,
+                        'variables' : variables,
+                        'attributes' : self.getOutputAttributes(lVars, vUnit, vLN, grid)}
 
-            def __del__(self):
-                # Cerrar la conexion a un dataset remoto si es que esta activo
-                if self.current_remote_dataset:
-                    self.current_remote_dataset.close()
+            def getOutputFormat(self):
+                """
+                 Formato de los archivos de salida, llave 'output': netcdf (default) o zarr (store Zarr local, zarrFile).
+                """
+                output = self.getConfigValueOpt('output').strip().lower() or 'netcdf'
+                if output not in ('netcdf', 'zarr'):
+                    log.warning('getOutputFormat: Formato de salida desconocido ' + output + ', se usa netcdf')
+                    return 'netcdf'
+                return output
 
-            def findForecast(self):
+            def newOutputFile(self,output=None):
                 """
-                 TODO: Esta funcion tiene alguna utilidad?
-                 Verifica si esta disponible un forecast
+                 Objeto del archivo de salida del formato output (None = llave 'output', getOutputFormat): netcdfFile o
+                 zarrFile, con writers hilos de escritura (llave 'writers').
                 """
-                dataURL = gfsName()
-                today = dt.datetime.today()
+                if (output or self.getOutputFormat()) == 'zarr':
+                    return zarrFile(self.getConfigValueInt('writers', 4))
+                return netcdfFile()
 
-                # Run time que se busca idealmente
-                gfs_run_time0=18
-                gfs_date0 = today - dt.timedelta(days=0.5)
-                gfs_run_time= gfs_run_time0
-                gfs_date= gfs_date0 ;
-                foundfile=0
-                dst = None
-                while foundfile==0:
-                    fname = dataURL.getURLName(gfs_date, gfs_run_time, 'gfs_hd')
-                    log.info('Leyendo el catalogo: ' + fname)
-                    try:
-                        dst = nc.Dataset(fname,'r')
-                        foundfile=1
-                    except Exception as e:
-                        log.warning('Error al tratar de acceder al dataset: ' + str(e) )
-                        foundfile=0
+            def createOutputFile(self,netcdfFilename,grid,lVars,vUnit,vLN,packData=None,output=None):
+                """
+                 Crea el archivo netcdf de salida con las dimensiones time(unlimited), lat, lon de la malla grid (gfsSubgrid)
+                 y las variables lVars con sus unidades vUnit y nombres largos vLN. Guarda las latitudes y longitudes.
+                 Las variables 4D tienen su propia dimension de niveles lev_<var> (getLevelDim) con los niveles de grid.
+                 Las variables se crean con las opciones de almacenamiento del grupo 'storage' (getVarStorage). Las variables
+                 con pack = yes se guardan como int16 con scale_factor y add_offset calculados de sus datos, que se reciben
+                 en packData ({var : data}); sin packData (modo stream) se guardan como f4.
+                 El archivo es del formato output (netcdf o zarr, None = llave 'output', ver newOutputFile). Si no existe el
+                 directorio del archivo (getOutputDir) se crea.
+                 Regresa el objeto netcdfFile (o zarrFile) abierto, o None si no fue posible crear el archivo.
+                """
+                # Dimensiones time(unlimited),   lat,                    lon
+                #             None               grid.latitudes.size     grid.longitudes.size
+                dimsA = {'time': None , 'lat': grid.latitudes.size, 'lon': grid.longitudes.size }
+                attributes = self.getOutputAttributes(lVars, vUnit, vLN, grid)
+                dimVars = { 'time' : { 'dimensions': ['time']  , 'attributes' : attributes['time'] , 'dataType' : 'f8' }
+                           ,'lat' :  { 'dimensions': ['lat']   , 'attributes' : attributes['lat'] , 'dataType' : 'f8' }
+                           ,'lon' :  { 'dimensions': ['lon']   , 'attributes' : attributes['lon']  , 'dataType' : 'f8' }  }
+                for v in grid.levels.keys():
+                    dimsA[self.getLevelDim(v)] = grid.levels[v].size
+                    dimVars[self.getLevelDim(v)] = { 'dimensions': [self.getLevelDim(v)] , 'attributes' : attributes[self.getLevelDim(v)] , 'dataType' : 'f8' }
+                dataVars= {}
+                log.debug('Saving Variables: ' + str(lVars))
+                log.debug('its units: ' + str(vUnit))
+                log.debug('its longnames: ' + str(vLN))
+                for vi in range(len(lVars)):
+                    dims = ['time'] + ([self.getLevelDim(lVars[vi])] if lVars[vi] in grid.levels else []) + ['lat','lon']
+                    dataVars[lVars[vi]] =  {'dimensions': dims , 'attributes' : dict(attributes[lVars[vi]]) , 'dataType' : 'f4' ,
+                                            'storage' : self.getVarStorage(lVars[vi], [None] + grid.getVarShape(lVars[vi], 0)[1:]) }
+                    if self.parseBool(self.getStorageValue(lVars[vi], 'pack')):
+                        if packData is not None and lVars[vi] in packData:
+                            scale, offset = netcdfFile.getPackParams(packData[lVars[vi]], fillValue=self.fillValue)
+                            dataVars[lVars[vi]]['dataType'] = 'i2'
+                            dataVars[lVars[vi]]['attributes'].update({'scale_factor' : scale, 'add_offset' : offset, '_FillValue' : np.int16(-32767)})
+                        else:
+                            log.debug('createOutputFile: La variable ' + lVars[vi] + ' no se empaqueta, los datos no estan en memoria (modo stream)')
+
+                outdir = os.path.dirname(netcdfFilename)
+                if outdir != '' and not os.path.exists(outdir):
+                    os.makedirs(outdir, exist_ok=True)
+                myfile = self.newOutputFile(output)
+                if myfile.createFile(netcdfFilename) == -1:
+                    return None
+                myfile.createDims(dimsA)
+                myfile.createVars(dimVars)
+                myfile.createVars(dataVars)
+                myfile.saveData({'lat' : grid.latitudes , 'lon' : grid.longitudes })
+                myfile.saveData(dict([ (self.getLevelDim(v), grid.levels[v]) for v in grid.levels.keys() ]))
+                return myfile
+
+            @staticmethod
+            def getStagingFile(netcdfFilename):
+                """
+                 Archivo temporal donde se escribe el archivo de salida netcdfFilename, en el mismo directorio para que al
+                 terminar se publique con un rename atomico (publishOutputFile), sin copiar los datos.
+                """
+                return netcdfFilename + '.tmp'
+
+            def publishOutputFile(self,myfile,netcdfFilename):
+                """
+                 Cierra el archivo temporal myfile (getStagingFile) y lo publica con su nombre final netcdfFilename (os.replace
+                 es atomico), asi nunca existe un archivo de salida incompleto.
+                 Regresa False si fallo la escritura del archivo (store Zarr), en ese caso se borra el archivo temporal.
+                """
+                writeSeconds = myfile.writeSeconds
+                stagingFile = myfile.fileName
+                if myfile.closeFile() != 0:
+                    log.error('publishOutputFile: Fallo la escritura del archivo ' + netcdfFilename)
+                    netcdfFile.removePath(stagingFile)
+                    return False
+                netcdfFile.replacePath(stagingFile, netcdfFilename)
+                self.reportOutputFile(netcdfFilename, writeSeconds)
+                return True
+
+            def discardOutputFile(self,myfile,netcdfFilename):
+                """
+                 Cierra y borra un archivo de salida incompleto.
+                """
+                myfile.closeFile()
+                netcdfFile.removePath(netcdfFilename)
+
+            def getTaskKeys(self,task):
+                """
+                 Llaves (downloadCheckpoint.blockKey) de los bloques del archivo de salida que escribe la tarea
+                 (fname, var, trange, tpos) de downloadBlocks.
+                """
+                fname, var, trange, tpos = task
+                t1 = tpos + 1 if trange is None else tpos + len(range(*trange))
+                return [ downloadCheckpoint.blockKey(v, tpos, t1) for v in (var if isinstance(var, (list, tuple)) else [var]) ]
+
+            def getOutputDir(self):
+                """
+                 Directorio de los archivos de salida: el atributo outdir de la instancia, o la llave 'outdir' del archivo de
+                 configuracion, vacio = directorio actual. El directorio no se crea aqui, lo crea createOutputFile al escribir
+                 el primer archivo (con saveData=False no se escribe nada).
+                """
+                return self.outdir if self.outdir is not None else self.getConfigValueOpt('outdir').strip()
+
+            def getOutputs(self,grid,netcdfFilename,storeName=None):
+                """
+                 Salidas de una descarga: un archivo por cada region del grupo 'regions' (getRegions), recortado de la submalla
+                 grid que cubre todas las regiones y que se descarga una sola vez.
+                 Regresa una <python list> de <python dict> con el nombre de la region ('name'), su submalla ('grid', ver
+                 getRegionSubgrid) y su archivo de salida ('file', <archivo>_<region>.nc). Sin regiones hay una sola salida,
+                 la submalla grid en el archivo netcdfFilename, con nombre None. Con output = zarr los archivos son stores
+                 Zarr con extension .zarr.
+                 Si esta configurado el almacen de series de tiempo (llave 'appendstore'), cada salida tiene tambien su
+                 almacen ('store', getAppendStoreFile) con el nombre storeName, donde se agrega el archivo al terminar.
+                 Los archivos van en el directorio de salida (getOutputDir), se escriben a un archivo temporal en el mismo
+                 directorio y se renombran al terminar (ver publishOutputFile).
+                """
+                netcdfFilename = os.path.join(self.getOutputDir(), netcdfFilename)
+                ext = '.zarr' if self.getOutputFormat() == 'zarr' else '.nc'
+                netcdfFilename = os.path.splitext(netcdfFilename)[0] + ext
+                regions = self.getRegions()
+                if regions[0][0] is None:
+                    outputs = [{'name' : None, 'grid' : grid, 'file' : netcdfFilename}]
+                else:
+                    outputs = []
+                    for name, bounds in regions:
+                        region = grid.getRegionSubgrid(*bounds)
+                        if region is not None:
+                            outputs.append({'name' : name, 'grid' : region, 'file' : os.path.splitext(netcdfFilename)[0] + '_' + name + ext})
+                for output in outputs:
+                    output['store'] = self.getAppendStoreFile(storeName, output['name']) if storeName is not None else None
+                return outputs
+
+            def getAppendStoreFile(self,storeName,region=None):
+                """
+                 Almacen de series de tiempo (llave 'appendstore') de la descarga storeName (crudosFNL, crudosGFS_0P25, ...)
+                 y la region region: <appendstore>/<storeName>[_<region>].nc (.zarr con output = zarr).
+                 Regresa None si no esta configurado el almacen.
+                """
+                storedir = self.getConfigValueOpt('appendstore').strip()
+                if storedir == '':
+                    return None
+                ext = '.zarr' if self.getOutputFormat() == 'zarr' else '.nc'
+                return os.path.join(storedir, storeName + ('_' + region if region is not None else '') + ext)
+
+            @staticmethod
+            def getTimeSlice(timeVar,start=None,end=None):
+                """
+                 Indices de los registros del eje de tiempo ordenado timeVar (segundos, ver timeUnits) entre las fechas start
+                 y end (incluidas, None = sin limite), con busqueda binaria. Regresa un slice.
+                """
+                t0 = 0 if start is None else int(np.searchsorted(timeVar, (start - dt.datetime(1970, 1, 1)).total_seconds(), 'left'))
+                t1 = len(timeVar) if end is None else int(np.searchsorted(timeVar, (end - dt.datetime(1970, 1, 1)).total_seconds(), 'right'))
+                return slice(t0, max(t0, t1))
+
+            @staticmethod
+            def getStoreTime(myfile):
+                """
+                 Eje de tiempo del almacen myfile. Si se interrumpio una actualizacion, los registros del final que no tienen
+                 tiempo no se consideran parte del almacen (se reescriben en la siguiente actualizacion).
+                """
+                storeTime = myfile.readData('time')
+                if np.ma.is_masked(storeTime):
+                    storeTime = storeTime[:np.argmax(np.ma.getmaskarray(storeTime))]
+                return np.ma.getdata(storeTime).astype('f8')
 
-                    if foundfile and dst != None:
-                        log.info('Se encontro el dataset! (' + fname + ')')
+            def appendStore(self,output,lVars,vUnit,vLN,refTime=None):
+                """
+                 Agrega el archivo de la salida output (getOutputs) a su almacen de series de tiempo output['store'], que
+                 crece en la dimension unlimited time. El eje de tiempo del almacen esta ordenado y sin repetidos: los
+                 registros del archivo que ya existen en el almacen se reemplazan, los nuevos se insertan en orden. Solo se
+                 reescribe el almacen desde el primer tiempo del archivo (searchsorted), en las descargas diarias es solo el
+                 traslape con la descarga anterior y los registros nuevos al final.
+                 refTime es el tiempo de la corrida del pronostico (segundos, timeUnits), None = cada registro es su propio
+                 analisis (FNL). Se guarda en la variable reftime del almacen, y un registro solo se reemplaza con datos de
+                 una corrida igual o mas reciente, asi el resultado no depende del orden en que terminan las descargas.
+                 El almacen se crea con la malla de la salida, las variables se guardan como f4 (sin pack, los rangos de los
+                 datos cambian entre descargas). Si el almacen existe, su malla y sus variables (con sus dimensiones y tipos,
+                 getVarInfo) deben coincidir con las del archivo, se verifica antes de modificar el almacen. Las descargas que
+                 corren al mismo tiempo actualizan el almacen una a la vez (<almacen>.lock).
+                 Regresa False si no fue posible actualizar el almacen.
+                """
+                storeFile = output['store']
+                grid = output['grid']
+                if os.path.dirname(storeFile) != '' and not os.path.exists(os.path.dirname(storeFile)):
+                    os.makedirs(os.path.dirname(storeFile), exist_ok=True)
+                src = self.newOutputFile()
+                if src.openFile(output['file'], 'r') != 0:
+                    return False
+                lockFile = open(storeFile + '.lock', 'w')
+                fcntl.flock(lockFile, fcntl.LOCK_EX)
+                myfile = None
+                stagingFile = None
+                completed = False
+                try:
+                    newTime = np.ma.getdata(src.readData('time')).astype('f8')
+                    newRef = newTime if refTime is None else np.full(newTime.size, refTime, dtype='f8')
+                    srcInfo = src.getVarInfo()
+                    missing = [ v for v in lVars if v not in srcInfo ]
+                    if len(missing) > 0:
+                        log.error('appendStore: El archivo ' + output['file'] + ' no tiene las variables ' + str(missing))
+                        return False
+                    if os.path.exists(storeFile):
+                        myfile = self.newOutputFile()
+                        if myfile.openFile(storeFile) != 0:
+                            myfile = None
+                            return False
+                        coords = [('lat', grid.latitudes), ('lon', grid.longitudes)] + \
+                                 [ (self.getLevelDim(v), grid.levels[v]) for v in grid.levels.keys() ]
+                        for name, values in coords:
+                            if not np.array_equal(myfile.readData(name), values):
+                                log.error('appendStore: La coordenada ' + name + ' del almacen ' + storeFile + ' no coincide con la salida')
+                                return False
+                        storeInfo = myfile.getVarInfo()
+                        storeInfo.pop('reftime', None)
+                        if storeInfo != srcInfo:
+                            different = sorted([ v for v in set(storeInfo) | set(srcInfo) if storeInfo.get(v) != srcInfo.get(v) ])
+                            log.error('appendStore: Las variables del almacen ' + storeFile + ' no coinciden con las del archivo '
+                                      + output['file'] + ': ' + ', '.join([ v + ' (almacen: ' + str(storeInfo.get(v)) + ', archivo: '
+                                                                             + str(srcInfo.get(v)) + ')' for v in different ]))
+                            return False
+                        storeTime = self.getStoreTime(myfile)
                     else:
-                        foundfile=0
-                        log.info('No se encontro el dataset: ' + fname)
-                        gfs_run_time=gfs_run_time-6
-                        if gfs_run_time < 0:
-                            gfs_date = gfs_date - dt.timedelta(days=1)
-                            gfs_run_time=18
-                            if gfs_date < (gfs_date0 - dt.timedelta(days=8)):
-                                log.warning('No se encontro ningun dataset de GFS!')
-                                return ''
+                        # Un almacen nuevo se escribe a un temporal que se publica al terminar
+                        stagingFile = self.getStagingFile(storeFile)
+                        myfile = self.createOutputFile(stagingFile, grid, lVars, vUnit, vLN)
+                        if myfile is None:
+                            return False
+                        myfile.createVars({'reftime' : {'dimensions' : ['time'], 'dataType' : 'f8',
+                                                        'attributes' : {'units' : self.timeUnits, 'long_name' : 'forecast reference time'}}})
+                        storeTime = np.array([], dtype='f8')
+
+                    # Desde el primer tiempo del archivo se mezclan los registros del almacen y del archivo
+                    t0 = int(np.searchsorted(storeTime, newTime.min(), 'left')) if newTime.size > 0 else storeTime.size
+                    tail = storeTime[t0:]
+                    tailRef = np.ma.getdata(myfile.readData('reftime', slice(t0, storeTime.size))).astype('f8')
+                    merged = np.union1d(tail, newTime)
+                    tailPos = np.searchsorted(merged, tail)
+                    newPos = np.searchsorted(merged, newTime)
+                    # Los registros del archivo que ya estan en el almacen solo se reemplazan con una corrida igual o mas reciente
+                    overlap = np.isin(newTime, tail)
+                    use = np.ones(newTime.size, dtype=bool)
+                    use[overlap] = newRef[overlap] >= tailRef[np.searchsorted(tail, newTime[overlap])]
+                    for v in lVars + ['reftime']:
+                        newData = newRef if v == 'reftime' else src.readData(v)
+                        data = np.ma.masked_all((merged.size,) + newData.shape[1:], dtype='f8' if v == 'reftime' else 'f4')
+                        if tail.size > 0:
+                            data[tailPos] = myfile.readData(v, slice(t0, storeTime.size))
+                        data[newPos[use]] = newData[use]
+                        if myfile.saveDataS(v, data, slice(t0, t0 + merged.size)) != 0:
+                            raise Exception('No se pudo escribir la variable ' + v)
+                    # El tiempo se escribe al final, los registros sin tiempo no son parte del almacen (getStoreTime)
+                    if myfile.saveDataS('time', merged, slice(t0, t0 + merged.size)) != 0 or myfile.syncFile() != 0:
+                        raise Exception('No se pudo escribir la variable time')
+                    log.info('appendStore: Almacen ' + storeFile + ': ' + str(int((use & overlap).sum())) + ' registros reemplazados, '
+                             + str(merged.size - tail.size) + ' registros nuevos, ' + str(int((~use).sum())) + ' registros de una corrida anterior omitidos, '
+                             + str(t0 + merged.size) + ' registros en total')
+                    completed = True
+                except Exception as e:
+                    log.error('appendStore: No se pudo agregar el archivo ' + output['file'] + ' al almacen ' + storeFile + ': ' + str(e))
+                    return False
+                finally:
+                    src.closeFile()
+                    if myfile is not None:
+                        completed = myfile.closeFile() == 0 and completed
+                        if stagingFile is not None:
+                            if completed:
+                                netcdfFile.replacePath(stagingFile, storeFile)
+                            else:
+                                netcdfFile.removePath(stagingFile)
+                    lockFile.close()
+                return completed
 
-                return fname
+            def appendStoreOutputs(self,outputs,lVars,vUnit,vLN,refTime=None):
+                """
+                 Agrega el archivo de cada salida a su almacen de series de tiempo (appendStore), si esta configurado.
+                 Regresa False si no fue posible actualizar alguno de los almacenes.
+                """
+                return all([ self.appendStore(output, lVars, vUnit, vLN, refTime) for output in outputs if output.get('store') is not None ])
 
-            def getDataVector(self,fname,var,attemps=10):
+            def readStore(self,storeFile,start=None,end=None,lVars=None):
                 """
-                 Funcion que hace la conexion al dataset remoto fname, para descargar una variable 1D
+                 Lee del almacen de series de tiempo storeFile (getAppendStoreFile) los registros entre las fechas start y end
+                 (incluidas), con una busqueda binaria en su eje de tiempo ordenado (getTimeSlice), sin recorrer los archivos
+                 diarios. lVars son las variables que se leen (None = las variables de la configuracion).
+                 Regresa un <python dict> {var : data} con time, lat, lon y las variables, o None si no se pudo leer.
                 """
-                # Por default 10 intentos para descargar datos
-                retrySeconds = 10
-                for attemp in range(0,attemps):
-                    try:
+                myfile = zarrFile() if os.path.isdir(storeFile) else netcdfFile()
+                if myfile.openFile(storeFile, 'r') != 0:
+                    return None
+                try:
+                    storeTime = self.getStoreTime(myfile)
+                    tslice = self.getTimeSlice(storeTime, start, end)
+                    data = {'time' : storeTime[tslice], 'lat' : myfile.readData('lat'), 'lon' : myfile.readData('lon')}
+                    for v in (lVars if lVars is not None else self.getConfigValueVL('vars')):
+                        data[v] = myfile.readData(v, tslice)
+                except Exception as e:
+                    log.error('readStore: No se pudo leer el almacen ' + storeFile + ': ' + str(e))
+                    return None
+                finally:
+                    myfile.closeFile()
+                return data
 
-                        if self.current_remote_dataset_name != fname:
-                            dst = nc.Dataset(fname,'r')
-                            self.current_remote_dataset_name = fname
-                            log.debug('getDataVector: Abriendo dataset: ' + str(fname))
-                            if not self.current_remote_dataset is None:
-                                self.current_remote_dataset.close()
-                            self.current_remote_dataset = dst
-                        else:
-                            dst = self.current_remote_dataset
+            @staticmethod
+            def cropOutput(output,data):
+                """
+                 Recorta los datos descargados data [..., lat, lon] a la region de la salida output (getOutputs).
+                 Regresa una vista de data, los vectores (time) no se recortan.
+                """
+                if np.ndim(data) < 2:
+                    return data
+                return data[..., output['grid'].jslice, output['grid'].islice]
 
-                        rawdata = dst.variables[var][:]
-                        # dst.close()
-                        return rawdata
-                    except Exception as e:
-                        log.warning('getDataVector: Fallo al acceder a los datos ' + fname + ', var: ' + var)
-                        log.warning('getDataVector: Error: ' + str(e))
-                        log.warning('getDataVector: Reintentando la descarga. attemp: ' + str(attemp) + ' en ' + str(retrySeconds) + 'seg.')
-                        if attemp > 3:
-                            # En los ultimos tres intentos dormir el proceso diez segundos
-                            time.sleep(retrySeconds)
-                            retrySeconds = retrySeconds + 5
-                        continue
-                log.error('getDataVector: No se pudo realizar la descarga de datos : ' + fname + ', var: ' + var)
-                raise
-                return None
+            def getOutputResult(self,outputs,key='file'):
+                """
+                 Resultado de la descarga: el valor key de la salida, o si hay regiones un <python dict> {region : valor}.
+                """
+                if len(outputs) == 1 and outputs[0]['name'] is None:
+                    return outputs[0][key]
+                return dict([ (output['name'], output[key]) for output in outputs ])
 
+            def openStreamOutputs(self,outputs,lVars,vUnit,vLN,plan=None):
+                """
+                 Crea (o abre para reanudar) el archivo del modo stream de cada salida (openStreamFile), en output['myfile'] y
+                 output['checkpoint']. Regresa False si no se pudo crear alguno, en ese caso se cierran los demas.
+                """
+                for output in outputs:
+                    output['myfile'], output['checkpoint'] = self.openStreamFile(output['file'], output['grid'], lVars, vUnit, vLN, plan)
+                    if output['myfile'] is None:
+                        self.closeStreamOutputs([ o for o in outputs if o.get('myfile') is not None ], False)
+                        return False
+                return True
+
+            def closeStreamOutputs(self,outputs,completed):
+                """
+                 Cierra el archivo del modo stream de cada salida (closeStreamFile).
+                 Regresa False si fallo la escritura de alguno de los archivos.
+                """
+                closed = [ self.closeStreamFile(output['myfile'], output['checkpoint'], output['file'], completed) for output in outputs ]
+                return all(closed)
 
-            def getData(self,fname,var,trange,irange,jrange, attemps=10):
+            def pendingTasks(self,outputs,tasks):
                 """
-                 Funcion que hace la conexion al dataset remoto fname, para descargar una variable 3D con los rangos
-                 trange (tiempo) , irange (longitud) , jrange (latitud)
+                 Tareas de tasks que faltan en alguno de los archivos parciales de las salidas (modo resume).
+                """
+                checkpoints = [ output['checkpoint'] for output in outputs if output['checkpoint'] is not None ]
+                if len(checkpoints) == 0:
+                    return tasks
+                return [ task for task in tasks if any([ c.pending(self.getTaskKeys(task)) for c in checkpoints ]) ]
+
+            def saveStreamOutputs(self,outputs,var,data,indexs,keys):
                 """
-                # Por default 10 intentos para descargar datos
-                retrySeconds = 10
-                for attemp in range(0,attemps):
+                 Escribe el bloque data de la variable var, en las posiciones de tiempo indexs, recortado a la region de cada
+                 salida del modo stream, y registra las llaves keys en su checkpoint.
+                """
+                for output in outputs:
+                    if output['myfile'].saveDataS(var, self.cropOutput(output, data), indexs) != 0:
+                        raise Exception('No se pudo escribir la variable ' + var + ' en el archivo ' + output['file'])
+                    if output['checkpoint'] is not None:
+                        if output['myfile'].syncFile() != 0:
+                            raise Exception('No se pudo escribir la variable ' + var + ' en el archivo ' + output['file'])
+                        output['checkpoint'].add(keys)
+
+            def saveOutputs(self,outputs,timeVar,varlist,lVars,vUnit,vLN):
+                """
+                 Guarda las variables varlist (en memoria, submalla de todas las regiones) en el archivo de cada salida.
+                 Regresa False si no se pudo crear alguno de los archivos.
+                """
+                for output in outputs:
+                    regionVars = dict([ (v, self.cropOutput(output, varlist[v])) for v in lVars ])
+                    # Los puntos faltantes de las variables empaquetadas se guardan con el _FillValue entero
+                    for v in lVars:
+                        if self.parseBool(self.getStorageValue(v, 'pack')):
+                            regionVars[v] = np.ma.masked_values(regionVars[v], self.fillValue, copy=False)
+                    myfile = self.createOutputFile(self.getStagingFile(output['file']), output['grid'], lVars, vUnit, vLN, packData=regionVars)
+                    if myfile is None:
+                        return False
+                    myfile.saveData({'time' : timeVar })
+                    myfile.saveData(regionVars)
+                    if not self.publishOutputFile(myfile, output['file']):
+                        return False
+                return True
+
+            def getMemoryOutputs(self,outputs,timeVar,varlist,lVars,vUnit,vLN):
+                """
+                 Resultado en memoria (getMemoryResult) de cada salida, con las vistas de varlist recortadas a cada region.
+                """
+                for output in outputs:
+                    regionVars = dict([ (v, self.cropOutput(output, varlist[v])) for v in lVars ])
+                    output['result'] = self.getMemoryResult(output['file'], output['grid'], timeVar, regionVars, lVars, vUnit, vLN)
+                return self.getOutputResult(outputs, 'result')
+
+            def openStreamFile(self,netcdfFilename,grid,lVars,vUnit,vLN,plan=None):
+                """
+                 Crea el archivo de salida del modo stream, los datos se escriben en el archivo temporal getStagingFile.
+                 Si se especifica plan (lista de llaves de todos los bloques de la
+                 descarga) la descarga se puede reanudar: los datos se escriben en <archivo>.part y los bloques completos
+                 se registran en un downloadCheckpoint. Si ya existe un archivo parcial del mismo plan, se abre para
+                 continuar la descarga.
+                 Regresa (myfile, checkpoint), checkpoint es None si la descarga no se puede reanudar y myfile es None
+                 si no se pudo crear el archivo.
+                """
+                if plan is None:
+                    return self.createOutputFile(self.getStagingFile(netcdfFilename), grid, lVars, vUnit, vLN), None
+
+                checkpoint = downloadCheckpoint(netcdfFilename, plan)
+                if checkpoint.load():
+                    myfile = self.newOutputFile()
+                    if myfile.openFile(checkpoint.partFile) == 0:
+                        log.info('openStreamFile: Reanudando la descarga de ' + netcdfFilename + ', ' + str(len(checkpoint.done))
+                                 + ' de ' + str(len(checkpoint.plan)) + ' bloques completos')
+                        return myfile, checkpoint
+                checkpoint.discard()
+                myfile = self.createOutputFile(checkpoint.partFile, grid, lVars, vUnit, vLN)
+                if myfile is not None:
+                    checkpoint.save()
+                return myfile, checkpoint
+
+            def closeStreamFile(self,myfile,checkpoint,netcdfFilename,completed):
+                """
+                 Cierra el archivo de salida del modo stream. Si la descarga se completo, el archivo temporal (o parcial) se
+                 publica con su nombre final. Si no se completo, el archivo se borra, o si la descarga se puede reanudar
+                 (checkpoint) se conserva el archivo parcial con su registro.
+                 Regresa False si fallo la escritura del archivo.
+                """
+                if checkpoint is None:
+                    if completed:
+                        return self.publishOutputFile(myfile, netcdfFilename)
+                    self.discardOutputFile(myfile, self.getStagingFile(netcdfFilename))
+                    return True
+                writeSeconds = myfile.writeSeconds
+                if myfile.closeFile() != 0:
+                    log.error('closeStreamFile: Fallo la escritura del archivo ' + checkpoint.partFile + ', se conserva la descarga parcial')
+                    return False
+                if completed:
+                    checkpoint.finalize()
+                    self.reportOutputFile(netcdfFilename, writeSeconds)
+                else:
+                    log.warning('closeStreamFile: Se conserva la descarga parcial ' + checkpoint.partFile + ' (' + str(len(checkpoint.done))
+                                + ' de ' + str(len(checkpoint.plan)) + ' bloques), se completara en la siguiente ejecucion.')
+                return True
+
+            def reportRun(self,metrics,name,output):
+                """
+                 Reporta las metricas de la corrida (runMetrics) en el log, y si esta configurada la llave 'reportdir'
+                 escribe el reporte JSON y el archivo textfile de Prometheus. output es el archivo de salida, None si fallo.
+                """
+                summary = metrics.summary(output)
+                reportdir = self.getConfigValueOpt('reportdir').strip()
+                if reportdir != '':
                     try:
+                        summary = metrics.writeReport(reportdir, output)
+                    except Exception as e:
+                        log.warning('reportRun: No se pudo escribir el reporte de la corrida en ' + reportdir + ': ' + str(e))
+                log.info(name + ': ' + str(summary['requests']) + ' solicitudes, ' + ('%.2f' % (summary['bytes']/1e6)) + ' MB en '
+                         + ('%.1f' % summary['seconds']) + ' seg. (' + ('%.2f' % summary['requests_per_second']) + ' solicitudes/seg., '
+                         + ('%.2f' % summary['mb_per_second']) + ' MB/s), tiempo de espera en reintentos: '
+                         + ('%.1f' % summary['retry_wait_seconds']) + ' seg.')
+                # Los registros de la corrida ya estan en el reporte
+                metrics.close()
+                self.getRetryPolicy().endRun()
+
+            def getFNLStoreFile(self,date,run_time):
+                """
+                 Nombre del archivo del almacen local de ciclos FNL (llave 'fnlstore') para el ciclo date, run_time.
+                 Los ciclos se guardan por region: <fnlstore>/<fnl_region>/fnl_YYYYMMDD_HHz.nc
+                 Regresa None si no esta configurado el almacen.
+                """
+                storedir = self.getConfigValueOpt('fnlstore').strip()
+                if storedir == '':
+                    return None
+                return os.path.join(storedir, self.gridFNL.getRegionKey_default('fnl'), 'fnl_' + date.strftime('%Y%m%d') + ('_%02dz' % run_time) + '.nc')
 
-                        if self.current_remote_dataset_name != fname:
-                            dst = nc.Dataset(fname,'r')
-                            self.current_remote_dataset_name = fname
-                            log.debug('getData: Abriendo dataset: ' + str(fname))
-                            if not self.current_remote_dataset is None:
-                                self.current_remote_dataset.close()
-                            self.current_remote_dataset = dst
-                        else:
-                            dst = self.current_remote_dataset
-
-                        if (var in dst.variables):
-                            # Nota: el orden de las dimensiones son time,   latitudes, longitudes
-                            #                                       trange  jrange     irange
-                            log.debug('getData: Solicitando: ' + str(var) + ' ' + str(trange) + ' ' + str(jrange) + ' ' + str(irange) )
-                            rawdata = dst.variables[var][trange[0]:trange[1],jrange[0]:jrange[1],irange[0]:irange[1]]
-                            log.debug('getData: Variable con shape: ' + str(rawdata.shape))
-                            # dst.close()
-                        else:
-                            log.warning('getData: Variable ' + var + ' no se encuentra en el dataset: ' + fname)
-                            # dst.close()
+            def readFNLStore(self,storeFile,grid,lVars):
+                """
+                 Lee un ciclo del almacen local de FNL. El ciclo se verifica contra la submalla grid (tamano, coordenadas y
+                 niveles de las variables 4D) y debe contener todas las variables lVars.
+                 Regresa un <python dict> {var : data} con la variable time y las variables, o None si el ciclo no es valido.
+                """
+                try:
+                    dst = nc.Dataset(storeFile,'r')
+                    try:
+                        if (not np.array_equal(dst.variables['lat'][:], grid.latitudes)) or (not np.array_equal(dst.variables['lon'][:], grid.longitudes)):
+                            log.warning('readFNLStore: La malla del ciclo ' + storeFile + ' no coincide con la submalla actual')
                             return None
-                        return rawdata
-                    except Exception as e:
-                        log.warning('getData: Fallo al acceder a los datos ' + fname + ', var: ' + var)
-                        log.warning('getData: Error: ' + str(e))
-                        log.warning('getData: Reintentando la descarga. attemp: ' + str(attemp) + ' en ' + str(retrySeconds) + 'seg')
-                        if attemp > 3:
-                            # En los ultimos tres intentos dormir el proceso diez segundos
-                            time.sleep(retrySeconds)
-                            retrySeconds = retrySeconds + 5
-                        continue
-                log.error('getData: No se pudo realizar la descarga de datos : ' + fname + ', var: ' + var)
-                raise
-                return None
+                        for v in lVars:
+                            if (v in grid.levels) != (self.getLevelDim(v) in dst.variables) or \
+                               (v in grid.levels and not np.array_equal(dst.variables[self.getLevelDim(v)][:], grid.levels[v])):
+                                log.warning('readFNLStore: Los niveles de la variable ' + v + ' del ciclo ' + storeFile + ' no coinciden')
+                                return None
+                        # Los ciclos guardados antes del cambio de unidades de tiempo se convierten al leerlos
+                        data = {'time' : self.getTimeSeconds(dst.variables['time'][:], dst.variables['time'].units)}
+                        for v in lVars:
+                            data[v] = dst.variables[v][:]
+                    finally:
+                        dst.close()
+                except Exception as e:
+                    log.warning('readFNLStore: No se pudo leer el ciclo ' + storeFile + ': ' + str(e))
+                    return None
+                return data
 
+            def writeFNLStore(self,storeFile,grid,data,lVars,vUnit,vLN):
+                """
+                 Guarda un ciclo FNL descargado (data, <python dict> {var : data}) en el almacen local.
+                 Se escribe a un archivo temporal que se renombra al terminar, asi solo existen ciclos completos. El almacen
+                 siempre es netcdf (readFNLStore), sin importar la llave 'output'.
+                """
+                tmpFile = storeFile + '.tmp'
+                if not os.path.exists(os.path.dirname(storeFile)):
+                    os.makedirs(os.path.dirname(storeFile))
+                myfile = self.createOutputFile(tmpFile, grid, lVars, vUnit, vLN, output='netcdf')
+                if myfile is None:
+                    raise Exception('No se pudo crear el ciclo del almacen FNL ' + tmpFile)
+                myfile.saveData(data)
+                myfile.closeFile()
+                os.replace(tmpFile, storeFile)
+
+            @staticmethod
+            def getFNLMissingFile(storeFile):
+                """
+                 Registro de un ciclo del almacen local de FNL que no existe en el servidor (ver fillFNLStore).
+                """
+                return storeFile + '.missing'
+
+            def isFNLMissing(self,storeFile):
+                """
+                 True si el ciclo storeFile del almacen se registro como no disponible en el servidor hace menos de
+                 fnlmissingttl horas (default 24, el servidor puede publicar el ciclo despues).
+                """
+                if storeFile is None:
+                    return False
+                missingFile = self.getFNLMissingFile(storeFile)
+                if not os.path.exists(missingFile):
+                    return False
+                return time.time() - os.path.getmtime(missingFile) < self.getConfigValueInt('fnlmissingttl', 24) * 3600
+
+            def pruneFNLStore(self,oldestDate):
+                """
+                 Borra del almacen local de FNL los ciclos (y registros de ciclos no disponibles) anteriores a la fecha oldestDate.
+                """
+                storeFile = self.getFNLStoreFile(oldestDate, 0)
+                if storeFile is None or not os.path.exists(os.path.dirname(storeFile)):
+                    return
+                for f in os.listdir(os.path.dirname(storeFile)):
+                    if f.startswith('fnl_') and f.endswith(('.nc', '.nc.missing')) and f[4:12] < oldestDate.strftime('%Y%m%d'):
+                        log.debug('pruneFNLStore: Borrando ciclo ' + f)
+                        os.remove(os.path.join(os.path.dirname(storeFile), f))
+
+            def fillFNLStore(self,firstDate,lastDate):
+                """
+                 Descarga al almacen local de FNL (llave 'fnlstore') los ciclos 00z, 06z, 12z y 18z de las fechas
+                 [firstDate : lastDate] que todavia no estan en el almacen. Todos los ciclos van en una sola cola de downloadBlocks,
+                 asi al rellenar varios dias (backfill) cada ciclo se descarga una sola vez aunque este en la ventana hdays de
+                 varios dias, y despues downloadFNL de cada dia lee sus ciclos del almacen.
+                 Los ciclos que no existen en el servidor se omiten y se registran en el almacen (getFNLMissingFile), asi
+                 downloadFNL no los vuelve a pedir con todos sus reintentos. Los ciclos ya registrados no se verifican otra vez.
+                 Regresa el numero de ciclos descargados, o None si no esta configurado el almacen o fallo la descarga.
+                """
+                if self.getFNLStoreFile(firstDate, 0) is None:
+                    log.error('fillFNLStore: No esta configurado el almacen local de FNL (llave fnlstore)')
+                    return None
+                vUnit = self.getConfigValueVL('units')
+                vLN = self.getConfigValueVL('longnames')
+                lVars = self.getConfigValueVL('vars')
+                self.getRetryPolicy().startRun()
+                metrics = runMetrics('fnl', self.getRetryPolicy())
+                dataURL = gfsName()
+
+                # Ciclos que faltan en el almacen
+                cycles = []
+                date = firstDate
+                while date <= lastDate:
+                    for run_time in (0, 6, 12, 18):
+                        storeFile = self.getFNLStoreFile(date, run_time)
+                        if not os.path.exists(storeFile) and not self.isFNLMissing(storeFile):
+                            cycles.append((dataURL.getURLName(date, run_time, 'fnl'), storeFile))
+                    date = date + dt.timedelta(days=1)
+                if len(cycles) == 0:
+                    log.info('fillFNLStore: Todos los ciclos de ' + firstDate.strftime('%Y-%m-%d') + ' a ' + lastDate.strftime('%Y-%m-%d') + ' estan en el almacen')
+                    self.reportRun(metrics, 'FNL', os.path.dirname(self.getFNLStoreFile(firstDate, 0)))
+                    return 0
+                # Se verifican en grupos de 'probeworkers' ciclos al mismo tiempo
+                nprobe = max(1, self.getConfigValueInt('probeworkers', 8))
+                found = []
+                for i0 in range(0, len(cycles), nprobe):
+                    found.extend(self.probeDatasets([ c[0] for c in cycles[i0:i0+nprobe] ]))
+                missing = [ cycles[k] for k in range(len(cycles)) if not found[k] ]
+                cycles = [ cycles[k] for k in range(len(cycles)) if found[k] ]
+                for c in missing:
+                    log.warning('fillFNLStore: No se encontro el dataset ' + c[0] + ', se omite el ciclo')
+                    # Solo se registra si el servidor respondio por otros ciclos (no es una falla de red)
+                    if len(cycles) > 0:
+                        if not os.path.exists(os.path.dirname(c[1])):
+                            os.makedirs(os.path.dirname(c[1]), exist_ok=True)
+                        with open(self.getFNLMissingFile(c[1]), 'w') as f:
+                            f.write(c[0] + '\n')
+                if len(cycles) == 0:
+                    log.warning('fillFNLStore: No se encontro ningun dataset FNL, errores probables: (No hay red, falla sistema opendap de nomads)')
+                    self.reportRun(metrics, 'FNL', None)
+                    return None
+
+                log.info('fillFNLStore: Obteniendo el tamano de la malla FNL del dataset: ' + str(cycles[0][0]))
+                self.getGrid(self.gridFNL, cycles[0][0], 'fnl')
+                if not self.getLevels(self.gridFNL, cycles[0][0], lVars):
+                    self.reportRun(metrics, 'FNL', None)
+                    return None
+                log.info('fillFNLStore: ' + str(len(cycles)) + ' ciclos por descargar')
+                # Un ciclo completo por tarea, como downloadFNL con fnlcycles = yes
+                tasks = [ (cycles[n][0], ['time'] + lVars, [0,1], n) for n in range(len(cycles)) ]
+
+                def storeData(task, data):
+                    data['time'] = self.getTimeSeconds(data['time'])
+                    self.writeFNLStore(cycles[task[3]][1], self.gridFNL, data, lVars, vUnit, vLN)
+                    log.info('fillFNLStore: Se guardo el ciclo ' + cycles[task[3]][1])
 
+                try:
+                    self.downloadBlocks(tasks, self.gridFNL.irange, self.gridFNL.jrange, storeData,
+                                        retries=self.getConfigValueInt('cycleretries', 0), levels=self.gridFNL.levelIndexes)
+                except Exception as e:
+                    log.error('fillFNLStore: Fallo la descarga de los ciclos FNL: ' + str(e))
+                    self.reportRun(metrics, 'FNL', None)
+                    return None
+                self.reportRun(metrics, 'FNL', os.path.dirname(cycles[0][1]))
+                return len(cycles)
 
             def downloadFNL(self,lastDownloadDate=None,hdays=None,saveData=True):
                 """
@@ -572,10 +3019,15 @@ class gfsData(gfsConfig):
                   ---
                  Si se especifica el parametro lastDownloadDate (fecha tipo <python datetime>), la fecha "today" se cambia por la dada en esta variable.
                  Si se especifica el parametro hdays, en lugar de leer el dato del archivo de configuracion, se usa este.
+                 Regresa el nombre del archivo de salida, o con saveData=False los datos en memoria (ver getMemoryResult).
+                 Si hay regiones configuradas (grupo 'regions') regresa un <python dict> {region : resultado}.
                 """
                 # Sacar informacion de unidades y nombres largos del archivo de configuracion.
                 vUnit = self.getConfigValueVL('units')
                 vLN = self.getConfigValueVL('longnames')
+                # Tiempo limite de la corrida para los reintentos, y metricas de la corrida
+                self.getRetryPolicy().startRun()
+                metrics = runMetrics('fnl', self.getRetryPolicy())
                 # Obtener la submalla
                 dataURL = gfsName()
                 today = dt.datetime.today()
@@ -596,59 +3048,98 @@ class gfsData(gfsConfig):
 
                 # El siguiente ciclo busca el primer dataset disponible, empezando el ciclo
                 # desde (lastFNLdate-hdays), recorriendo los run times 0, 6, 12, 18
+                # Un ciclo que ya esta en el almacen local de FNL cuenta como disponible, los anteriores a el
+                # se verifican al mismo tiempo en el servidor (findDataset).
+                candidates = []
                 while True:
-                    if self.datasetExists(fname):
+                    candidates.append((fnl_date_start, run_time, fname))
+                    storeFile = self.getFNLStoreFile(fnl_date_start, run_time)
+                    if (storeFile is not None and os.path.exists(storeFile)) or fnl_date_start >= lastFNLdate:
                         break
-                    else:
-                        if fnl_date_start >= lastFNLdate:
-                            log.warning('FNL: No se encontro ningun dataset FNL, errores probables: (No hay red, falla sistema opendap de nomads)')
-                            return 0
-                        run_time = run_time + 6
-                        if run_time > 18:
-                            fnl_date_start = fnl_date_start + dt.timedelta(days=1)
-                            run_time=0
-                        fname = dataURL.getURLName(fnl_date_start, run_time, 'fnl')
+                    run_time = run_time + 6
+                    if run_time > 18:
+                        fnl_date_start = fnl_date_start + dt.timedelta(days=1)
+                        run_time=0
+                    fname = dataURL.getURLName(fnl_date_start, run_time, 'fnl')
+
+                found = self.findDataset([ c[2] for c in candidates[:-1] ]) if len(candidates) > 1 else -1
+                if found < 0:
+                    found = len(candidates) - 1
+                    storeFile = self.getFNLStoreFile(candidates[found][0], candidates[found][1])
+                    if not ((storeFile is not None and os.path.exists(storeFile)) or self.datasetExists(candidates[found][2])):
+                        log.warning('FNL: No se encontro ningun dataset FNL, errores probables: (No hay red, falla sistema opendap de nomads)')
+                        self.reportRun(metrics, 'FNL', None)
+                        return 0
+                fnl_date_start, run_time, fname = candidates[found]
 
                 # En este punto obtenemos el primer dataset disponible desde today-hdays
                 # y aseguramos que de aqui podemos obtener los datos de la submalla
                 log.info('FNL: Obteniendo el tamano de la malla FNL del dataset: ' + str(fname))
-                self.gridFNL.getGFSgrid_default(fname)
+                self.getGrid(self.gridFNL, fname, 'fnl')
 
                 # Definir espacios para variables a descargar
                 lVars = self.getConfigValueVL('vars')
+                # Niveles de las variables 4D, se resuelven una vez con la coordenada lev del primer dataset
+                if not self.getLevels(self.gridFNL, fname, lVars):
+                    self.reportRun(metrics, 'FNL', None)
+                    return None
                 dimTimeSize = (((lastFNLdate - fnl_date_start).days + 1) * 4) - (int(run_time/6))
-                varShape = [dimTimeSize, self.gridFNL.jrange[1]-self.gridFNL.jrange[0] , self.gridFNL.irange[1]-self.gridFNL.irange[0]]
+                varShape = [dimTimeSize, self.gridFNL.latitudes.size , self.gridFNL.longitudes.size]
                 log.debug('FNL: var grid size: ' + str(varShape))
                 log.debug('FNL: irange ' + str(self.gridFNL.irange))
                 log.debug('FNL: jrange ' + str(self.gridFNL.jrange))
-                varlist= {}
-                for v in lVars:
-                    varlist[v] =  np.zeros( (varShape[0] , varShape[1], varShape[2]) )
+                netcdfFilename = 'crudosFNL_' + fnl_date_start.strftime('%Y-%m-%d') + '__' + lastFNLdate.strftime('%Y-%m-%d') + '.nc'
+                # Se descarga la submalla que cubre todas las regiones, y se escribe un archivo por region
+                outputs = self.getOutputs(self.gridFNL, netcdfFilename, 'crudosFNL')
+                # En modo stream el archivo de salida se crea antes de la descarga y cada bloque se escribe
+                # en cuanto llega, sin mantener en memoria todas las variables.
+                # Con resume = yes (siempre en modo stream) la descarga se puede reanudar, ver openStreamFile.
+                resume = saveData and self.getConfigValueBool('resume')
+                stream = saveData and (self.getConfigValueBool('stream') or resume)
+                if not stream:
+                    varlist= {}
+                    for v in lVars:
+                        varlist[v] =  np.zeros( self.gridFNL.getVarShape(v, dimTimeSize), dtype='f4' )
+                    fnlTimeVar = np.zeros((dimTimeSize))
 
                 # Recorrer datasets y descargar variables que se solicitan en el archivo de
                 # configuracion
                 run_time_fnl0 = run_time
                 date_fnl0 = fnl_date_start
                 timecnt = 0
-                fnlTimeVar = np.zeros((dimTimeSize))
 
+                # Lista de tareas (fname, var, trange, timecnt) que se reparten entre los workers de downloadBlocks.
+                # Con fnlcycles = yes cada ciclo (00z, 06z, 12z, 18z) es una sola tarea con la variable time y todas
+                # las variables, asi cada worker descarga un dataset completo con una sola conexion, y si falla el ciclo
+                # se reintenta solo ese ciclo (cycleretries veces).
+                # Si no, primero la variable time de cada dataset y despues cada una de las variables por separado.
+                # Si esta configurado el almacen local de FNL (fnlstore), los ciclos que ya estan en el almacen no se
+                # descargan, y los ciclos descargados se agregan al almacen (modo incremental, siempre por ciclos).
+                # Los ciclos registrados como no disponibles (isFNLMissing) no se piden, su registro se guarda con _FillValue.
+                incremental = self.getConfigValueOpt('fnlstore').strip() != ''
+                fnlcycles = self.getConfigValueBool('fnlcycles') or incremental
+                cycleRetries = self.getConfigValueInt('cycleretries', 0) if fnlcycles else 0
+                tasks = []
+                storeFiles = {}
+                localCycles = []
+                missingCycles = []
+                cycleTimes = {}
                 while True:
-                    log.info('FNL: Leyendo del dataset : ' + fname)
-                    # Obtener primero el valor de la dimension temporal del dataset fname
-                    try:
-                        fnlTimeVar[timecnt] = self.getDataVector(fname, 'time')
-                    except Exception as e:
-                        log.error('FNL: Fallo la descarga de la variable time del dataset: ' + str(fname))
-                        return None
-                    log.info('FNL: Tiempo FNL : ' + str(fnlTimeVar[timecnt]))
-                    for vn in range(len(lVars)):
-                        try:
-                            varlist[lVars[vn]][timecnt,:,:] = self.getData(fname, lVars[vn], [0,1], self.gridFNL.irange, self.gridFNL.jrange)
-                            log.info('FNL: Se descargo la variable ' + lVars[vn] + ', shape: '  + str(varlist[lVars[vn]][timecnt,:,:].shape))
-                        except Exception as e:
-                            log.error('FNL: Fallo la descarga de una seccion del dataset: ' + str(fname))
-                            return None
-
+                    storeFile = self.getFNLStoreFile(date_fnl0, run_time_fnl0)
+                    storeFiles[timecnt] = storeFile
+                    cycleTimes[timecnt] = gribEngine.getTimeValue(date_fnl0.replace(hour=0, minute=0, second=0, microsecond=0)
+                                                                  + dt.timedelta(hours=run_time_fnl0))
+                    if storeFile is not None and os.path.exists(storeFile):
+                        localCycles.append((fname, ['time'] + lVars, [0,1], timecnt))
+                    elif self.isFNLMissing(storeFile):
+                        log.warning('FNL: El ciclo ' + fname + ' esta registrado como no disponible, se guarda con _FillValue')
+                        missingCycles.append((fname, ['time'] + lVars, [0,1], timecnt))
+                    elif fnlcycles:
+                        tasks.append((fname, ['time'] + lVars, [0,1], timecnt))
+                    else:
+                        tasks.append((fname, 'time', None, timecnt))
+                        for vn in range(len(lVars)):
+                            tasks.append((fname, lVars[vn], [0,1], timecnt))
 
                     # Avanzar en el siguiente paso de tiempo, construyendo el nombre del siguiente dataset de fnl
                     timecnt = timecnt + 1
@@ -661,57 +3152,93 @@ class gfsData(gfsConfig):
                         break
                     fname = dataURL.getURLName(date_fnl0, run_time_fnl0, 'fnl')
 
+                if stream:
+                    plan = [ k for task in localCycles + missingCycles + tasks for k in self.getTaskKeys(task) ] if resume else None
+                    if not self.openStreamOutputs(outputs, lVars, vUnit, vLN, plan):
+                        self.reportRun(metrics, 'FNL', None)
+                        return None
+                    # Solo los ciclos y variables que faltan en los archivos parciales
+                    localCycles = self.pendingTasks(outputs, localCycles)
+                    missingCycles = self.pendingTasks(outputs, missingCycles)
+                    tasks = self.pendingTasks(outputs, tasks)
+
+                def storeVar(fname, var, tpos, data):
+                    if stream:
+                        self.saveStreamOutputs(outputs, var, data, slice(tpos, tpos+1), [downloadCheckpoint.blockKey(var, tpos, tpos+1)])
+                    elif var == 'time':
+                        fnlTimeVar[tpos:tpos+1] = data
+                    else:
+                        varlist[var][tpos] = data
+                    if var == 'time':
+                        log.info('FNL: Tiempo FNL : ' + str(data) + ' (' + fname + ')')
+                    else:
+                        log.info('FNL: Se descargo la variable ' + var + ', shape: '  + str(data.shape[1:]) + ' (' + fname + ')')
+
+                def storeData(task, data):
+                    fname, var, trange, tpos = task
+                    if isinstance(data, dict):
+                        # Ciclo completo, se guarda en su posicion timecnt
+                        data['time'] = self.getTimeSeconds(data['time'])
+                        for v in data.keys():
+                            storeVar(fname, v, tpos, data[v])
+                        if incremental:
+                            self.writeFNLStore(storeFiles[tpos], self.gridFNL, data, lVars, vUnit, vLN)
+                    else:
+                        storeVar(fname, var, tpos, self.getTimeSeconds(data) if var == 'time' else data)
+
+                try:
+                    # Ciclos del almacen local, los que no pasan la verificacion se descargan
+                    for task in localCycles:
+                        data = self.readFNLStore(storeFiles[task[3]], self.gridFNL, lVars)
+                        if data is None:
+                            tasks.append(task)
+                            continue
+                        for v in data.keys():
+                            storeVar(storeFiles[task[3]], v, task[3], data[v])
+                    # Ciclos no disponibles en el servidor: el tiempo del ciclo y las variables con _FillValue
+                    for task in missingCycles:
+                        storeVar(task[0], 'time', task[3], np.array([cycleTimes[task[3]]]))
+                        for v in lVars:
+                            storeVar(task[0], v, task[3], np.full(self.gridFNL.getVarShape(v, 1), self.fillValue, dtype='f4'))
+                    if incremental:
+                        log.info('FNL: ' + str(dimTimeSize - len(tasks)) + ' ciclos leidos del almacen local, ' + str(len(tasks)) + ' ciclos por descargar')
+                    self.downloadBlocks(tasks, self.gridFNL.irange, self.gridFNL.jrange, storeData, retries=cycleRetries, levels=self.gridFNL.levelIndexes)
+                except Exception as e:
+                    log.error('FNL: Fallo la descarga de una seccion de los datasets FNL: ' + str(e))
+                    if stream:
+                        self.closeStreamOutputs(outputs, False)
+                    self.reportRun(metrics, 'FNL', None)
+                    return None
+
+                # El almacen local solo conserva los ultimos fnlstorekeep dias
+                fnlstorekeep = self.getConfigValueInt('fnlstorekeep', 0)
+                if incremental and fnlstorekeep > 0:
+                    self.pruneFNLStore(lastFNLdate - dt.timedelta(days=fnlstorekeep))
+
                 # Una vez descargados todas las variables en la lista de np.arrays varlist
                 # decidimos que hacer con la informacion, la regresamos o la salvamos.
-                if saveData:
-                    # Dimensiones time(unlimited),   lat,                       lon
-                    #             None               gridFNL.latitudes.size     gridFNL.longitudes.size
-
-                    dimsA = {'time': None , 'lat': self.gridFNL.latitudes.size, 'lon': self.gridFNL.longitudes.size }
-                    dimVars = { 'time' : { 'dimensions': ['time']  , 'attributes' : {'units':'days since 0001-01-01 00:00:00', 'time_origin' : '0001-01-01 00:00:00', 'calendar' : 'ISO_GREGORIAN'} , 'dataType' : 'f8' }
-                               ,'lat' :  { 'dimensions': ['lat']   , 'attributes' : {'units':'degree_north'} , 'dataType' : 'f8' }
-                               ,'lon' :  { 'dimensions': ['lon']   , 'attributes' : {'units':'degree_east'}  , 'dataType' : 'f8' }  }
-                    dimVarData = {'time' : fnlTimeVar , 'lat' : self.gridFNL.latitudes , 'lon' : self.gridFNL.longitudes }
-                    dataVars= {}
-                    log.debug('Saving Variables: ' + str(lVars))
-                    log.debug('its units: ' + str(vUnit))
-                    log.debug('its longnames: ' + str(vLN))
-                    for vi in range(len(lVars)):
-                        try:
-                            _units = vUnit[vi]
-                        except Exception as e:
-                            _units = 'unknown'
-                        try:
-                            _longname = vLN[vi]
-                        except Exception as e:
-                            _longname = 'unknown'
-                        dataVars[lVars[vi]] =  {'dimensions': ['time','lat','lon'] , 'attributes' : {'units' : _units, 'long_name' : _longname , '_FillValue' : 9.999e+20 } , 'dataType' : 'f4' }
-
-                    myfile = netcdfFile()
-                    netcdfFilename = 'crudosFNL_' + fnl_date_start.strftime('%Y-%m-%d') + '__' + lastFNLdate.strftime('%Y-%m-%d') + '.nc'
-                    myfile.createFile(netcdfFilename)
-                    myfile.createDims(dimsA)
-                    myfile.createVars(dimVars)
-                    myfile.createVars(dataVars)
-                    myfile.saveData(dimVarData)
-                    myfile.saveData(varlist)
-                    myfile.closeFile()
+                if stream:
+                    if not self.closeStreamOutputs(outputs, True):
+                        self.reportRun(metrics, 'FNL', None)
+                        return None
+                elif saveData:
+                    if not self.saveOutputs(outputs, fnlTimeVar, varlist, lVars, vUnit, vLN):
+                        self.reportRun(metrics, 'FNL', None)
+                        return None
                 else:
-                    # TODO: Regresar las variables descargadas en formato diccionario
-                    pass
+                    self.reportRun(metrics, 'FNL', self.getOutputResult(outputs))
+                    return self.getMemoryOutputs(outputs, fnlTimeVar, varlist, lVars, vUnit, vLN)
 
-                return netcdfFilename
+                # Los archivos de salida se agregan a los almacenes de series de tiempo (llave appendstore)
+                if not self.appendStoreOutputs(outputs, lVars, vUnit, vLN):
+                    self.reportRun(metrics, 'FNL', None)
+                    return None
 
+                self.reportRun(metrics, 'FNL', self.getOutputResult(outputs))
+                return self.getOutputResult(outputs)
 
-            def downloadGFS(self, s_dataset, gfs_hd_date=None, run_time=0, offset=-1, saveData=True):
-                """
-                 Descarga datos del dataset especificado en s_dataset (gfs_hd, gfs_0p25 o gfs_0p50), por default toda la dimension
-                 temporal del dataset (today-1), runtime=00z.
-                 El codigo recorre la dimension temporal del dataset, haciendo la descarga en pasos.
-                  ---
-                 Recibe parametros opcionales gfs_hd_date (fecha tipo <python datetime>) que es la fecha del dataset del que se intentara hacer la descarga
-                 En el parametro run_time se especifica el dataset run_time, default 0, puede ser 0 , 6 , 12 , 18
-                """
+
+            def downloadGFS(self, s_dataset, gfs_hd_date=None, run_time=0, offset=-1, saveData=True, fhours=None):
                 """
                  Descarga datos del dataset especificado en s_dataset (gfs_hd, gfs_0p25 o gfs_0p50), por default toda la dimension
                  temporal del dataset (today-1), runtime=00z.
@@ -719,90 +3246,179 @@ class gfsData(gfsConfig):
                   ---
                  Recibe parametros opcionales gfs_hd_date (fecha tipo <python datetime>) que es la fecha del dataset del que se intentara hacer la descarga
                  En el parametro run_time se especifica el dataset run_time, default 0, puede ser 0 , 6 , 12 , 18
+                 Si run_time es None se usa el run_time mas reciente disponible de la fecha gfs_hd_date.
+                 fhours es la seleccion de horas de pronostico (p. ej. '0-120:1,120-384:12', ver parseHours), si no se
+                 especifica se lee la llave 'fhours' del archivo de configuracion, vacio = todos los registros. Las horas
+                 seleccionadas se piden con el minimo de solicitudes con paso constante (getTimeRequests).
+                 Regresa el nombre del archivo de salida, o con saveData=False los datos en memoria (ver getMemoryResult).
+                 Si hay regiones configuradas (grupo 'regions') regresa un <python dict> {region : resultado}.
+                 Regresa None si falla la descarga.
                 """
                 # Sacar informacion de unidades y nombres largos del archivo de configuracion.
                 vUnit = self.getConfigValueVL('units')
                 vLN = self.getConfigValueVL('longnames')
+                # Tiempo limite de la corrida para los reintentos, y metricas de la corrida
+                self.getRetryPolicy().startRun()
+                metrics = runMetrics(s_dataset, self.getRetryPolicy())
                 # Si no se especifica gfs_hd_date, usar hoy-1
                 if gfs_hd_date==None:
                     gfs_hd_date = dt.datetime.today() - dt.timedelta(days=1)
+                if fhours is None:
+                    fhours = self.getConfigValueOpt('fhours')
+                # Motor de descarga: OPeNDAP (default) o los archivos GRIB2 con su inventario .idx (engine = grib)
+                grib = self.getConfigValueOpt('engine', 'opendap').strip().lower() == 'grib'
+                if grib and eccodes is None:
+                    log.error('GFS_HD: El motor GRIB2 (engine = grib) requiere la libreria eccodes')
+                    self.reportRun(metrics, 'GFS_HD', None)
+                    return None
                 # Construir el nombre del dataset que buscamos
                 dataURL = gfsName()
-                fname = dataURL.getURLName(gfs_hd_date, run_time, s_dataset) # Instead of gfs_hd
-                if not self.datasetExists(fname):
-                    log.warning('GFS_HD:: Dataset: ' + fname + ' no se encuentra.')
-
-                # Obtenemos el tamano de la malla de lo que vamos a descargar, por default los datos de la malla se obtienen del archivo de
-                # configuracion
-                log.info('GFS_HD: Obteniendo el tamano de la malla GFS_HD del dataset: ' + str(fname))
+                engine = self.getGribEngine() if grib else None
+                if run_time is None:
+                    runTimes = [18, 12, 6, 0]
+                    if grib:
+                        found = -1
+                        for r in range(len(runTimes)):
+                            if engine.indexExists(engine.getFileURL(gfs_hd_date, runTimes[r], engine.getHours()[0], s_dataset)):
+                                found = r
+                                break
+                    else:
+                        found = self.findDataset([ dataURL.getURLName(gfs_hd_date, r, s_dataset) for r in runTimes ])
+                    run_time = runTimes[found] if found >= 0 else 0
+                    log.info('GFS_HD: run_time mas reciente disponible: ' + ("%02d"%run_time) + 'z')
+                lVars = self.getConfigValueVL('vars')
+                if grib and any([ self.getLevelValues(v) is not None for v in lVars ]):
+                    log.error('GFS_HD: El motor GRIB2 (engine = grib) no descarga variables 4D (grupo levels), usar engine = opendap')
+                    self.reportRun(metrics, 'GFS_HD', None)
+                    return None
+                # Ciclo de la corrida (fecha y run_time)
+                cycle = gfs_hd_date.replace(hour=0, minute=0, second=0, microsecond=0) + dt.timedelta(hours=run_time)
+                if grib:
+                    # Con el motor GRIB2 la seleccion de horas indica directamente los archivos que se descargan
+                    hours = self.parseHours(fhours) if fhours.strip() != '' else engine.getHours()
+                    fname = engine.getFileURL(gfs_hd_date, run_time, hours[0], s_dataset)
+                    log.info('GFS_HD: Obteniendo el tamano de la malla GFS_HD del archivo GRIB2: ' + str(fname))
+                    if not self.getGribGrid(self.gridGFS_HD, fname, s_dataset, lVars):
+                        log.error('GFS_HD: No se pudo obtener la malla del archivo GRIB2: ' + str(fname))
+                        self.reportRun(metrics, 'GFS_HD', None)
+                        return None
+                    self.getLevels(self.gridGFS_HD, fname, lVars)
+                    # El tiempo de cada hora de pronostico se calcula, no se descarga
+                    gfsTimeVar = np.array([ gribEngine.getTimeValue(cycle + dt.timedelta(hours=h)) for h in hours ])
+                else:
+                    fname = dataURL.getURLName(gfs_hd_date, run_time, s_dataset) # Instead of gfs_hd
+                    if not self.datasetExists(fname):
+                        log.warning('GFS_HD:: Dataset: ' + fname + ' no se encuentra.')
+
+                    # Obtenemos el tamano de la malla de lo que vamos a descargar, por default los datos de la malla se obtienen del archivo de
+                    # configuracion
+                    log.info('GFS_HD: Obteniendo el tamano de la malla GFS_HD del dataset: ' + str(fname))
+                    self.getGrid(self.gridGFS_HD, fname, s_dataset)
+                    # Niveles de las variables 4D, se resuelven una vez con la coordenada lev del dataset
+                    if not self.getLevels(self.gridGFS_HD, fname, lVars):
+                        self.reportRun(metrics, 'GFS_HD', None)
+                        return None
+                    try:
+                        gfsTimeVar = self.getTimeSeconds(self.getDataVector(fname, 'time'))
+                    except Exception as e:
+                        log.error('GFS_HD: Fallo la descarga de la variable time seccion del dataset: ' + str(fname))
+                        self.reportRun(metrics, 'GFS_HD', None)
+                        return None
                 if offset > 0:
                     log.info('GFS_HD: Descargando hasta el registro: ' + str(offset))
 
-                self.gridGFS_HD.getGFSgrid_default(fname)
-                try:
-                    gfsTimeVar = self.getDataVector(fname, 'time')
-                except Exception as e:
-                    log.error('GFS_HD: Fallo la descarga de la variable time seccion del dataset: ' + str(fname))
-                    return None
-
+                result = None
                 if not (gfsTimeVar is None):
-                    # Definir espacios para variables a descargar
-                    lVars = self.getConfigValueVL('vars')
+                    # Registros de tiempo que se descargan: los primeros offset registros, y de ellos los de las horas de
+                    # pronostico de la seleccion fhours. El eje de tiempo de la salida son solo esos registros.
+                    # Con el motor GRIB2 el eje ya son las horas de fhours y puede no iniciar en la hora 0, las horas se
+                    # cuentan desde el ciclo de la corrida.
+                    reftime = gribEngine.getTimeValue(cycle) if grib else None
                     if (offset > 0) and (offset < gfsTimeVar.size):
-                        dimTimeSize = offset
+                        tindex = self.getHourIndexes(gfsTimeVar[:offset], fhours, reftime)
                     else:
-                        dimTimeSize = gfsTimeVar.size
-                    varShape = [dimTimeSize, self.gridGFS_HD.jrange[1]-self.gridGFS_HD.jrange[0] , self.gridGFS_HD.irange[1]-self.gridGFS_HD.irange[0]]
+                        tindex = self.getHourIndexes(gfsTimeVar, fhours, reftime)
+                    if tindex.size == 0:
+                        log.error('GFS_HD: Ninguna hora de pronostico del dataset corresponde a la seleccion: ' + fhours)
+                        self.reportRun(metrics, 'GFS_HD', None)
+                        return None
+                    if tindex.size < gfsTimeVar.size:
+                        log.info('GFS_HD: Descargando ' + str(tindex.size) + ' de ' + str(gfsTimeVar.size) + ' registros de tiempo (fhours: ' + fhours + ')')
+                    gfsTimeVar = gfsTimeVar[tindex]
+                    dimTimeSize = tindex.size
+                    varShape = [dimTimeSize, self.gridGFS_HD.latitudes.size , self.gridGFS_HD.longitudes.size]
                     log.debug('GFS_HD: var grid size: ' + str(varShape))
                     log.debug('GFS_HD: irange ' + str(self.gridGFS_HD.irange))
                     log.debug('GFS_HD: jrange ' + str(self.gridGFS_HD.jrange))
-                    # Creamos el diccionario de las variables con sus tamanos listos
-                    varlist= {}
-                    for v in lVars:
-                        varlist[v] =  np.zeros( (varShape[0] , varShape[1], varShape[2]) )
+                    netcdfFilename = 'crudos' + s_dataset.upper() + '_' + gfs_hd_date.strftime('%Y-%m-%d') + '_' + ("%02d"%run_time) + 'z.nc'
+                    # Se descarga la submalla que cubre todas las regiones, y se escribe un archivo por region
+                    outputs = self.getOutputs(self.gridGFS_HD, netcdfFilename, 'crudos' + s_dataset.upper())
+                    if grib:
+                        # Una tarea por hora de pronostico con todas las variables, un inventario .idx por archivo GRIB2
+                        tasks = [ (engine.getFileURL(gfs_hd_date, run_time, hours[t], s_dataset), lVars, [t, t+1], k) for k, t in enumerate(tindex) ]
+                        fetch = gfsData.fetchGribBlock
+                    else:
+                        # Cada variable se pide en bloques de tiempo [t0,t1,paso] de los registros seleccionados
+                        tasks = [ (fname, v, trange, tpos) for trange, tpos in self.getTimeRequests(tindex) for v in lVars ]
+                        fetch = gfsData.fetchBlock
+
+                    # En modo stream el archivo de salida se crea antes de la descarga y cada bloque se escribe
+                    # en cuanto llega, sin mantener en memoria todas las variables.
+                    # Con resume = yes (siempre en modo stream) la descarga se puede reanudar, ver openStreamFile.
+                    resume = saveData and self.getConfigValueBool('resume')
+                    stream = saveData and (self.getConfigValueBool('stream') or resume)
+                    if stream:
+                        plan = [ k for task in tasks for k in self.getTaskKeys(task) ] if resume else None
+                        if not self.openStreamOutputs(outputs, lVars, vUnit, vLN, plan):
+                            self.reportRun(metrics, 'GFS_HD', None)
+                            return None
+                        for output in outputs:
+                            output['myfile'].saveData({'time' : gfsTimeVar })
+                        # Solo los bloques que faltan en los archivos parciales
+                        tasks = self.pendingTasks(outputs, tasks)
+                    else:
+                        # Creamos el diccionario de las variables con sus tamanos listos
+                        varlist= {}
+                        for v in lVars:
+                            varlist[v] =  np.zeros( self.gridGFS_HD.getVarShape(v, dimTimeSize), dtype='f4' )
+
+                    def storeData(task, data):
+                        _fname, var, tb, tpos = task
+                        # Las tareas del motor GRIB2 regresan todas las variables de una hora de pronostico
+                        for v, d in (data.items() if isinstance(data, dict) else [(var, data)]):
+                            if stream:
+                                self.saveStreamOutputs(outputs, v, d, slice(tpos, tpos + d.shape[0]), self.getTaskKeys((_fname, v, tb, tpos)))
+                            else:
+                                varlist[v][tpos:tpos + d.shape[0]] = d
+                            log.info('GFS_HD: Se descargo la variable ' + v + ', shape: '  + str(d.shape) + ' , Time steps : ' + str(tb))
 
-                    for t in range(gfsTimeVar.size):
-                        if (offset < 0) or (t < offset):
-                            for vn in range(len(lVars)):
-                                try:
-                                    varlist[lVars[vn]][t,:,:] = self.getData(fname, lVars[vn], [t,t+1], self.gridGFS_HD.irange, self.gridGFS_HD.jrange)
-                                    log.info('GFS_HD: Se descargo la variable ' + lVars[vn] + ', shape: '  + str(varlist[lVars[vn]][t,:,:].shape) + ' , Time step : ' + str(t))
-                                except Exception as e:
-                                    log.error('GFS_HD: Fallo la descarga de una seccion del dataset: ' + str(fname))
-                                    return None
-                        else:
-                            log.info('GFS_HD: Downloading only at offset limit: ' + str(offset))
-                            break
+                    try:
+                        self.downloadBlocks(tasks, self.gridGFS_HD.irange, self.gridGFS_HD.jrange, storeData, fetch=fetch, levels=self.gridGFS_HD.levelIndexes)
+                    except Exception as e:
+                        log.error('GFS_HD: Fallo la descarga de una seccion del dataset: ' + str(fname))
+                        if stream:
+                            self.closeStreamOutputs(outputs, False)
+                        self.reportRun(metrics, 'GFS_HD', None)
+                        return None
 
                     # Una vez descargados todas las variables en la lista de np.arrays varlist
                     # decidimos que hacer con la informacion, la regresamos o la salvamos.
-
-                    if saveData:
-                        # Dimensiones time(unlimited),   lat,                       lon
-                        #             None               gridFNL.latitudes.size     gridFNL.longitudes.size
-                        dimsA = {'time': None , 'lat': self.gridGFS_HD.latitudes.size, 'lon': self.gridGFS_HD.longitudes.size }
-                        dimVars = { 'time' : { 'dimensions': ['time']  , 'attributes' : {'units':'days since 0001-01-01 00:00:00', 'time_origin' : '0001-01-01 00:00:00', 'calendar' : 'ISO_GREGORIAN'} , 'dataType' : 'f8' }
-                                   ,'lat' :  { 'dimensions': ['lat']   , 'attributes' : {'units':'degree_north'} , 'dataType' : 'f8' }
-                                   ,'lon' :  { 'dimensions': ['lon']   , 'attributes' : {'units':'degree_east'}  , 'dataType' : 'f8' }  }
-                        dimVarData = {'time' : gfsTimeVar , 'lat' : self.gridGFS_HD.latitudes , 'lon' : self.gridGFS_HD.longitudes }
-                        dataVars= {}
-                        for vi in range(len(lVars)):
-                            dataVars[lVars[vi]] =  {'dimensions': ['time','lat','lon'] , 'attributes' : {'units' : vUnit[vi], 'long_name' : vLN[vi] , '_FillValue' : 9.999e+20 } , 'dataType' : 'f4' }
-
-                        myfile = netcdfFile()
-                        netcdfFilename = 'crudos' + s_dataset.upper() + '_' + gfs_hd_date.strftime('%Y-%m-%d') + '_' + ("%02d"%run_time) + 'z.nc'
-                        myfile.createFile(netcdfFilename)
-                        myfile.createDims(dimsA)
-                        myfile.createVars(dimVars)
-                        myfile.createVars(dataVars)
-                        myfile.saveData(dimVarData)
-                        myfile.saveData(varlist)
-                        myfile.closeFile()
+                    if stream:
+                        result = self.getOutputResult(outputs) if self.closeStreamOutputs(outputs, True) else None
+                    elif saveData:
+                        if not self.saveOutputs(outputs, gfsTimeVar, varlist, lVars, vUnit, vLN):
+                            self.reportRun(metrics, 'GFS_HD', None)
+                            return None
+                        result = self.getOutputResult(outputs)
                     else:
-                        #TODO: Regresar las variables descargadas en formato python diccionario
-                        pass
+                        result = self.getMemoryOutputs(outputs, gfsTimeVar, varlist, lVars, vUnit, vLN)
+
+                    # Los archivos de salida se agregan a los almacenes de series de tiempo (llave appendstore)
+                    if saveData and result is not None and not self.appendStoreOutputs(outputs, lVars, vUnit, vLN, gribEngine.getTimeValue(cycle)):
+                        result = None
 
-                return netcdfFilename
+                self.reportRun(metrics, 'GFS_HD', None if result is None else self.getOutputResult(outputs))
+                return result
 
 
 
@@ -0,0 +1,169 @@
+import os, sys
+import shutil
+import argparse
+import logging as log
+import gfsDownload as gD
+import datetime as dt
+from concurrent.futures import ProcessPoolExecutor
+
+
+"""
+ Script para rellenar (backfill) un rango de fechas con los mismos archivos que genera raw_download_daily.py para
+ cada fecha: FNL de (fecha - 2dias - hdays) a (fecha - 2dias) y la corrida 00z de GFS de (fecha - 1dia), en el
+ directorio <outdir>/YYYYMMDD de cada fecha (llave outdir de gfsconfig.cfg, vacio = ./out).
+ Las ventanas hdays de FNL de fechas consecutivas se traslapan, por eso primero se planean los ciclos FNL y las
+ corridas GFS unicos de todo el rango. Los ciclos FNL se descargan una sola vez al almacen local (llave fnlstore)
+ en una sola cola de descarga, y el archivo FNL de cada fecha se arma con los ciclos del almacen. Las corridas GFS
+ se descargan --jobs al mismo tiempo, repartiendo entre ellas las --workers conexiones.
+ Si falla alguna fecha, se puede volver a ejecutar: los ciclos FNL que ya estan en el almacen no se descargan otra vez.
+ Sin almacen local (fnlstore vacio) cada fecha descarga su ventana hdays completa.
+
+ Uso:
+
+  > python raw_download_backfill.py 20220501 20220531
+
+  # 2 corridas de GFS al mismo tiempo, con 8 conexiones en total (4 por corrida)
+  > python raw_download_backfill.py 20220501 20220531 --jobs 2 --workers 8
+
+"""
+
+def downloadGFSRun(s_dataset, date, workers, outdir):
+    """
+     Descarga la corrida 00z de GFS de la fecha date con workers conexiones en el directorio outdir, en un proceso
+     del pool de corridas.
+    """
+    myData = gD.gfsData()
+    myData.workers = workers
+    myData.outdir = outdir
+    return myData.downloadGFS(s_dataset, date)
+
+def publishFiles(result, days, sOutDir):
+    """
+     Verifica los archivos de result (nombre del archivo o <python dict> {region : archivo}), que se escriben en el
+     directorio sOutDir/YYYYMMDD de la primera fecha de days, las demas fechas que usan la misma descarga reciben
+     un hard link (de cada archivo del store con output = zarr).
+     Regresa False si fallo la descarga o no existe alguno de los archivos.
+    """
+    if not result:
+        return False
+    files = list(result.values()) if isinstance(result, dict) else [result]
+    if not all([ os.path.exists(f) for f in files ]):
+        return False
+    for f in files:
+        for day in days[1:]:
+            target = os.path.join(sOutDir, day.strftime('%Y%m%d'), os.path.basename(f))
+            gD.netcdfFile.removePath(target)
+            if os.path.isdir(f):
+                # Store Zarr (output = zarr): un hard link de cada archivo del store
+                shutil.copytree(f, target, copy_function=os.link)
+            else:
+                os.link(f, target)
+    return True
+
+def main():
+
+    sWorkingDir = './'
+    sOutDir = './out'
+    sLogFile = 'rawdownload_backfill.log'
+    sDataset = 'gfs_0p25'
+
+    parser = argparse.ArgumentParser(description='Descarga FNL y GFS de un rango de fechas, en el directorio out/YYYYMMDD de cada fecha.')
+    parser.add_argument('start', help='Primera fecha YYYYMMDD')
+    parser.add_argument('end', help='Ultima fecha YYYYMMDD')
+    parser.add_argument('--jobs', type=int, default=2, help='Corridas de GFS que se descargan al mismo tiempo')
+    parser.add_argument('--workers', type=int, default=None, help='Conexiones en total (default: llave workers de gfsconfig.cfg)')
+    gD.gfsSettings.addArguments(parser)
+    args = parser.parse_args()
+
+    # Inicio del proceso
+    dStartTime = dt.datetime.today()
+    os.chdir(sWorkingDir)
+    log.basicConfig(filename=sLogFile, level=log.INFO,)
+
+    # Configuracion compartida por las descargas, con los cambios de llaves de la linea de comandos
+    try:
+        gD.gfsConfig.setup(args.config, args.set)
+    except gD.gfsConfigError as e:
+        print('Error en la configuracion: ' + str(e))
+        return 1
+
+    dStart = dt.datetime.strptime(args.start,'%Y%m%d')
+    dEnd = dt.datetime.strptime(args.end,'%Y%m%d')
+    days = [ dStart + dt.timedelta(days=n) for n in range((dEnd - dStart).days + 1) ]
+    if len(days) == 0:
+        print('La fecha final es anterior a la fecha inicial')
+        return 1
+
+    myData = gD.gfsData()
+    nWorkers = args.workers if args.workers is not None else myData.getWorkers()
+    # Directorios de salida de las fechas, se crean antes de las descargas
+    sOutDir = myData.getConfigValueOpt('outdir').strip() or sOutDir
+    for day in days:
+        if not os.path.exists(os.path.join(sOutDir, day.strftime('%Y%m%d'))):
+            os.makedirs(os.path.join(sOutDir, day.strftime('%Y%m%d')))
+    nJobs = max(1, min(args.jobs, nWorkers))
+    hdays = int(myData.getConfigValue('hdays'))
+
+    log.info('-----------------------------------------------')
+    log.info('Iniciando backfill de las fechas: ' + str(dStart) + ' a ' + str(dEnd))
+
+    # Plan: las corridas GFS unicas, {fecha de la corrida : fechas que la usan}
+    runsGFS = {}
+    for day in days:
+        runsGFS.setdefault(day - dt.timedelta(days=1), []).append(day)
+
+    # Los ciclos FNL unicos de todas las ventanas se descargan una sola vez al almacen local, con todas las conexiones
+    myData.workers = nWorkers
+    if myData.getFNLStoreFile(dStart, 0) is None:
+        log.warning('No esta configurado el almacen local de FNL (llave fnlstore), cada fecha descarga su ventana hdays completa')
+        nCycles = 0
+    else:
+        nCycles = myData.fillFNLStore(dStart - dt.timedelta(days=2+hdays), dEnd - dt.timedelta(days=2))
+        log.info('Ciclos FNL descargados al almacen local: ' + str(nCycles))
+
+    failed = []
+    pool = ProcessPoolExecutor(max_workers=nJobs)
+    try:
+        # Las corridas GFS se descargan en el pool mientras se arman los archivos FNL de cada fecha
+        futures = {}
+        for date in sorted(runsGFS.keys()):
+            futures[date] = pool.submit(downloadGFSRun, sDataset, date, max(1, nWorkers // nJobs),
+                                        os.path.join(sOutDir, runsGFS[date][0].strftime('%Y%m%d')))
+
+        if nCycles is not None:
+            for day in days:
+                myData.outdir = os.path.join(sOutDir, day.strftime('%Y%m%d'))
+                fileFNL = myData.downloadFNL(day - dt.timedelta(days=2))
+                log.info('Se descargo datos del catalogo FNL en el archivo ::: ' + str(fileFNL))
+                if not publishFiles(fileFNL, [day], sOutDir):
+                    log.error('Fallo la descarga de FNL de la fecha ' + day.strftime('%Y%m%d'))
+                    failed.append(day)
+        else:
+            log.error('Fallo la descarga de los ciclos FNL al almacen local')
+            failed.extend(days)
+
+        for date in sorted(futures.keys()):
+            try:
+                fileGFS = futures[date].result()
+            except Exception as e:
+                log.error('Fallo la descarga de GFS de la fecha ' + date.strftime('%Y%m%d') + ': ' + str(e))
+                fileGFS = None
+            log.info('Se descargo datos del catalogo GFS en el archivo :: ' + str(fileGFS))
+            if not publishFiles(fileGFS, runsGFS[date], sOutDir):
+                log.error('Fallo la descarga de GFS de la fecha ' + date.strftime('%Y%m%d'))
+                failed.extend(runsGFS[date])
+    finally:
+        pool.shutdown()
+
+    failed = sorted(set(failed))
+    for day in failed:
+        print('Fallo la descarga de la fecha ' + day.strftime('%Y%m%d'))
+    dProcessTime = int((dt.datetime.today() - dStartTime).total_seconds())
+    log.info('Termino el backfill, ' + str(len(days) - len(failed)) + ' de ' + str(len(days)) + ' fechas completas, proceso tardo :: '
+             + str(dProcessTime // 60) + ' minutos ' + str(dProcessTime % 60) + ' segundos' )
+    log.info('-----------------------------------------------')
+    return 1 if len(failed) > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,6 @@
 import os, sys
-import shutil
+import argparse
 import logging as log
-import numpy as np
-import netCDF4 as nc
 import gfsDownload as gD
 import datetime as dt
 
@@ -12,73 +10,139 @@ import datetime as dt
  Se descargan 6 dias de datos reanalizados FNL y el pronostico de 6 dias del dataset GFS_HD.
  La informacion se almacena en archivos netcdf, uno para FNL y otro para GFS_HD, cada uno con
  distinta resolucion espacial y temporal.
+ Las descargas de FNL y GFS corren una despues de la otra y comparten un solo pool de procesos con todas las
+ conexiones de la llave workers de gfsconfig.cfg, asi ninguna conexion queda sin usar cuando termina una de las
+ descargas. Al terminar se reporta el tiempo de cada descarga.
+ Los archivos se escriben directamente en <outdir>/YYYYMMDD (llave outdir de gfsconfig.cfg, vacio = ./out), cada
+ archivo se escribe a un archivo temporal en ese directorio y se publica con un rename al terminar.
 
  Uso:
 
   # Descarga a partir de la fecha de hoy.
-  > python raw_download_daily
+  > python raw_download_daily.py
 
 
   # Es posible especificar un fecha:
-  > python raw_download_daily 20220528
+  > python raw_download_daily.py 20220528
 
   # Lo anterior descarga datos de FNL a partir de 20220528 - 2dias
   # Descarga datos de GFS a partir de 20220528 - 1dias
 
+  # Solo una de las descargas (antes raw_download_daily_fnl.py y raw_download_daily_gfs.py)
+  > python raw_download_daily.py 20220528 --jobs fnl
+  > python raw_download_daily.py 20220528 --jobs gfs
+
+  # Otro archivo de configuracion y cambios de llaves (tambien con las variables de ambiente GFSCONFIG y GFSCONFIG_SET)
+  > python raw_download_daily.py 20220528 --config /ruta/gfsconfig.cfg --set workers=16 --set storage.complevel=6
+
 """
 
+# Descargas del proceso diario: nombre de la descarga y dataset de GFS
+JOBS = ['fnl', 'gfs']
+GFS_DATASET = 'gfs_0p25'
+
 def failNotification(message='Fallo en la descarga'):
     # TODO Add notification system
     log.error('Enviando notificacion: ' + message)
 
+def runJob(job, dToday, pool, outdir):
+    """
+     Ejecuta la descarga job ('fnl' o 'gfs') de la fecha dToday con el pool de procesos compartido pool (None = sin
+     workers). Los archivos de salida se escriben en el directorio outdir.
+     Regresa (resultado de downloadFNL o downloadGFS, segundos que tardo la descarga).
+    """
+    dStartTime = dt.datetime.today()
+    myData = gD.gfsData()
+    myData.pool = pool
+    myData.outdir = outdir
+    if job == 'fnl':
+        result = myData.downloadFNL(dToday - dt.timedelta(days=2))
+    else:
+        result = myData.downloadGFS(GFS_DATASET, dToday - dt.timedelta(days=1))
+    return result, (dt.datetime.today() - dStartTime).total_seconds()
+
+def formatSeconds(seconds):
+    seconds = int(seconds)
+    return str(seconds // 60) + ' minutos ' + str(seconds % 60) + ' segundos'
+
 def main():
 
     sWorkingDir = './'
     sOutDir = './out'
     sLogFile = 'rawdownload.log'
 
+    parser = argparse.ArgumentParser(description='Descarga diaria de FNL y GFS, en el directorio out/YYYYMMDD.')
+    parser.add_argument('date', nargs='?', default=None, help='Fecha YYYYMMDD (default: hoy)')
+    parser.add_argument('--jobs', nargs='+', choices=JOBS, default=JOBS, help='Descargas que se ejecutan (default: fnl gfs)')
+    gD.gfsSettings.addArguments(parser)
+    args = parser.parse_args()
+
+    # Inicio del proceso, la fecha dToday puede venir de los argumentos
+    dStartTime = dt.datetime.today()
     os.chdir(sWorkingDir)
     log.basicConfig(filename=sLogFile, level=log.INFO,)
 
-    if len(sys.argv) > 1:
-        print (sys.argv[1])
-        dToday = dt.datetime.strptime(sys.argv[1],'%Y%m%d')
+    # Configuracion compartida por las descargas, con los cambios de llaves de la linea de comandos
+    try:
+        gD.gfsConfig.setup(args.config, args.set)
+    except gD.gfsConfigError as e:
+        print('Error en la configuracion: ' + str(e))
+        return 1
+
+    if args.date is not None:
+        print (args.date)
+        dToday = dt.datetime.strptime(args.date,'%Y%m%d')
     else:
         dToday = dt.datetime.today()
 
     sDirName = dToday.strftime('%Y%m%d')
+    jobs = [ job for job in JOBS if job in args.jobs ]
     myData = gD.gfsData()
+    nWorkers = myData.getWorkers()
+    # Directorio de salida de la fecha, se crea antes de las descargas
+    sOutDir = os.path.join(myData.getConfigValueOpt('outdir').strip() or sOutDir, sDirName)
+    if not os.path.exists(sOutDir):
+        os.makedirs(sOutDir)
 
     log.info('-----------------------------------------------')
-    log.info('Iniciando descarga de la fecha: ' + str(dToday))
-    ## Descargamos datos y generamos archivos crudos.
-    fileFNL = myData.downloadFNL(dToday - dt.timedelta(days=2))
-    log.info('Se descargo datos del catalogo FNL en el archivo ::: ' + str(fileFNL))
-
-    fileGFS = myData.downloadGFS('gfs_0p25', dToday - dt.timedelta(days=1))
-    log.info('Se descargo datos del catalogo GFS en el archivo :: ' + str(fileGFS))
-
-    # Verificar que la informacion exista en sitio
-    if fileFNL == None or fileGFS == None:
-        failNotification()
-    elif ((not os.path.exists(fileFNL)) or (not os.path.exists(fileGFS))):
-        failNotification()
-    else:
-        # Salvar archivos en sOutDir
-        if os.path.exists(os.path.join(sOutDir,sDirName)):
-            shutil.copy(fileFNL,os.path.join(sOutDir,sDirName))
-            shutil.copy(fileGFS,os.path.join(sOutDir,sDirName))
-            os.remove(fileFNL)
-            os.remove(fileGFS)
-        else:
-            os.makedirs(os.path.join(sOutDir,sDirName))
-            shutil.move(fileFNL,os.path.join(sOutDir,sDirName))
-            shutil.move(fileGFS,os.path.join(sOutDir,sDirName))
-
-    dProcessTime = dt.datetime.today() - dToday
-    log.info('Termino el proceso de descarga, proceso tardo :: ' + str(dProcessTime.seconds/60) + ' minutos ' + str(dProcessTime.seconds % 60) + ' segundos' )
+    log.info('Iniciando descarga de la fecha: ' + str(dToday) + ', descargas: ' + ', '.join(jobs) + ', workers: ' + str(nWorkers))
+    ## Descargamos datos y generamos archivos crudos, las descargas usan el mismo pool de procesos.
+    pool = gD.gfsData.newProcessPool(nWorkers) if nWorkers > 1 else None
+    results = {}
+    try:
+        for job in jobs:
+            dJobStart = dt.datetime.today()
+            try:
+                results[job] = runJob(job, dToday, pool, sOutDir)
+            except Exception as e:
+                log.error('Fallo la descarga ' + job.upper() + ': ' + str(e))
+                results[job] = (None, (dt.datetime.today() - dJobStart).total_seconds())
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    failed = []
+    for job in jobs:
+        result, seconds = results[job]
+        log.info('Se descargo datos del catalogo ' + job.upper() + ' en el archivo ::: ' + str(result))
+        log.info('Descarga ' + job.upper() + ' tardo :: ' + formatSeconds(seconds))
+
+        # Con regiones configuradas (grupo regions) se regresa un archivo por region
+        files = list(result.values()) if isinstance(result, dict) else [result]
+
+        # Verificar que la informacion exista en sitio
+        if not result or not all([ os.path.exists(f) for f in files ]):
+            log.error('Fallo la descarga de ' + job.upper() + ', no existe la ruta: ' + str(result))
+            failed.append(job)
+
+    if len(failed) > 0:
+        failNotification('Fallo en la descarga: ' + ', '.join(failed))
+
+    log.info('Termino el proceso de descarga, proceso tardo :: ' + formatSeconds((dt.datetime.today() - dStartTime).total_seconds())
+             + ' (' + ', '.join([ job.upper() + ' ' + ('%.1f' % results[job][1]) + ' seg.' for job in jobs ]) + ')')
     log.info('-----------------------------------------------')
-    return
+    return 1 if len(failed) > 0 else 0
 
 
-main()
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'code'))
+
+import gfsDownload as gD
+
+
+# Llaves del grupo gfs_data, las pruebas pueden cambiarlas o agregar otras
+DEFAULTS = {'url' : '/tmp', 'lonmin' : 260, 'lonmax' : 290, 'latmin' : 5, 'latmax' : 35, 'hdays' : 2}
+
+CONFIG = """[gfs_data]
+{extra}
+
+[variables]
+vars = ugrd10m, tmp2m
+longnames = u wind, temp
+units = m/s, K
+"""
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    """
+     Regresa una funcion que escribe un gfsconfig.cfg en tmp_path con las llaves extra del grupo gfs_data y lo carga
+     como configuracion compartida. Las pruebas corren en tmp_path.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv('GFSCONFIG_SET', raising=False)
+
+    def setup(**keys):
+        configfile = tmp_path / 'gfsconfig.cfg'
+        keys = dict(DEFAULTS, **keys)
+        configfile.write_text(CONFIG.format(extra='\n'.join([ k + ' = ' + str(v) for k, v in keys.items() ])))
+        return gD.gfsConfig.setup(str(configfile))
+
+    yield setup
+    gD.gfsConfig.settings = None
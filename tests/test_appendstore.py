@@ -0,0 +1,73 @@
+import os
+
+import numpy as np
+
+import gfsDownload as gD
+
+
+def makeOutput(myData, grid, name, times, value):
+    outputFile = os.path.join('out', name + '.nc')
+    myfile = myData.createOutputFile(outputFile, grid, ['ugrd10m', 'tmp2m'], ['m/s', 'K'], ['u wind', 'temp'])
+    data = np.full((len(times), grid.latitudes.size, grid.longitudes.size), value, dtype='f4')
+    myfile.saveData({'time' : np.array(times, dtype='f8'), 'ugrd10m' : data, 'tmp2m' : data + 273})
+    myfile.closeFile()
+    return {'name' : None, 'grid' : grid, 'file' : outputFile, 'store' : os.path.join('store', 'crudosGFS.nc')}
+
+
+def readAll(myData):
+    data = myData.readStore(os.path.join('store', 'crudosGFS.nc'))
+    return dict([ (k, np.ma.getdata(v).copy()) for k, v in data.items() ])
+
+
+def test_appendStore_idempotent(config):
+    config()
+    myData = gD.gfsData()
+    grid = gD.gfsSubgrid()
+    grid.latitudes = np.arange(5.0, 8.0)
+    grid.longitudes = np.arange(260.0, 264.0)
+    hour = 3600.0
+    first = makeOutput(myData, grid, 'dia1', [0, 6*hour, 12*hour, 18*hour], 1.0)
+    second = makeOutput(myData, grid, 'dia2', [12*hour, 18*hour, 24*hour, 30*hour], 2.0)
+    args = (['ugrd10m', 'tmp2m'], ['m/s', 'K'], ['u wind', 'temp'])
+
+    assert myData.appendStore(first, *args, refTime=0.0)
+    assert myData.appendStore(second, *args, refTime=12*hour)
+    store = readAll(myData)
+    assert store['time'].tolist() == [0, 6*hour, 12*hour, 18*hour, 24*hour, 30*hour]
+    assert store['ugrd10m'][:, 0, 0].tolist() == [1, 1, 2, 2, 2, 2]
+
+    # Volver a agregar los mismos archivos (en cualquier orden) no cambia el almacen
+    for output, refTime in ((second, 12*hour), (first, 0.0)):
+        assert myData.appendStore(output, *args, refTime=refTime)
+        again = readAll(myData)
+        assert sorted(again.keys()) == sorted(store.keys())
+        for k in store.keys():
+            assert np.array_equal(again[k], store[k]), k
+
+
+def test_appendStore_mismatch(config):
+    config()
+    myData = gD.gfsData()
+    grid = gD.gfsSubgrid()
+    grid.latitudes = np.arange(5.0, 8.0)
+    grid.longitudes = np.arange(260.0, 264.0)
+    hour = 3600.0
+    first = makeOutput(myData, grid, 'dia1', [0, 6*hour], 1.0)
+    assert myData.appendStore(first, ['ugrd10m', 'tmp2m'], ['m/s', 'K'], ['u wind', 'temp'], refTime=0.0)
+    store = readAll(myData)
+
+    # Un archivo con otras variables no se agrega y el almacen no cambia
+    outputFile = os.path.join('out', 'dia2.nc')
+    myfile = myData.createOutputFile(outputFile, grid, ['ugrd10m', 'vgrd10m'], ['m/s', 'm/s'], ['u wind', 'v wind'])
+    data = np.full((2, grid.latitudes.size, grid.longitudes.size), 2.0, dtype='f4')
+    myfile.saveData({'time' : np.array([12*hour, 18*hour], dtype='f8'), 'ugrd10m' : data, 'vgrd10m' : data})
+    myfile.closeFile()
+    second = dict(first, file=outputFile)
+    assert not myData.appendStore(second, ['ugrd10m', 'vgrd10m'], ['m/s', 'm/s'], ['u wind', 'v wind'], refTime=12*hour)
+    again = readAll(myData)
+    assert sorted(again.keys()) == sorted(store.keys())
+    for k in store.keys():
+        assert np.array_equal(again[k], store[k]), k
+
+    # El archivo debe tener las variables que se agregan
+    assert not myData.appendStore(first, ['ugrd10m', 'vgrd10m'], ['m/s', 'm/s'], ['u wind', 'v wind'], refTime=0.0)
@@ -0,0 +1,45 @@
+import netCDF4 as nc
+import numpy as np
+
+import gfsDownload as gD
+
+
+def makeDataset(path, lon, lat):
+    dst = nc.Dataset(path, 'w')
+    dst.createDimension('time', 2)
+    dst.createDimension('lat', lat.size)
+    dst.createDimension('lon', lon.size)
+    dst.createVariable('lon', 'f8', ('lon',))[:] = lon
+    dst.createVariable('lat', 'f8', ('lat',))[:] = lat
+    # Cada punto guarda su longitud, para verificar el orden de los segmentos
+    dst.createVariable('tmp2m', 'f4', ('time', 'lat', 'lon'))[:] = np.broadcast_to(lon, (2, lat.size, lon.size))
+    dst.close()
+
+
+def test_dateline_segments(config, tmp_path):
+    config()
+    lon = np.arange(0.0, 360.0)
+    lat = np.arange(-90.0, 91.0)
+    fname = str(tmp_path / 'global.nc')
+    makeDataset(fname, lon, lat)
+
+    grid = gD.gfsSubgrid()
+    assert grid.getGFSgrid(fname, -10, 10, 5, 35, readCoords=lambda: (lon, lat)) == 1
+    assert grid.irange.tolist() == [[349, 360], [0, 12]]
+    assert grid.longitudes.tolist() == list(np.arange(-11.0, 12.0))
+    assert grid.gridShape == (181, 360)
+
+    data = gD.gfsData().getData(fname, 'tmp2m', [0, 2], grid.irange, grid.jrange)
+    assert data.shape == (2, grid.latitudes.size, grid.longitudes.size)
+    assert not np.ma.is_masked(data)
+    assert data[1, 0, :].tolist() == list(np.concatenate((np.arange(349.0, 360.0), np.arange(0.0, 12.0))))
+
+
+def test_single_segment(config):
+    config()
+    lon = np.arange(0.0, 360.0)
+    lat = np.arange(-90.0, 91.0)
+    grid = gD.gfsSubgrid()
+    grid.getGFSgrid('global.nc', 260, 290, 5, 35, readCoords=lambda: (lon, lat))
+    assert grid.irange.tolist() == [259, 292]
+    assert grid.jrange.tolist() == [94, 127]
@@ -0,0 +1,163 @@
+import os
+import datetime as dt
+
+import numpy as np
+import netCDF4 as nc
+import pytest
+
+import gfsDownload as gD
+import gfsBenchmark as gB
+
+DATE = dt.datetime(2022, 5, 27)
+VARS = ['ugrd10m', 'tmp2m', 'tmpprs']
+
+
+@pytest.fixture(scope='module')
+def server(tmp_path_factory):
+    """
+     Servidor OPeNDAP local (gfsBenchmark.dapServer) con el dataset sintetico gfs_0p25 de DATE 00z, con las variables
+     VARS (tmpprs es 4D) escritas en una region pequena.
+    """
+    dataDir = str(tmp_path_factory.mktemp('data'))
+    gB.syntheticDatasets(dataDir, VARS, (265.0, 275.0, 10.0, 15.0)).create('gfs_0p25', DATE, 0)
+    myServer = gB.dapServer(dataDir)
+    myServer.start()
+    yield myServer
+    myServer.stop()
+
+
+def download(config, server, overrides=(), **keys):
+    """
+     Descarga las horas 0 a 24 de gfs_0p25 de DATE del servidor local con las llaves keys del grupo gfs_data y los
+     cambios de llaves overrides ([grupo.]llave=valor). Regresa el resultado de downloadGFS.
+    """
+    keys = dict({'url' : server.getURL(), 'lonmin' : 266, 'lonmax' : 274, 'latmin' : 11, 'latmax' : 14,
+                 'fhours' : '0-24:3', 'retries' : 0}, **keys)
+    config(**keys)
+    gD.gfsConfig.setup('gfsconfig.cfg', list(overrides))
+    return gD.gfsData().downloadGFS('gfs_0p25', DATE)
+
+
+def readOutput(fileName):
+    """
+     Lee el archivo de salida fileName (netcdf o store Zarr), regresa un <python dict> {var : (dimensiones, tipo, datos)}.
+    """
+    myfile = gD.zarrFile() if os.path.isdir(fileName) else gD.netcdfFile()
+    assert myfile.openFile(fileName, 'r') == 0
+    try:
+        return dict([ (v, info + (myfile.readData(v),)) for v, info in myfile.getVarInfo().items() ])
+    finally:
+        myfile.closeFile()
+
+
+def assertSameOutput(fileName, reference):
+    data = readOutput(fileName)
+    expected = readOutput(reference)
+    assert sorted(data.keys()) == sorted(expected.keys())
+    for v in expected.keys():
+        assert data[v][:2] == expected[v][:2], v
+        assert np.array_equal(np.ma.getmaskarray(data[v][2]), np.ma.getmaskarray(expected[v][2])), v
+        assert np.array_equal(np.ma.filled(data[v][2], 0), np.ma.filled(expected[v][2], 0)), v
+
+
+def test_workers(config, server):
+    reference = download(config, server, workers=1)
+    os.rename(reference, 'referencia.nc')
+    result = download(config, server, workers=3)
+    assert result == 'crudosGFS_0P25_2022-05-27_00z.nc'
+    data = readOutput(result)['tmp2m'][2]
+    assert data.shape[0] == 9 and not np.ma.is_masked(data)
+    assertSameOutput(result, 'referencia.nc')
+
+
+def test_stream(config, server):
+    reference = download(config, server)
+    os.rename(reference, 'referencia.nc')
+    result = download(config, server, stream='yes', tblock=4)
+    assertSameOutput(result, 'referencia.nc')
+
+
+def test_resume(config, server, monkeypatch):
+    reference = download(config, server)
+    os.rename(reference, 'referencia.nc')
+
+    # Cada bloque que se pide al servidor, la primera descarga falla en el quinto y deja el archivo parcial
+    fetchBlock = gD.gfsData.fetchBlock
+    calls = []
+    def countingFetch(task, *args, **kwargs):
+        calls.append(str(task))
+        if len(calls) == failAt:
+            raise RuntimeError('Falla simulada')
+        return fetchBlock(task, *args, **kwargs)
+    monkeypatch.setattr(gD.gfsData, 'fetchBlock', staticmethod(countingFetch))
+    failAt = 5
+    assert download(config, server, resume='yes') is None
+    assert os.path.exists('crudosGFS_0P25_2022-05-27_00z.nc.part')
+    assert not os.path.exists('crudosGFS_0P25_2022-05-27_00z.nc')
+
+    # Al volver a ejecutarla solo se piden los bloques que faltan (18 tareas: 9 horas por 2 variables), una vez cada uno
+    calls.clear()
+    failAt = None
+    result = download(config, server, resume='yes')
+    assert result == 'crudosGFS_0P25_2022-05-27_00z.nc'
+    assert len(calls) == 18 - 4 and len(set(calls)) == len(calls)
+    assert not os.path.exists(result + '.part')
+    assert np.all(np.diff(readOutput(result)['time'][2]) > 0)
+    assertSameOutput(result, 'referencia.nc')
+
+
+@pytest.mark.parametrize('stream', ['no', 'yes'])
+def test_regions(config, server, stream):
+    # Sin regiones se descarga la malla que cubre las dos regiones
+    union = readOutput(download(config, server, stream=stream))
+    regions = ['regions.norte=266, 274, 12, 14', 'regions.oeste=266, 270, 11, 14']
+    result = download(config, server, regions, stream=stream)
+    assert result == {'norte' : 'crudosGFS_0P25_2022-05-27_00z_norte.nc', 'oeste' : 'crudosGFS_0P25_2022-05-27_00z_oeste.nc'}
+
+    # Cada region es un recorte de la malla completa
+    for name, fileName in result.items():
+        data = readOutput(fileName)
+        assert sorted(data.keys()) == sorted(union.keys())
+        lat, lon = np.ma.getdata(data['lat'][2]), np.ma.getdata(data['lon'][2])
+        assert lat.size < union['lat'][2].size or lon.size < union['lon'][2].size
+        j = np.searchsorted(np.ma.getdata(union['lat'][2]), lat)
+        i = np.searchsorted(np.ma.getdata(union['lon'][2]), lon)
+        assert np.array_equal(union['lat'][2][j], lat) and np.array_equal(union['lon'][2][i], lon)
+        assert np.array_equal(np.diff(j), np.ones(j.size - 1)) and np.array_equal(np.diff(i), np.ones(i.size - 1))
+        assert np.array_equal(data['time'][2], union['time'][2])
+        for v in ('ugrd10m', 'tmp2m'):
+            assert data[v][:2] == union[v][:2]
+            assert np.array_equal(data[v][2], union[v][2][:, j[0]:j[-1]+1, i[0]:i[-1]+1]), name + ' ' + v
+
+
+@pytest.mark.parametrize('stream', ['no', 'yes'])
+def test_levels(config, server, stream):
+    overrides = ['variables.vars=ugrd10m, tmp2m, tmpprs', 'variables.units=m/s, K, K',
+                 'variables.longnames=u wind, temp, temp prs', 'levels.tmpprs=1000, 850, 500']
+    result = download(config, server, overrides, stream=stream)
+    data = readOutput(result)
+    assert data['tmpprs'][:2] == (('time', 'lev_tmpprs', 'lat', 'lon'), np.dtype('f4'))
+    assert data['lev_tmpprs'][0] == ('lev_tmpprs',)
+    assert data['lev_tmpprs'][2].tolist() == [1000, 850, 500]
+    assert data['tmp2m'][0] == ('time', 'lat', 'lon')
+
+    # Los datos son los del dataset en esos niveles
+    dst = nc.Dataset(gB.syntheticDatasets(server.root, VARS, None).getFileName('gfs_0p25', DATE, 0))
+    try:
+        j = np.searchsorted(dst.variables['lat'][:], np.ma.getdata(data['lat'][2]))
+        i = np.searchsorted(dst.variables['lon'][:], np.ma.getdata(data['lon'][2]))
+        k = [ gB.LEVELS.index(lev) for lev in (1000, 850, 500) ]
+        expected = dst.variables['tmpprs'][:9, k, j[0]:j[-1]+1, i[0]:i[-1]+1]
+    finally:
+        dst.close()
+    assert not np.ma.is_masked(data['tmpprs'][2])
+    assert np.array_equal(data['tmpprs'][2], expected)
+
+
+@pytest.mark.skipif(gD.zarr is None, reason='requiere la libreria zarr')
+@pytest.mark.parametrize('stream', ['no', 'yes'])
+def test_zarr(config, server, stream):
+    reference = download(config, server, stream=stream)
+    result = download(config, server, stream=stream, output='zarr')
+    assert result == 'crudosGFS_0P25_2022-05-27_00z.zarr' and os.path.isdir(result)
+    assertSameOutput(result, reference)
@@ -0,0 +1,30 @@
+import datetime as dt
+import os
+import time
+
+import gfsDownload as gD
+
+
+def test_isFNLMissing_ttl(config):
+    config(fnlstore='store', fnlmissingttl=2)
+    myData = gD.gfsData()
+    storeFile = os.path.join('store', 'fnl_20220525_12z.nc')
+    assert not myData.isFNLMissing(storeFile)
+    assert not myData.isFNLMissing(None)
+    os.makedirs('store')
+    open(gD.gfsData.getFNLMissingFile(storeFile), 'w').close()
+    assert myData.isFNLMissing(storeFile)
+    old = time.time() - 3 * 3600
+    os.utime(gD.gfsData.getFNLMissingFile(storeFile), (old, old))
+    assert not myData.isFNLMissing(storeFile)
+
+
+def test_pruneFNLStore_removes_missing_records(config, tmp_path):
+    config(fnlstore='store')
+    myData = gD.gfsData()
+    storeDir = os.path.dirname(myData.getFNLStoreFile(dt.datetime(2022, 5, 20), 0))
+    os.makedirs(storeDir)
+    for f in ('fnl_20220519_00z.nc', 'fnl_20220519_06z.nc.missing', 'fnl_20220521_00z.nc', 'fnl_20220521_06z.nc.missing'):
+        open(os.path.join(storeDir, f), 'w').close()
+    myData.pruneFNLStore(dt.datetime(2022, 5, 20))
+    assert sorted(os.listdir(storeDir)) == ['fnl_20220521_00z.nc', 'fnl_20220521_06z.nc.missing']
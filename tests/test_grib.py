@@ -0,0 +1,100 @@
+import os
+import datetime as dt
+
+import numpy as np
+import netCDF4 as nc
+import pytest
+
+import gfsDownload as gD
+import gfsBenchmark as gB
+
+pytestmark = pytest.mark.skipif(gD.eccodes is None, reason='requiere la libreria eccodes')
+
+DATE = dt.datetime(2022, 5, 27)
+PATTERN = 'gfs.{date}/{run}/atmos/gfs.t{run}z.pgrb2.0p25.f{fhour}'
+
+
+@pytest.fixture(scope='module')
+def server(tmp_path_factory):
+    """
+     Servidor local (gfsBenchmark.dapServer) con el dataset sintetico gfs_0p25 (OPeNDAP) y el archivo GRIB2 de la hora
+     de pronostico 6 (paso de tiempo 2) con su inventario .idx, en una banda de latitudes con todas las longitudes.
+    """
+    dataDir = str(tmp_path_factory.mktemp('data'))
+    datasets = gB.syntheticDatasets(dataDir, ['ugrd10m', 'tmp2m'], (0.0, 359.75, 5.0, 8.0))
+    datasets.create('gfs_0p25', DATE, 0)
+    recordKeys = {'ugrd10m' : 'UGRD:10 m above ground', 'tmp2m' : 'TMP:2 m above ground'}
+    gribFile = os.path.join(dataDir, 'grib', PATTERN.format(date='20220527', run='00', fhour='006'))
+    datasets.createGrib('gfs_0p25', gribFile, DATE, 0, 6, 2, recordKeys)
+    myServer = gB.dapServer(dataDir)
+    url = myServer.start()
+    yield myServer, url
+    myServer.stop()
+
+
+def setupGrib(config, url, gap, **keys):
+    config(url=url, **keys)
+    return gD.gfsConfig.setup('gfsconfig.cfg', ['grib.url=' + url + '/grib', 'grib.gfs_0p25=' + PATTERN, 'grib.gap=' + str(gap)])
+
+
+def getReference(url, var, irange, jrange):
+    """
+     Los datos de la variable var en el paso de tiempo 2 del dataset sintetico, leidos por OPeNDAP.
+    """
+    dst = nc.Dataset(url + '/dods/gfs_0p25/gfs20220527/gfs_0p25_00z')
+    try:
+        segments = irange if np.ndim(irange) == 2 else [irange]
+        return np.concatenate([ dst.variables[var][2, jrange[0]:jrange[1], i[0]:i[1]] for i in segments ], axis=1)
+    finally:
+        dst.close()
+
+
+@pytest.mark.parametrize('gap', [0, 1000000])
+def test_fetchGribBlock(config, server, gap):
+    myServer, url = server
+    setupGrib(config, url, gap)
+    myData = gD.gfsData()
+    engine = myData.getGribEngine()
+    fileURL = engine.getFileURL(DATE, 0, 6, 'gfs_0p25')
+
+    # El inventario intercala otros registros entre las variables, con gap = 0 son dos solicitudes
+    records = myData.getGribIndex(fileURL)
+    assert [ key for offset, key in records ] == ['UGRD:10 m above ground', 'PRMSL:mean sea level',
+                                                  'TMP:2 m above ground', 'HGT:500 mb']
+    ranges = engine.getRanges(records, ['ugrd10m', 'tmp2m'])
+    assert len(ranges) == (2 if gap == 0 else 1)
+    assert [ v for r in ranges for v, s, e in r[2] ] == ['ugrd10m', 'tmp2m']
+
+    # Submalla normal y submalla que cruza el meridiano 0 (lon 355 a 5)
+    jrange = [380, 393]
+    for irange in ([1040, 1161], [[1420, 1440], [0, 21]]):
+        before = myServer.getCounters()['data_requests']
+        data = gD.gfsData.fetchGribBlock((fileURL, ['ugrd10m', 'tmp2m'], [0, 1], 0), irange, jrange, myData)
+        assert myServer.getCounters()['data_requests'] - before == len(ranges)
+        for var in ('ugrd10m', 'tmp2m'):
+            reference = getReference(url, var, irange, jrange)
+            assert data[var].shape == (1,) + reference.shape
+            np.testing.assert_allclose(data[var][0], reference, atol=1e-3)
+
+
+def test_getGribGrid(config, server):
+    myServer, url = server
+    setupGrib(config, url, 0, lonmin=-5, lonmax=5, latmin=5, latmax=8)
+    myData = gD.gfsData()
+    fileURL = myData.getGribEngine().getFileURL(DATE, 0, 6, 'gfs_0p25')
+    grid = gD.gfsSubgrid()
+    assert myData.getGribGrid(grid, fileURL, 'gfs_0p25', ['ugrd10m', 'tmp2m'])
+
+    # La submalla cruza el meridiano 0 y es la misma que la del dataset por OPeNDAP
+    reference = gD.gfsSubgrid()
+    assert reference.getGFSgrid_default(url + '/dods/gfs_0p25/gfs20220527/gfs_0p25_00z', 'gfs_0p25', useCache=False)
+    assert np.ndim(grid.irange) == 2
+    assert np.array_equal(grid.irange, reference.irange) and np.array_equal(grid.jrange, reference.jrange)
+    np.testing.assert_allclose(grid.latitudes, reference.latitudes)
+    np.testing.assert_allclose(grid.longitudes, reference.longitudes)
+
+    data = gD.gfsData.fetchGribBlock((fileURL, ['ugrd10m', 'tmp2m'], [0, 1], 0), grid.irange, grid.jrange, myData)
+    for var in ('ugrd10m', 'tmp2m'):
+        reference = getReference(url, var, grid.irange, grid.jrange)
+        assert data[var].shape == (1, grid.latitudes.size, grid.longitudes.size)
+        np.testing.assert_allclose(data[var][0], reference, atol=1e-3)
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+import gfsDownload as gD
+
+
+def test_cache_rejected_for_other_source(config):
+    config(cachedir='cache')
+    grid = gD.gfsSubgrid()
+    grid.longitudes = np.arange(260.0, 264.0)
+    grid.latitudes = np.arange(5.0, 8.0)
+    grid.irange = np.array([1040, 1044])
+    grid.jrange = np.array([380, 383])
+    grid.gridShape = (721, 1440)
+    cacheFile = grid.getCacheFile('grib_gfs_0p25', 260, 290, 5, 35)
+    grid.writeCache(cacheFile, 'http://server/gfs.t{run}z.pgrb2.0p25.f{fhour}')
+
+    cached = gD.gfsSubgrid()
+    assert cached.readCache(cacheFile, 'http://server/gfs.t{run}z.pgrb2.0p25.f{fhour}')
+    assert cached.gridShape == (721, 1440)
+    assert list(cached.irange) == [1040, 1044]
+    assert not gD.gfsSubgrid().readCache(cacheFile, 'http://server/gfs.t{run}z.pgrb2.0p50.f{fhour}')
+
+
+def test_cropRecord_rejects_smaller_grid():
+    values = np.zeros((361, 720))
+    assert gD.gribEngine.cropRecord(values, [10, 20], [5, 8]).shape == (3, 10)
+    assert gD.gribEngine.cropRecord(values, [[710, 720], [0, 5]], [5, 8]).shape == (3, 15)
+    with pytest.raises(gD.gfsFatalError):
+        gD.gribEngine.cropRecord(values, [1040, 1044], [380, 383])
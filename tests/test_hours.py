@@ -0,0 +1,40 @@
+import datetime as dt
+
+import numpy as np
+
+import gfsDownload as gD
+
+
+def test_parseHours_ranges():
+    assert gD.gfsConfig.parseHours('0-12:6,24') == [0, 6, 12, 24]
+    assert gD.gfsConfig.parseHours(' 3-5 , 4 ') == [3, 4, 5]
+    assert gD.gfsConfig.parseHours('') == []
+
+
+def test_getHourIndexes_from_first_record(config):
+    config()
+    timeVar = np.arange(0, 49, 3) * 3600.0
+    assert list(gD.gfsData().getHourIndexes(timeVar, '0-12:6,24')) == [0, 2, 4, 8]
+    assert gD.gfsData().getHourIndexes(timeVar, '').size == timeVar.size
+
+
+def test_getHourIndexes_axis_not_starting_at_cycle(config):
+    # Eje del motor GRIB2 con fhours = 6-24:6, el primer registro es la hora 6 del ciclo
+    config()
+    cycle = dt.datetime(2022, 5, 27)
+    timeVar = np.array([ gD.gribEngine.getTimeValue(cycle + dt.timedelta(hours=h)) for h in (6, 12, 18, 24) ])
+    tindex = gD.gfsData().getHourIndexes(timeVar, '6-24:6', gD.gribEngine.getTimeValue(cycle))
+    assert list(tindex) == [0, 1, 2, 3]
+
+
+def test_getTimeRequests_strided(config):
+    config(tblock=0)
+    requests = gD.gfsData().getTimeRequests([0, 1, 2, 3, 6, 9, 12])
+    assert requests == [([0, 4, 1], 0), ([6, 13, 3], 4)]
+
+
+def test_getTimeRequests_irregular(config):
+    config(tblock=0)
+    myData = gD.gfsData()
+    assert myData.getTimeRequests([0, 2, 3, 4, 6]) == [([0, 3, 2], 0), ([3, 5, 1], 2), ([6, 7, 1], 4)]
+    assert myData.getTimeRequests([0, 1, 3, 5, 7, 8]) == [([0, 2, 1], 0), ([3, 8, 2], 2), ([8, 9, 1], 5)]
@@ -0,0 +1,22 @@
+import numpy as np
+
+import gfsDownload as gD
+
+
+def test_records_are_per_run():
+    first = gD.runMetrics('fnl')
+    gD.runMetrics.record('getData', 'fnl', 'tmp2m', 0.5, np.zeros(4, 'f4'))
+    assert first.summary()['requests'] == 1
+    first.close()
+    gD.runMetrics.record('saveData', 'salida.nc', 'tmp2m', 0.1, np.zeros(4, 'f4'))
+    assert len(first.records) == 1
+
+    second = gD.runMetrics('fnl')
+    gD.runMetrics.extend([{'op' : 'getData', 'dataset' : 'fnl', 'var' : 'ugrd10m', 'seconds' : 0.2,
+                           'bytes' : 8, 'shape' : [2], 'retries' : 1, 'ok' : True}])
+    summary = second.summary()
+    second.close()
+    assert summary['requests'] == 1
+    assert summary['bytes'] == 8
+    assert summary['operations']['getData']['retries'] == 1
+    assert gD.runMetrics.active is None
@@ -0,0 +1,21 @@
+import os
+
+import numpy as np
+
+import gfsDownload as gD
+
+
+def test_output_dir_created_on_write(config):
+    config(outdir='salida')
+    myData = gD.gfsData()
+    assert myData.getOutputDir() == 'salida'
+    assert not os.path.exists('salida')
+
+    grid = gD.gfsSubgrid()
+    grid.latitudes = np.arange(5.0, 8.0)
+    grid.longitudes = np.arange(260.0, 264.0)
+    outputFile = os.path.join(myData.getOutputDir(), 'crudos.nc')
+    myfile = myData.createOutputFile(myData.getStagingFile(outputFile), grid, ['tmp2m'], ['K'], ['temp'])
+    assert myfile is not None
+    myfile.closeFile()
+    assert os.path.exists(myData.getStagingFile(outputFile))
@@ -0,0 +1,71 @@
+import warnings
+
+import numpy as np
+
+import gfsDownload as gD
+
+
+def packRoundtrip(tmp_path, data):
+    scale, offset = gD.netcdfFile.getPackParams(data, fillValue=gD.gfsData.fillValue)
+    myfile = gD.netcdfFile()
+    myfile.createFile(str(tmp_path / 'pack.nc'))
+    myfile.createDims({'time' : None, 'lat' : data.shape[1], 'lon' : data.shape[2]})
+    myfile.createVars({'v' : {'dimensions' : ['time', 'lat', 'lon'], 'dataType' : 'i2',
+                              'attributes' : {'scale_factor' : scale, 'add_offset' : offset, '_FillValue' : np.int16(-32767)}}})
+    with warnings.catch_warnings():
+        # Los puntos enmascarados y los NaN no se convierten a int16, se guardan como _FillValue
+        warnings.simplefilter('error')
+        assert myfile.saveData({'v' : np.ma.masked_values(data, gD.gfsData.fillValue)}) == 0
+    myfile.openFile(str(tmp_path / 'pack.nc'), 'r')
+    unpacked = myfile.fileHandler.variables['v'][:]
+    assert np.array_equal(np.ma.getmaskarray(unpacked), (data == gD.gfsData.fillValue) | np.isnan(data))
+    packed = myfile.fileHandler.variables['v']
+    packed.set_auto_maskandscale(False)
+    raw = packed[:]
+    myfile.closeFile()
+    return scale, offset, raw
+
+
+def test_getPackParams_range():
+    data = np.linspace(-10, 30, 100, dtype='f4')
+    scale, offset = gD.netcdfFile.getPackParams(data)
+    packed = np.round((data - offset) / scale)
+    assert packed.min() >= -32765 and packed.max() <= 32765
+
+
+def test_getPackParams_ignores_fill(tmp_path):
+    data = np.random.default_rng(0).uniform(250, 310, (2, 4, 5)).astype('f4')
+    data[0, 1, 2] = gD.gfsData.fillValue
+    data[1, 3, 4] = np.nan
+    scale, offset, raw = packRoundtrip(tmp_path, data)
+    assert scale < 0.01 and 250 < offset < 310
+    assert raw[0, 1, 2] == -32767 and raw[1, 3, 4] == -32767
+    valid = np.ones(data.shape, dtype=bool)
+    valid[0, 1, 2] = False
+    valid[1, 3, 4] = False
+    assert np.all(raw[valid] > -32767)
+    assert np.allclose(raw[valid] * scale + offset, data[valid], atol=scale)
+
+
+def test_getPackParams_all_missing():
+    data = np.full((3, 3), gD.gfsData.fillValue, dtype='f4')
+    assert gD.netcdfFile.getPackParams(data, fillValue=gD.gfsData.fillValue) == (1.0, 0.0)
+
+
+def test_zarr_pack_masked(tmp_path):
+    data = np.random.default_rng(1).uniform(250, 310, (2, 4, 5)).astype('f4')
+    data[0, 0, 0] = gD.gfsData.fillValue
+    data[1, 2, 3] = np.nan
+    scale, offset = gD.netcdfFile.getPackParams(data, fillValue=gD.gfsData.fillValue)
+    myfile = gD.zarrFile()
+    myfile.createFile(str(tmp_path / 'pack.zarr'))
+    myfile.createDims({'time' : None, 'lat' : data.shape[1], 'lon' : data.shape[2]})
+    myfile.createVars({'v' : {'dimensions' : ['time', 'lat', 'lon'], 'dataType' : 'i2',
+                              'attributes' : {'scale_factor' : scale, 'add_offset' : offset, '_FillValue' : np.int16(-32767)}}})
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        assert myfile.saveData({'v' : np.ma.masked_values(data, gD.gfsData.fillValue)}) == 0
+    raw = myfile.arrays['v']['array'][:]
+    myfile.closeFile()
+    assert raw[0, 0, 0] == -32767 and raw[1, 2, 3] == -32767
+    assert np.sum(raw == -32767) == 2
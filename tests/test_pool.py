@@ -0,0 +1,30 @@
+import netCDF4 as nc
+import numpy as np
+
+import gfsDownload as gD
+
+
+def test_shared_pool(config, tmp_path):
+    config(workers=2)
+    fname = str(tmp_path / 'data.nc')
+    dst = nc.Dataset(fname, 'w')
+    dst.createDimension('time', 6)
+    dst.createDimension('lat', 4)
+    dst.createDimension('lon', 5)
+    dst.createVariable('tmp2m', 'f4', ('time', 'lat', 'lon'))[:] = np.arange(120, dtype='f4').reshape(6, 4, 5)
+    dst.close()
+
+    pool = gD.gfsData.newProcessPool(2)
+    try:
+        # Dos descargas seguidas con el mismo pool, el pool sigue abierto despues de cada una
+        for t0 in (0, 3):
+            myData = gD.gfsData()
+            myData.pool = pool
+            blocks = {}
+            tasks = [ (fname, 'tmp2m', [t, t + 1], t - t0) for t in range(t0, t0 + 3) ]
+            myData.downloadBlocks(tasks, [0, 5], [0, 4], lambda task, data: blocks.update({task[3] : data}))
+            data = np.concatenate([ blocks[k] for k in sorted(blocks.keys()) ])
+            assert np.array_equal(data, np.arange(120, dtype='f4').reshape(6, 4, 5)[t0:t0 + 3])
+        assert pool.submit(abs, -1).result() == 1
+    finally:
+        pool.shutdown()
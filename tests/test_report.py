@@ -0,0 +1,18 @@
+import datetime as dt
+import glob
+import json
+
+import gfsDownload as gD
+
+
+def test_failed_run_is_reported(config, tmp_path):
+    config(url=str(tmp_path / 'nodata'), reportdir='reports', rundeadline=600, retries=1)
+    myData = gD.gfsData()
+    assert myData.downloadFNL(dt.datetime(2022, 5, 26), 1) == 0
+    reports = glob.glob('reports/fnl_*.json')
+    assert len(reports) == 1
+    with open(reports[0]) as f:
+        assert json.load(f)['success'] is False
+    assert glob.glob('reports/gfsdownload_fnl.prom')
+    assert gD.runMetrics.active is None
+    assert myData.getRetryPolicy().runDeadline is None
@@ -0,0 +1,33 @@
+import time
+
+import gfsDownload as gD
+
+
+def test_run_deadline_is_per_instance(config):
+    config(rundeadline=1, retries=3, retrybase=0)
+    first = gD.gfsData()
+    second = gD.gfsData()
+    first.getRetryPolicy().startRun()
+    first.getRetryPolicy().runDeadline = time.time() - 1
+    assert first.getRetryPolicy().deadlineExpired()
+    assert not second.getRetryPolicy().deadlineExpired()
+    assert second.getRetryPolicy().call(lambda: 'ok', 'test') == 'ok'
+    first.getRetryPolicy().endRun()
+    assert not first.getRetryPolicy().deadlineExpired()
+
+
+def test_retry_wait_is_per_instance(config):
+    config(retries=2, retrybase=0)
+    first = gD.gfsData()
+    second = gD.gfsData()
+    attempts = []
+
+    def fn():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise IOError('fallo')
+        return 'ok'
+
+    assert first.getRetryPolicy().call(fn, 'test') == 'ok'
+    assert first.getRetryPolicy().lastRetries == 1
+    assert second.getRetryPolicy().waitSeconds == 0.0
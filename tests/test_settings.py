@@ -0,0 +1,37 @@
+import multiprocessing
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import gfsDownload as gD
+
+
+def test_settings_pickle(config):
+    settings = config(workers=3)
+    copy = pickle.loads(pickle.dumps(settings))
+    assert copy.get('gfs_data', 'workers') == '3'
+    assert copy.vars == settings.vars and copy.bbox == settings.bbox
+    assert copy.configfile == settings.configfile
+
+
+def test_worker_settings_without_fork(config):
+    config()
+    settings = gD.gfsConfig.setup('gfsconfig.cfg', ['gfs_data.workers=5', 'latmax=30'])
+    # Con spawn el worker no hereda la configuracion del proceso principal, la recibe en initProcessWorker
+    pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=gD.gfsData.initProcessWorker, initargs=(settings,))
+    try:
+        workerSettings = pool.submit(gD.gfsConfig.getSettings).result(timeout=60)
+    finally:
+        pool.shutdown()
+    assert workerSettings.get('gfs_data', 'workers') == '5'
+    assert workerSettings.bbox == (260.0, 290.0, 5.0, 30.0)
+
+
+def test_subgrids_per_instance(config):
+    config()
+    first = gD.gfsData()
+    second = gD.gfsData()
+    assert first.gridFNL is not second.gridFNL
+    assert first.gridGFS_HD is not second.gridGFS_HD
+    first.gridFNL.irange = [0, 10]
+    assert second.gridFNL.irange is None
@@ -0,0 +1,22 @@
+import datetime as dt
+
+import numpy as np
+import pytest
+
+import gfsDownload as gD
+
+
+def test_getTimeSeconds_grads():
+    # GrADS cuenta los dias desde 1-1-1 con dos dias de desfase respecto al ordinal de python
+    date = dt.datetime(2022, 5, 27, 6)
+    grads = date.toordinal() + 2 + 0.25
+    seconds = gD.gfsData.getTimeSeconds(np.array([grads, grads + 0.125]))
+    assert seconds.dtype == np.dtype('f8')
+    assert list(seconds) == [gD.gribEngine.getTimeValue(date), gD.gribEngine.getTimeValue(date + dt.timedelta(hours=3))]
+    assert gD.gfsData.getTimeSeconds([719165.0], 'days since 1-1-1 00:00:0.0')[0] == 0.0
+
+
+def test_getTimeSeconds_units():
+    assert list(gD.gfsData.getTimeSeconds([3600.0], gD.gfsData.timeUnits)) == [3600.0]
+    with pytest.raises(ValueError):
+        gD.gfsData.getTimeSeconds([1.0], 'hours since 2022-05-27')